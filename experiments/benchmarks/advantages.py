@@ -0,0 +1,60 @@
+"""
+Benchmarks the computation of the returns and GAE advantages of a meta-batch of paths, once path by path and once on
+zero-padded (num_paths, max_path_length) arrays (vectorized_advantages=True).
+
+Usage:
+    python -m experiments.benchmarks.advantages --meta_batch_size 40 --rollouts_per_meta_task 20 --n_repeats 5
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+
+from maml_zoo.samplers.base import SampleProcessor
+from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline
+
+parser = ArgumentParser()
+parser.add_argument('--meta_batch_size', type=int, default=40)
+parser.add_argument('--rollouts_per_meta_task', type=int, default=20)
+parser.add_argument('--max_path_length', type=int, default=100)
+parser.add_argument('--min_path_length', type=int, default=20)
+parser.add_argument('--n_repeats', type=int, default=5)
+
+
+def make_paths(args):
+    """
+    Returns:
+        (tuple) : list of paths with random rewards and lengths and the list of their baselines
+    """
+    path_lengths = np.random.randint(args.min_path_length, args.max_path_length + 1,
+                                     size=args.meta_batch_size * args.rollouts_per_meta_task)
+    paths = [dict(rewards=np.random.normal(size=(path_length,))) for path_length in path_lengths]
+    all_path_baselines = [np.random.normal(size=(path_length,)) for path_length in path_lengths]
+    return paths, all_path_baselines
+
+
+def time_advantages(sample_processor, paths, all_path_baselines, n_repeats):
+    """
+    Returns:
+        (float) : mean time in seconds to compute the returns and advantages of the paths
+    """
+    times = []
+    for _ in range(n_repeats):
+        start = time.time()
+        sample_processor._compute_returns(paths)
+        sample_processor._compute_advantages(paths, all_path_baselines)
+        times.append(time.time() - start)
+    return np.mean(times)
+
+
+def main(args):
+    paths, all_path_baselines = make_paths(args)
+    print('%-12s %-12s %-20s' % ('num_paths', 'vectorized', 'returns + GAE [ms]'))
+    for vectorized_advantages in [False, True]:
+        sample_processor = SampleProcessor(baseline=LinearFeatureBaseline(), gae_lambda=0.97,
+                                           vectorized_advantages=vectorized_advantages)
+        step_time = time_advantages(sample_processor, paths, all_path_baselines, args.n_repeats)
+        print('%-12i %-12s %-20.2f' % (len(paths), vectorized_advantages, 1000 * step_time))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,59 @@
+"""
+Benchmarks the construction of the meta-learning graph for a growing meta_batch_size, once with a separate graph per
+task and once with the task-vectorized graph (vectorized_tasks=True).
+
+Usage:
+    python -m experiments.benchmarks.graph_build --algo vpg --meta_batch_sizes 10 20 40 --n_adapt_steps 3
+"""
+import time
+from argparse import ArgumentParser
+import tensorflow as tf
+
+from maml_zoo.meta_algos import VPGMAML, VPGSGMRL, TRPOMAML, PPOMAML
+from maml_zoo.policies.meta_gaussian_mlp_policy import MetaGaussianMLPPolicy
+
+ALGO_DICT = {'vpg': VPGMAML, 'sgmrl': VPGSGMRL, 'trpo': TRPOMAML, 'ppo': PPOMAML}
+
+parser = ArgumentParser()
+parser.add_argument('--algo', type=str, default='vpg', choices=list(ALGO_DICT.keys()))
+parser.add_argument('--meta_batch_sizes', type=int, nargs='+', default=[5, 10, 20, 40])
+parser.add_argument('--n_adapt_steps', type=int, default=1)
+parser.add_argument('--obs_dim', type=int, default=20)
+parser.add_argument('--action_dim', type=int, default=6)
+parser.add_argument('--hidden_sizes', type=int, nargs='+', default=[64, 64])
+
+
+def build_graph(algo_cls, meta_batch_size, vectorized_tasks, args):
+    """
+    Returns:
+        (tuple) : build time in seconds and number of ops of the graph
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        start = time.time()
+        policy = MetaGaussianMLPPolicy(name='meta-policy',
+                                       obs_dim=args.obs_dim,
+                                       action_dim=args.action_dim,
+                                       meta_batch_size=meta_batch_size,
+                                       hidden_sizes=tuple(args.hidden_sizes),
+                                       batched_task_graph=vectorized_tasks)
+        algo_cls(policy=policy,
+                 meta_batch_size=meta_batch_size,
+                 num_inner_grad_steps=args.n_adapt_steps,
+                 vectorized_tasks=vectorized_tasks)
+        build_time = time.time() - start
+    return build_time, len(graph.get_operations())
+
+
+def main(args):
+    algo_cls = ALGO_DICT[args.algo]
+    print('%-16s %-12s %-14s %-10s' % ('meta_batch_size', 'vectorized', 'build time [s]', 'ops'))
+    for meta_batch_size in args.meta_batch_sizes:
+        for vectorized_tasks in [False, True]:
+            build_time, n_ops = build_graph(algo_cls, meta_batch_size, vectorized_tasks, args)
+            print('%-16i %-12s %-14.2f %-10i' % (meta_batch_size, vectorized_tasks, build_time, n_ops))
+
+
+if __name__ == "__main__":
+    tf.compat.v1.disable_eager_execution()
+    main(parser.parse_args())
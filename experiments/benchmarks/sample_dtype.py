@@ -0,0 +1,87 @@
+"""
+Benchmarks the sample pipeline in float64 (the default) and float32 (sampler and sample processor with
+dtype=np.float32): the time to collect the paths from the rollout buffer and process them, the memory taken by the
+samples data of a meta-batch and the time to feed it to float32 placeholders.
+
+Usage:
+    python -m experiments.benchmarks.sample_dtype --meta_batch_size 40 --rollouts_per_meta_task 20 --obs_dim 20
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import tensorflow as tf
+
+from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline
+from maml_zoo.samplers import MAMLSampleProcessor
+from maml_zoo.samplers.rollout_buffer import RolloutBuffer
+
+parser = ArgumentParser()
+parser.add_argument('--meta_batch_size', type=int, default=40)
+parser.add_argument('--rollouts_per_meta_task', type=int, default=20)
+parser.add_argument('--max_path_length', type=int, default=100)
+parser.add_argument('--obs_dim', type=int, default=20)
+parser.add_argument('--action_dim', type=int, default=6)
+parser.add_argument('--n_repeats', type=int, default=5)
+
+
+def collect_paths(dtype, args):
+    """
+    Fills a rollout buffer with float64 env data (as returned by the envs) and pops the finished paths
+
+    Returns:
+        (dict) : dict of the paths of each task
+    """
+    num_envs = args.meta_batch_size * args.rollouts_per_meta_task
+    buffer = RolloutBuffer(num_envs, args.max_path_length, dtype=dtype)
+    for t in range(args.max_path_length):
+        buffer.add(observations=np.asarray(np.random.normal(size=(num_envs, args.obs_dim)), dtype=dtype),
+                   actions=np.random.normal(size=(num_envs, args.action_dim)).astype(np.float32),
+                   rewards=np.random.normal(size=(num_envs,)),
+                   dones=np.full(num_envs, t == args.max_path_length - 1),
+                   env_infos=dict(),
+                   agent_infos=dict(mean=np.zeros((num_envs, args.action_dim), dtype=np.float32),
+                                    log_std=np.zeros((num_envs, args.action_dim), dtype=np.float32)))
+    env_ids = np.arange(num_envs).reshape(args.meta_batch_size, args.rollouts_per_meta_task)
+    return dict([(task, [buffer.pop_path(env_id) for env_id in env_ids[task]])
+                 for task in range(args.meta_batch_size)])
+
+
+def samples_data_nbytes(value):
+    if isinstance(value, dict):
+        return sum([samples_data_nbytes(v) for v in value.values()])
+    return value.nbytes if isinstance(value, np.ndarray) else 0
+
+
+def main(args):
+    keys = ['observations', 'actions', 'advantages']
+    graph = tf.Graph()
+    with graph.as_default():
+        phs = [[tf.compat.v1.placeholder(dtype=tf.float32, shape=[None] * (2 if key != 'advantages' else 1))
+                for key in keys] for _ in range(args.meta_batch_size)]
+        total = tf.add_n([tf.reduce_sum(ph) for task_phs in phs for ph in task_phs])
+
+    print('%-10s %-22s %-20s %-16s' % ('dtype', 'collect + process [s]', 'samples data [MB]', 'feed [ms]'))
+    with tf.compat.v1.Session(graph=graph) as sess:
+        for dtype in [None, np.float32]:
+            sample_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline(), vectorized_advantages=True,
+                                                   dtype=dtype)
+            start = time.time()
+            samples_data_meta_batch = sample_processor.process_samples(collect_paths(dtype, args))
+            process_time = time.time() - start
+
+            feed_dict = dict([(ph, samples_data[key]) for task_phs, samples_data in zip(phs, samples_data_meta_batch)
+                              for ph, key in zip(task_phs, keys)])
+            sess.run(total, feed_dict=feed_dict)
+            start = time.time()
+            for _ in range(args.n_repeats):
+                sess.run(total, feed_dict=feed_dict)
+            feed_time = (time.time() - start) / args.n_repeats
+
+            nbytes = sum([samples_data_nbytes(samples_data) for samples_data in samples_data_meta_batch])
+            print('%-10s %-22.3f %-20.1f %-16.2f' % (np.dtype(dtype or np.float64).name, process_time, nbytes / 2 ** 20,
+                                                     1000 * feed_time))
+
+
+if __name__ == "__main__":
+    tf.compat.v1.disable_eager_execution()
+    main(parser.parse_args())
@@ -0,0 +1,91 @@
+"""
+Benchmarks the TRPO outer step (TRPOMAML.optimize_policy) for different factors of subsampling of the inputs of the
+Hessian vector products, on samples collected from a point environment.
+
+Usage:
+    python -m experiments.benchmarks.trpo_subsample --subsample_factors 1. 0.5 0.2 0.1 --n_repeats 3
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import tensorflow as tf
+
+from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline
+from maml_zoo.envs.point_envs.point_env_2d_corner import MetaPointEnvCorner
+from maml_zoo.logger import logger
+from maml_zoo.meta_algos import TRPOMAML
+from maml_zoo.policies.meta_gaussian_mlp_policy import MetaGaussianMLPPolicy
+from maml_zoo.samplers import MAMLSampler, MAMLSampleProcessor
+
+parser = ArgumentParser()
+parser.add_argument('--subsample_factors', type=float, nargs='+', default=[1., 0.5, 0.2, 0.1])
+parser.add_argument('--n_repeats', type=int, default=3)
+parser.add_argument('--meta_batch_size', type=int, default=20)
+parser.add_argument('--rollouts_per_meta_task', type=int, default=20)
+parser.add_argument('--max_path_length', type=int, default=100)
+parser.add_argument('--n_adapt_steps', type=int, default=1)
+parser.add_argument('--hidden_sizes', type=int, nargs='+', default=[64, 64])
+parser.add_argument('--symbolic_hvp', action='store_true')
+parser.add_argument('--in_graph_cg', action='store_true')
+parser.add_argument('--vectorized_tasks', action='store_true')
+
+
+def collect_samples(env, policy, algo, args):
+    """
+    Returns:
+        (list) : processed samples data of all steps, as used by optimize_policy
+    """
+    sampler = MAMLSampler(env=env, policy=policy, rollouts_per_meta_task=args.rollouts_per_meta_task,
+                          meta_batch_size=args.meta_batch_size, max_path_length=args.max_path_length)
+    sample_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline(), discount=0.99, gae_lambda=1.,
+                                           normalize_adv=True, positive_adv=False)
+    sampler.update_tasks()
+    policy.switch_to_pre_update()
+    all_samples_data = []
+    for step in range(args.n_adapt_steps + 1):
+        samples_data = sample_processor.process_samples(sampler.obtain_samples())
+        all_samples_data.append(samples_data)
+        if step < args.n_adapt_steps:
+            algo._adapt(samples_data)
+    return all_samples_data
+
+
+def main(args):
+    env = MetaPointEnvCorner(reward_type='dense')
+    policy = MetaGaussianMLPPolicy(name='meta-policy',
+                                   obs_dim=int(np.prod(env.observation_space.shape)),
+                                   action_dim=int(np.prod(env.action_space.shape)),
+                                   meta_batch_size=args.meta_batch_size,
+                                   hidden_sizes=tuple(args.hidden_sizes),
+                                   batched_task_graph=args.vectorized_tasks)
+    algos = [TRPOMAML(policy=policy,
+                      name='trpo_maml_%i' % i,
+                      meta_batch_size=args.meta_batch_size,
+                      num_inner_grad_steps=args.n_adapt_steps,
+                      vectorized_tasks=args.vectorized_tasks,
+                      symbolic_hvp=args.symbolic_hvp,
+                      in_graph_cg=args.in_graph_cg,
+                      subsample_factor=subsample_factor)
+             for i, subsample_factor in enumerate(args.subsample_factors)]
+
+    with tf.compat.v1.Session() as sess:
+        sess.run(tf.compat.v1.global_variables_initializer())
+        all_samples_data = collect_samples(env, policy, algos[0], args)
+        param_vals = policy.get_param_values()
+
+        print('%-18s %-18s' % ('subsample_factor', 'outer step [s]'))
+        for subsample_factor, algo in zip(args.subsample_factors, algos):
+            step_times = []
+            for _ in range(args.n_repeats + 1):
+                policy.set_params(param_vals)
+                start = time.time()
+                algo.optimize_policy(all_samples_data, log=False)
+                step_times.append(time.time() - start)
+            # the first step includes the warm-up of the graph
+            print('%-18.2f %-18.3f' % (subsample_factor, np.mean(step_times[1:])))
+
+
+if __name__ == "__main__":
+    tf.compat.v1.disable_eager_execution()
+    logger.configure(format_strs=[])
+    main(parser.parse_args())
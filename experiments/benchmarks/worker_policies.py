@@ -0,0 +1,66 @@
+"""
+Benchmarks parallel sampling with the policy evaluated in the main process (observations and actions are exchanged
+with the workers at every step) and with worker-resident numpy copies of the policies (worker_policies=True, the
+workers sample complete rollouts and only the parameters and the finished paths are exchanged).
+
+Usage:
+    python -m experiments.benchmarks.worker_policies --meta_batch_size 20 --rollouts_per_meta_task 10 --n_workers 4
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import tensorflow as tf
+
+from maml_zoo.envs.point_envs.point_env_2d_v2 import MetaPointEnv
+from maml_zoo.policies.meta_gaussian_mlp_policy import MetaGaussianMLPPolicy
+from maml_zoo.samplers import MAMLSampler
+from maml_zoo.logger import logger
+
+parser = ArgumentParser()
+parser.add_argument('--meta_batch_size', type=int, default=20)
+parser.add_argument('--rollouts_per_meta_task', type=int, default=10)
+parser.add_argument('--max_path_length', type=int, default=100)
+parser.add_argument('--hidden_sizes', type=int, nargs='+', default=[64, 64])
+parser.add_argument('--n_workers', type=int, default=None)
+parser.add_argument('--n_repeats', type=int, default=3)
+
+
+def time_sampling(sampler, policy, n_repeats):
+    """
+    Returns:
+        (float) : mean time in seconds to sample a meta-batch with the pre-update and one with the post-update policies
+    """
+    params = policy.get_param_values()
+    times = []
+    for _ in range(n_repeats):
+        start = time.time()
+        policy.switch_to_pre_update()
+        sampler.obtain_samples()
+        policy.update_task_parameters([params] * sampler.meta_batch_size)
+        sampler.obtain_samples()
+        times.append(time.time() - start)
+    return np.mean(times)
+
+
+def main(args):
+    logger.configure(format_strs=[])
+    env = MetaPointEnv()
+    print('%-16s %-14s %-14s' % ('worker_policies', 'shared_memory', 'sampling [s]'))
+    for worker_policies in [False, True]:
+        for shared_memory in [False, True]:
+            with tf.Graph().as_default():
+                policy = MetaGaussianMLPPolicy(meta_batch_size=args.meta_batch_size, obs_dim=2, action_dim=2,
+                                               name='policy', hidden_sizes=tuple(args.hidden_sizes))
+                sampler = MAMLSampler(env, policy, args.rollouts_per_meta_task, args.meta_batch_size,
+                                      args.max_path_length, parallel=True, n_workers=args.n_workers,
+                                      shared_memory=shared_memory, worker_policies=worker_policies)
+                with tf.compat.v1.Session() as sess:
+                    sess.run(tf.compat.v1.global_variables_initializer())
+                    sampler.update_tasks()
+                    sampling_time = time_sampling(sampler, policy, args.n_repeats)
+            print('%-16s %-14s %-14.3f' % (worker_policies, shared_memory, sampling_time))
+
+
+if __name__ == "__main__":
+    tf.compat.v1.disable_eager_execution()
+    main(parser.parse_args())
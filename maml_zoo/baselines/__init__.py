@@ -1,2 +1,2 @@
 from maml_zoo.baselines.base import Baseline
-from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline
\ No newline at end of file
+from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline, AccumulatingLinearFeatureBaseline
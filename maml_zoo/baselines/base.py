@@ -46,6 +46,56 @@ class Baseline():
         """
         raise NotImplementedError
 
+    def fit_padded(self, padded_paths, target_key='returns'):
+        """
+        Fits the baseline model with paths that are padded to the same length
+
+        Args:
+            padded_paths: dict of arrays of shape (num_paths, path_length, ...) containing the path information,
+                          including the mask of the valid steps
+            target_key (str): key of the target that shall be fitted (e.g. "returns")
+
+        """
+        raise NotImplementedError
+
+    def predict_padded(self, padded_paths):
+        """
+        Predicts the reward baselines of paths that are padded to the same length
+
+        Args:
+            padded_paths: dict of arrays of shape (num_paths, path_length, ...) containing the path information,
+                          including the mask of the valid steps
+
+        Returns: numpy array of shape (num_paths, path_length) specifying the reward baselines
+
+        """
+        raise NotImplementedError
+
+    def fit_tasks(self, paths_meta_batch, target_key='returns'):
+        """
+        Fits one baseline model per task with the provided paths and predicts the baselines of these paths
+
+        Args:
+            paths_meta_batch (list): list (len = n_tasks) of lists of paths
+            target_key (str): path dictionary key of the target that shall be fitted (e.g. "returns")
+
+        Returns: list (len = n_tasks) of lists of numpy arrays specifying the reward baselines of the paths
+
+        """
+        raise NotImplementedError
+
+    def predict_tasks(self, paths_meta_batch):
+        """
+        Predicts the reward baselines of the paths of each task with the models fitted by fit_tasks
+
+        Args:
+            paths_meta_batch (list): list (len = n_tasks) of lists of paths
+
+        Returns: list (len = n_tasks) of lists of numpy arrays specifying the reward baselines of the paths
+
+        """
+        raise NotImplementedError
+
     def log_diagnostics(self, paths, prefix):
         """
         Log extra information per iteration based on the collected paths
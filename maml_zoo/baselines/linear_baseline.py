@@ -1,6 +1,8 @@
 from maml_zoo.baselines.base import Baseline
 from maml_zoo.utils.serializable import Serializable
 import numpy as np
+import scipy.linalg
+import itertools
 
 
 class LinearBaseline(Baseline):
@@ -12,7 +14,9 @@ class LinearBaseline(Baseline):
     def __init__(self, reg_coeff=1e-5):
         super(LinearBaseline, self).__init__()
         self._coeffs = None
+        self._task_coeffs = None
         self._reg_coeff = reg_coeff
+        self._time_feature_block = np.zeros((0, 4))
 
     def predict(self, path):
         """
@@ -65,6 +69,38 @@ class LinearBaseline(Baseline):
 
         featmat = np.concatenate([self._features(path) for path in paths], axis=0)
         target = np.concatenate([path[target_key] for path in paths], axis=0)
+        self._fit_features(featmat, target)
+
+    def fit_padded(self, padded_paths, target_key='returns'):
+        """
+        Fits the linear baseline model with paths that are padded to the same length (see fit)
+
+        Args:
+            padded_paths (dict): dict of arrays of shape (num_paths, path_length, ...) containing the path information,
+                                 including the mask of the valid steps
+            target_key (str): key of the target that shall be fitted (e.g. "returns")
+
+        """
+        valid = padded_paths["mask"].astype(bool)
+        self._fit_features(self._padded_features(padded_paths)[valid], padded_paths[target_key][valid])
+
+    def predict_padded(self, padded_paths):
+        """
+        Predicts the linear reward baselines of paths that are padded to the same length.
+        If the baseline is not fitted - returns zero baseline
+
+        Args:
+            padded_paths (dict): dict of arrays of shape (num_paths, path_length, ...) containing the path information,
+                                 including the mask of the valid steps
+
+        Returns:
+            (np.ndarray): reward baselines, zero after the end of each path - shape: (num_paths, path_length)
+        """
+        if self._coeffs is None:
+            return np.zeros(padded_paths["mask"].shape)
+        return self._padded_features(padded_paths).dot(self._coeffs) * padded_paths["mask"]
+
+    def _fit_features(self, featmat, target):
         reg_coeff = self._reg_coeff
         for _ in range(5):
             self._coeffs = np.linalg.lstsq(
@@ -76,9 +112,112 @@ class LinearBaseline(Baseline):
                 break
             reg_coeff *= 10
 
+    def fit_tasks(self, paths_meta_batch, target_key='returns'):
+        """
+        Fits one linear baseline model per task via damped least squares. The features of all tasks are padded into
+        one (n_tasks, max_task_samples, n_features) array, so that the normal equations of all tasks are formed with
+        one batched matmul and solved with one stacked solve.
+
+        Args:
+            paths_meta_batch (list): list (len = n_tasks) of lists of paths
+            target_key (str): path dictionary key of the target that shall be fitted (e.g. "returns")
+
+        Returns:
+            (list) : list (len = n_tasks) of lists of numpy arrays specifying the reward baselines of the paths
+        """
+        assert all([target_key in path.keys() for paths in paths_meta_batch for path in paths])
+
+        features, task_ids, sample_idx, path_lengths = self._task_batch_features(paths_meta_batch)
+        targets = np.zeros(features.shape[:2])
+        targets[task_ids, sample_idx] = np.concatenate([path[target_key] for paths in paths_meta_batch
+                                                        for path in paths])
+        features_t = np.swapaxes(features, 1, 2)
+        self._task_coeffs = self._solve_tasks(np.matmul(features_t, features),
+                                              np.matmul(features_t, targets[..., None])[..., 0])
+        return self._predict_task_batch(paths_meta_batch, features, task_ids, sample_idx, path_lengths)
+
+    def predict_tasks(self, paths_meta_batch):
+        """
+        Predicts the reward baselines of the paths of each task with the models fitted by fit_tasks.
+        If the baselines are not fitted - returns zero baselines
+
+        Args:
+            paths_meta_batch (list): list (len = n_tasks) of lists of paths
+
+        Returns:
+            (list) : list (len = n_tasks) of lists of numpy arrays specifying the reward baselines of the paths
+        """
+        if self._task_coeffs is None:
+            return [[np.zeros(len(path["observations"])) for path in paths] for paths in paths_meta_batch]
+        assert len(paths_meta_batch) == len(self._task_coeffs)
+        return self._predict_task_batch(paths_meta_batch, *self._task_batch_features(paths_meta_batch))
+
+    def _task_batch_features(self, paths_meta_batch):
+        """
+        Returns:
+            (tuple) : features of the samples padded per task - shape: (n_tasks, max_task_samples, n_features),
+                      task and index within the task of each sample - shape: (n_samples,) and the path lengths
+        """
+        paths = [path for task_paths in paths_meta_batch for path in task_paths]
+        path_lengths = np.array([len(path["observations"]) for path in paths])
+        paths_per_task = np.array([len(task_paths) for task_paths in paths_meta_batch])
+        n_tasks, n_samples = len(paths_meta_batch), np.sum(path_lengths)
+
+        task_ids = np.repeat(np.repeat(np.arange(n_tasks), paths_per_task), path_lengths)
+        task_samples = np.bincount(task_ids, minlength=n_tasks)
+        sample_idx = np.arange(n_samples) - np.repeat(np.cumsum(task_samples) - task_samples, task_samples)
+        time_steps = np.arange(n_samples) - np.repeat(np.cumsum(path_lengths) - path_lengths, path_lengths)
+
+        observations = np.concatenate([path["observations"] for path in paths])
+        sample_features = self._stack_features(observations, self._time_features(np.max(path_lengths))[time_steps])
+        features = np.zeros((n_tasks, np.max(task_samples), sample_features.shape[1]))
+        features[task_ids, sample_idx] = sample_features
+        return features, task_ids, sample_idx, path_lengths
+
+    def _predict_task_batch(self, paths_meta_batch, features, task_ids, sample_idx, path_lengths):
+        predictions = np.matmul(features, self._task_coeffs[..., None])[task_ids, sample_idx, 0]
+        path_baselines = np.split(predictions, np.cumsum(path_lengths)[:-1])
+        task_offsets = np.cumsum([0] + [len(paths) for paths in paths_meta_batch])
+        return [path_baselines[start:end] for start, end in zip(task_offsets[:-1], task_offsets[1:])]
+
+    def _solve_tasks(self, feat_gram, feat_target):
+        identity = np.identity(feat_gram.shape[-1])
+        reg_coeff = self._reg_coeff
+        for _ in range(5):
+            try:
+                coeffs = np.linalg.solve(feat_gram + reg_coeff * identity, feat_target[..., None])[..., 0]
+                if np.all(np.isfinite(coeffs)):
+                    return coeffs
+            except np.linalg.LinAlgError:
+                pass
+            reg_coeff *= 10
+        return np.zeros(feat_target.shape)
+
     def _features(self, path):
         raise NotImplementedError("this is an abstract class, use either LinearFeatureBaseline or LinearTimeBaseline")
 
+    def _padded_features(self, padded_paths):
+        num_paths, path_length = padded_paths["mask"].shape
+        time_features = np.broadcast_to(self._time_features(path_length), (num_paths, path_length, 4))
+        return self._stack_features(padded_paths["observations"], time_features)
+
+    def _stack_features(self, observations, time_features):
+        raise NotImplementedError("this is an abstract class, use either LinearFeatureBaseline or LinearTimeBaseline")
+
+    def _time_features(self, path_length):
+        """
+        Time-polynomial features [t, t^2, t^3, 1] of a path. The block is computed once for the longest path seen so
+        far, so that shorter paths get a view of its first rows.
+
+        Returns:
+            (np.ndarray) : time features - shape: (path_length, 4)
+        """
+        if path_length > len(self._time_feature_block):
+            time_step = np.arange(path_length).reshape(-1, 1) / 100.0
+            self._time_feature_block = np.concatenate([time_step, time_step ** 2, time_step ** 3,
+                                                       np.ones((path_length, 1))], axis=1)
+        return self._time_feature_block[:path_length]
+
 
 class LinearFeatureBaseline(LinearBaseline):
     """
@@ -94,16 +233,95 @@ class LinearFeatureBaseline(LinearBaseline):
 
     """
     def __init__(self, reg_coeff=1e-5):
-        super(LinearFeatureBaseline, self).__init__()
-        self._coeffs = None
-        self._reg_coeff = reg_coeff
+        super(LinearFeatureBaseline, self).__init__(reg_coeff=reg_coeff)
 
     def _features(self, path):
-        obs = np.clip(path["observations"], -10, 10)
-        path_length = len(path["observations"])
-        time_step = np.arange(path_length).reshape(-1, 1) / 100.0
-        return np.concatenate([obs, obs ** 2, time_step, time_step ** 2, time_step ** 3, np.ones((path_length, 1))],
-                              axis=1)
+        return self._stack_features(path["observations"], self._time_features(len(path["observations"])))
+
+    def _stack_features(self, observations, time_features):
+        obs = np.clip(observations, -10, 10)
+        return np.concatenate([obs, obs ** 2, time_features], axis=-1)
+
+
+class AccumulatingLinearFeatureBaseline(LinearFeatureBaseline):
+    """
+    LinearFeatureBaseline that fits from sufficient statistics. The normal equations X^T X and X^T y are accumulated
+    path by path with add_path, e.g. as soon as the returns of a path are known, so that fitting neither concatenates
+    the feature matrices of all paths nor recomputes their features. The normal equations are solved with a Cholesky
+    factorization, increasing the damping until the factorization succeeds.
+
+    fit uses the statistics of all paths added since the last fit, plus the given paths that have not been added yet,
+    and resets the statistics afterwards. The added paths are marked with the token of the current statistics (in the
+    set under STATS_TOKEN_KEY), so that they are not added twice. The sample processors only call fit, since the
+    returns of the paths are computed right before it - add_path is meant for callers that have the returns of a path
+    earlier.
+
+    Args:
+        reg_coeff (float) : initial damping of the normal equations
+        max_damping_steps (int) : number of times the damping is increased tenfold before giving up
+    """
+    STATS_TOKEN_KEY = 'baseline_stats_token'
+    _stats_tokens = itertools.count()
+
+    def __init__(self, reg_coeff=1e-5, max_damping_steps=5):
+        super(AccumulatingLinearFeatureBaseline, self).__init__(reg_coeff=reg_coeff)
+        self._max_damping_steps = max_damping_steps
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the accumulated statistics
+        """
+        self._feat_gram = None
+        self._feat_target = None
+        self._stats_token = None  # drawn at the first add_path
+
+    def add_path(self, path, target_key='returns'):
+        """
+        Adds a path to the statistics of the next fit
+
+        Args:
+            path (dict): dict of lists/numpy array containing trajectory / path information
+            target_key (str): path dictionary key of the target that shall be fitted (e.g. "returns")
+        """
+        features = self._features(path)
+        if self._feat_gram is None:
+            self._feat_gram = np.zeros((features.shape[1], features.shape[1]))
+            self._feat_target = np.zeros(features.shape[1])
+            self._stats_token = next(self._stats_tokens)
+        self._feat_gram += features.T.dot(features)
+        self._feat_target += features.T.dot(path[target_key])
+        path.setdefault(self.STATS_TOKEN_KEY, set()).add(self._stats_token)
+
+    def fit(self, paths, target_key='returns'):
+        """
+        Fits the linear baseline model with the accumulated statistics and the provided paths
+
+        Args:
+            paths (list): list of paths
+            target_key (str): path dictionary key of the target that shall be fitted (e.g. "returns")
+        """
+        for path in paths:
+            if self._stats_token not in path.get(self.STATS_TOKEN_KEY, ()):
+                self.add_path(path, target_key=target_key)
+        assert self._feat_gram is not None, 'no paths to fit the baseline with'
+
+        self._coeffs = self._solve(self._feat_gram, self._feat_target)
+        self.reset()
+
+    def _solve(self, feat_gram, feat_target):
+        identity = np.identity(len(feat_gram))
+        reg_coeff = self._reg_coeff
+        for _ in range(self._max_damping_steps):
+            try:
+                coeffs = scipy.linalg.cho_solve(scipy.linalg.cho_factor(feat_gram + reg_coeff * identity),
+                                                feat_target)
+                if np.all(np.isfinite(coeffs)):
+                    return coeffs
+            except np.linalg.LinAlgError:
+                pass
+            reg_coeff *= 10
+        return np.linalg.lstsq(feat_gram + reg_coeff * identity, feat_target, rcond=-1)[0]
 
 
 class LinearTimeBaseline(LinearBaseline):
@@ -120,8 +338,8 @@ class LinearTimeBaseline(LinearBaseline):
     """
 
     def _features(self, path):
-        path_length = len(path["observations"])
-        time_step = np.arange(path_length).reshape(-1, 1) / 100.0
-        return np.concatenate([time_step, time_step ** 2, time_step ** 3, np.ones((path_length, 1))],
-                              axis=1)
+        return self._time_features(len(path["observations"]))
+
+    def _stack_features(self, observations, time_features):
+        return time_features
 
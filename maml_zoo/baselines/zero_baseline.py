@@ -52,4 +52,10 @@ class ZeroBaseline(Baseline):
              (np.ndarray): numpy array of the same length as paths["observations"] specifying the reward baseline
                 
         """
-        return np.zeros_like(path["rewards"])
\ No newline at end of file
+        return np.zeros_like(path["rewards"])
+
+    def fit_padded(self, padded_paths, **kwargs):
+        pass
+
+    def predict_padded(self, padded_paths):
+        return np.zeros_like(padded_paths["rewards"])
\ No newline at end of file
@@ -44,6 +44,80 @@ class MetaEnv(Env):
         """
         pass
 
+
+class BatchMetaEnv(MetaEnv):
+    """
+    Meta environment that simulates a batch of num_envs independent env slots at once. The state of all slots is
+    held in arrays and stepped with vectorized numpy operations. Every slot has its own task and can be reset
+    independently, so that a single BatchMetaEnv can replace num_envs copies of the corresponding MetaEnv.
+
+    The tasks sampled by sample_tasks have the same format as the ones of the corresponding MetaEnv.
+
+    Args:
+        num_envs (int) : number of env slots
+    """
+    is_batch_env = True
+
+    def __init__(self, *args, num_envs=1, **kwargs):
+        super(BatchMetaEnv, self).__init__(*args, **kwargs)
+        self.set_num_envs(num_envs)
+
+    def set_num_envs(self, num_envs):
+        """
+        Sets the number of env slots - the tasks of the slots need to be set again afterwards
+
+        Args:
+            num_envs (int) : number of env slots
+        """
+        self.num_envs = num_envs
+
+    def set_tasks(self, tasks):
+        """
+        Sets the task of every env slot
+
+        Args:
+            tasks (list) : an (num_envs) length list of tasks - one for each env slot
+        """
+        raise NotImplementedError
+
+    def set_task(self, task):
+        """
+        Sets the specified task to all env slots
+
+        Args:
+            task: task of the meta-learning environment
+        """
+        self.set_tasks([task] * self.num_envs)
+
+    def reset(self, mask=None):
+        """
+        Resets the env slots selected by mask
+
+        Args:
+            mask (np.ndarray or None) : boolean array of shape (num_envs,) - if None, all env slots are reset
+
+        Returns:
+            (np.ndarray) : observations of all env slots - shape: (num_envs, obs_dim)
+        """
+        raise NotImplementedError
+
+    def step(self, actions):
+        """
+        Runs one timestep of the dynamics of all env slots
+
+        Args:
+            actions (np.ndarray) : actions of all env slots - shape: (num_envs, action_dim)
+
+        Returns:
+            (tuple) : observations (num_envs, obs_dim), rewards (num_envs,), dones (num_envs,) and a dict of
+                      env infos with arrays of leading dimension num_envs
+        """
+        raise NotImplementedError
+
+    def _reset_mask(self, mask):
+        return np.ones(self.num_envs, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+
 class RandomEnv(MetaEnv, Env):  # needs to be MujocoEnv
     """
     This class provides functionality for randomizing the physical parameters of a mujoco model
@@ -104,8 +104,8 @@ class NormalizedEnv(Serializable):
         self._update_reward_estimate(reward)
         return reward / (np.sqrt(self._reward_var) + 1e-8)
 
-    def reset(self):
-        obs = self._wrapped_env.reset()
+    def reset(self, *args, **kwargs):
+        obs = self._wrapped_env.reset(*args, **kwargs)
         if self._normalize_obs:
             return self._apply_normalize_obs(obs)
         else:
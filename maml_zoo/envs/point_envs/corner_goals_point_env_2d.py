@@ -1,4 +1,5 @@
 from maml_zoo.envs.base import MetaEnv
+from maml_zoo.envs.point_envs.point_env_2d import BatchMetaPointEnv  # same dynamics as MetaPointEnv below
 
 import numpy as np
 from gym.spaces import Box
@@ -1,4 +1,4 @@
-from maml_zoo.envs.base import MetaEnv
+from maml_zoo.envs.base import MetaEnv, BatchMetaEnv
 
 import numpy as np
 from gym.spaces import Box
@@ -69,3 +69,28 @@ class MetaPointEnv(MetaEnv):
 
     def get_task(self):
         return {}
+
+
+class BatchMetaPointEnv(BatchMetaEnv, MetaPointEnv):
+    """
+    Batched version of MetaPointEnv that steps num_envs point envs at once
+    """
+
+    def set_num_envs(self, num_envs):
+        super(BatchMetaPointEnv, self).set_num_envs(num_envs)
+        self._states = np.zeros((num_envs, 2))
+
+    def set_tasks(self, tasks):
+        assert len(tasks) == self.num_envs
+
+    def reset(self, mask=None):
+        mask = self._reset_mask(mask)
+        self._states[mask] = np.random.uniform(-2, 2, size=(np.count_nonzero(mask), 2))
+        return np.copy(self._states)
+
+    def step(self, actions):
+        prev_states = self._states
+        self._states = prev_states + np.clip(actions, -0.1, 0.1)
+        rewards = self.reward(prev_states, actions, self._states)
+        dones = self.done(self._states)
+        return np.copy(self._states), rewards, dones, {}
@@ -1,4 +1,4 @@
-from maml_zoo.envs.base import MetaEnv
+from maml_zoo.envs.base import MetaEnv, BatchMetaEnv
 
 import numpy as np
 from gym.spaces import Box
@@ -92,6 +92,47 @@ class MetaPointEnvCorner(MetaEnv):
     def get_task(self):
         return self.goal
 
+
+class BatchMetaPointEnvCorner(BatchMetaEnv, MetaPointEnvCorner):
+    """
+    Batched version of MetaPointEnvCorner that steps num_envs point envs with different goal corners at once
+    """
+
+    def set_num_envs(self, num_envs):
+        super(BatchMetaPointEnvCorner, self).set_num_envs(num_envs)
+        self._states = np.zeros((num_envs, 2))
+        self._goals = np.zeros((num_envs, 2))
+
+    def set_tasks(self, tasks):
+        self._goals = np.reshape(np.array(tasks, dtype=np.float64), (self.num_envs, 2))
+
+    def reset(self, mask=None):
+        mask = self._reset_mask(mask)
+        self._states[mask] = np.random.uniform(-0.2, 0.2, size=(np.count_nonzero(mask), 2))
+        return np.copy(self._states)
+
+    def step(self, actions):
+        prev_states = self._states
+        self._states = prev_states + np.clip(actions, -0.2, 0.2)
+        rewards = self._batch_rewards(prev_states, self._states)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        return np.copy(self._states), rewards, dones, {}
+
+    def _batch_rewards(self, states, next_states):
+        goal_distances = np.sqrt(np.sum((next_states - self._goals) ** 2, axis=-1))
+        if self.reward_type == 'dense':
+            return - goal_distances
+        elif self.reward_type == 'dense_squared':
+            return - goal_distances ** 2
+        elif self.reward_type == 'sparse':
+            # progress towards the goal, only paid out if the goal is the closest corner and the point left the start
+            corner_distances = np.sqrt(np.sum((next_states[:, None, :] - np.array(self.corners)[None]) ** 2, axis=-1))
+            closest_to_goal = goal_distances == np.min(corner_distances, axis=1)
+            left_start = np.linalg.norm(next_states, ord=1, axis=1) >= self.sparse_reward_radius
+            progress = np.sqrt(np.sum((states - self._goals) ** 2, axis=-1)) - goal_distances
+            return np.where(np.logical_and(closest_to_goal, left_start), progress, 0.)
+
+
 if __name__ == "__main__":
     env = MetaPointEnvCorner()
     task = env.sample_tasks(10)
@@ -1,4 +1,4 @@
-from maml_zoo.envs.base import MetaEnv
+from maml_zoo.envs.base import MetaEnv, BatchMetaEnv
 
 import numpy as np
 from gym.spaces import Box
@@ -87,6 +87,42 @@ class MetaPointEnvMomentum(MetaEnv):
     def get_task(self):
         return self.goal
 
+
+class BatchMetaPointEnvMomentum(BatchMetaEnv, MetaPointEnvMomentum):
+    """
+    Batched version of MetaPointEnvMomentum that steps num_envs point envs with different goal corners at once
+    """
+
+    def set_num_envs(self, num_envs):
+        super(BatchMetaPointEnvMomentum, self).set_num_envs(num_envs)
+        self._states = np.zeros((num_envs, 2))
+        self._velocities = np.zeros((num_envs, 2))
+        self._goals = np.zeros((num_envs, 2))
+
+    def set_tasks(self, tasks):
+        self._goals = np.reshape(np.array(tasks, dtype=np.float64), (self.num_envs, 2))
+
+    def reset(self, mask=None):
+        mask = self._reset_mask(mask)
+        n_resets = np.count_nonzero(mask)
+        self._states[mask] = np.random.uniform(-0.2, 0.2, size=(n_resets, 2))
+        self._velocities[mask] = np.random.uniform(-0.1, 0.1, size=(n_resets, 2))
+        return np.concatenate([self._states, self._velocities], axis=1)
+
+    def step(self, actions):
+        self._velocities = self._velocities + np.clip(actions, -0.1, 0.1)
+        self._states = self._states + self._velocities
+        goal_distances = np.sqrt(np.sum((self._states - self._goals) ** 2, axis=-1))
+        if self.reward_type == 'dense':
+            rewards = - goal_distances
+        elif self.reward_type == 'dense_squared':
+            rewards = - goal_distances ** 2
+        elif self.reward_type == 'sparse':
+            rewards = np.maximum(self.sparse_reward_radius - goal_distances, 0)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        return np.concatenate([self._states, self._velocities], axis=1), rewards, dones, {}
+
+
 if __name__ == "__main__":
     env = MetaPointEnvMomentum()
     while True:
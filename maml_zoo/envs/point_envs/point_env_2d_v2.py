@@ -1,4 +1,4 @@
-from maml_zoo.envs.base import MetaEnv
+from maml_zoo.envs.base import MetaEnv, BatchMetaEnv
 
 import numpy as np
 from gym.spaces import Box
@@ -74,3 +74,29 @@ class MetaPointEnv(MetaEnv):
 
     def get_task(self):
         return self.task
+
+
+class BatchMetaPointEnv(BatchMetaEnv, MetaPointEnv):
+    """
+    Batched version of MetaPointEnv that steps num_envs point envs with different goals at once
+    """
+
+    def set_num_envs(self, num_envs):
+        super(BatchMetaPointEnv, self).set_num_envs(num_envs)
+        self._states = np.zeros((num_envs, 2))
+        self._goals = np.tile(self.goal, (num_envs, 1))
+
+    def set_tasks(self, tasks):
+        self._goals = np.reshape(np.array(tasks, dtype=np.float64), (self.num_envs, 2))
+
+    def reset(self, mask=None):
+        mask = self._reset_mask(mask)
+        self._states[mask] = 0
+        return np.copy(self._states)
+
+    def step(self, actions):
+        self._states = np.clip(self._states + np.clip(actions, -0.1, 0.1), -0.5, 0.5)
+        goal_diffs = self._goals - self._states
+        rewards = - np.sqrt(np.sum(goal_diffs ** 2, axis=1))
+        dones = np.all(np.abs(goal_diffs) < 0.01, axis=1)
+        return np.copy(self._states), rewards, dones, {}
@@ -1,4 +1,4 @@
-from maml_zoo.envs.base import MetaEnv
+from maml_zoo.envs.base import MetaEnv, BatchMetaEnv
 
 import numpy as np
 from gym.spaces import Box
@@ -106,6 +106,60 @@ class MetaPointEnvWalls(MetaEnv):
     def get_task(self):
         return dict(goal=self.goal, gap_1=self.gap_1, gap_2=self.gap_2)
 
+
+class BatchMetaPointEnvWalls(BatchMetaEnv, MetaPointEnvWalls):
+    """
+    Batched version of MetaPointEnvWalls that steps num_envs point envs with different goals and wall gaps at once.
+    Different from MetaPointEnvWalls, the sparse reward is 0 (instead of None) outside of the sparse reward radius.
+    """
+
+    def set_num_envs(self, num_envs):
+        super(BatchMetaPointEnvWalls, self).set_num_envs(num_envs)
+        self._states = np.zeros((num_envs, 2))
+        self._goals = np.zeros((num_envs, 2))
+        self._gaps_1 = np.zeros((num_envs, 2))
+        self._gaps_2 = np.zeros((num_envs, 2))
+
+    def set_tasks(self, tasks):
+        assert len(tasks) == self.num_envs
+        self._goals = np.array([task['goal'] for task in tasks], dtype=np.float64)
+        self._gaps_1 = np.array([task['gap_1'] for task in tasks], dtype=np.float64)
+        self._gaps_2 = np.array([task['gap_2'] for task in tasks], dtype=np.float64)
+
+    def reset(self, mask=None):
+        mask = self._reset_mask(mask)
+        self._states[mask] = np.random.uniform(-0.2, 0.2, size=(np.count_nonzero(mask), 2))
+        return np.copy(self._states)
+
+    def step(self, actions):
+        prev_states = self._states
+        states = prev_states + np.clip(actions, -0.2, 0.2)
+        rewards = self._batch_rewards(prev_states, states)
+
+        # points that cross a wall away from its gap are projected back onto the wall
+        prev_norms, norms = np.linalg.norm(prev_states, axis=1), np.linalg.norm(states, axis=1)
+        crosses_wall_1 = np.logical_and(prev_norms < 1, norms > 1)
+        crosses_wall_2 = np.logical_and(np.logical_not(crosses_wall_1), np.logical_and(prev_norms < 2, norms > 2))
+        blocked_1 = np.logical_and(crosses_wall_1, np.linalg.norm(states - self._gaps_1, axis=1) > 1)
+        blocked_2 = np.logical_and(crosses_wall_2, np.linalg.norm(states - self._gaps_2, axis=1) > 1)
+        states[blocked_1] /= (norms[blocked_1] + 1e-6)[:, None]
+        states[blocked_2] /= (norms[blocked_2] * 0.5 + 1e-6)[:, None]
+
+        self._states = states
+        dones = np.zeros(self.num_envs, dtype=bool)
+        return np.copy(self._states), rewards, dones, {}
+
+    def _batch_rewards(self, states, next_states):
+        goal_distances = np.linalg.norm(next_states - self._goals, axis=1)
+        if self.reward_type == 'dense':
+            return - goal_distances
+        elif self.reward_type == 'dense_squared':
+            return - goal_distances ** 2
+        elif self.reward_type == 'sparse':
+            progress = np.linalg.norm(states - self._goals, axis=1) - goal_distances
+            return np.where(goal_distances < self.sparse_reward_radius, progress, 0.)
+
+
 if __name__ == "__main__":
     env = MetaPointEnvWalls()
     while True:
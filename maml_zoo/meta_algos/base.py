@@ -1,5 +1,6 @@
 from maml_zoo import utils
 from maml_zoo.policies.base import Policy
+from maml_zoo.optimizers.input_binding import InputBindingPlan, padding_mask
 
 from collections import OrderedDict
 import tensorflow as tf
@@ -97,13 +98,21 @@ class MAMLAlgo(MetaAlgo):
         meta_batch_size (int): number of meta-learning tasks
         num_inner_grad_steps (int) : number of gradient updates taken per maml iteration
         trainable_inner_step_size (boolean): whether make the inner step size a trainable variable
+        vectorized_tasks (bool) : whether to build the graph once for all tasks instead of once per task. The inputs
+                                  are then padded to (meta_batch_size, max_samples, dim) tensors with a mask, the
+                                  per-task inner gradients are computed in one batched pass and the size of the graph
+                                  doesn't depend on meta_batch_size. Requires a policy with batched_task_graph
+        stage_inputs (bool) : whether the inputs of the meta-update graph are staged in variables once per
+                              optimize_policy call (see InputBindingPlan) instead of being fed to every session.run
     """
     def __init__(self,
                  policy,
                  inner_lr=0.1,
                  meta_batch_size=20,
                  num_inner_grad_steps=1,
-                 trainable_inner_step_size=False):
+                 trainable_inner_step_size=False,
+                 vectorized_tasks=False,
+                 stage_inputs=False):
         super(MAMLAlgo, self).__init__(policy)
 
         assert type(num_inner_grad_steps) and num_inner_grad_steps >= 0
@@ -113,10 +122,20 @@ class MAMLAlgo(MetaAlgo):
         self.meta_batch_size = meta_batch_size
         self.num_inner_grad_steps = num_inner_grad_steps
         self.trainable_inner_step_size = trainable_inner_step_size  # TODO: make sure this actually works
+        self.vectorized_tasks = vectorized_tasks
+        self.stage_inputs = stage_inputs
+        if vectorized_tasks:
+            assert getattr(policy, 'batched_task_graph', False), \
+                "vectorized tasks require a policy whose post-update params are stacked along the task dimension"
 
         self.adapt_input_ph_dict = None
         self.adapted_policies_params = None
         self.step_sizes = None
+        self._adapt_assign_op = None
+
+        self._staged_inputs = OrderedDict()  # placeholder -> variable holding its staged value
+        self._adapt_input_plan = None
+        self._meta_op_input_plan = None
 
     def _make_input_placeholders(self, prefix=''):
         """
@@ -134,37 +153,149 @@ class MAMLAlgo(MetaAlgo):
 
         for task_id in range(self.meta_batch_size):
             # observation ph
-            ph = tf.compat.v1.placeholder(dtype=tf.float32,
-                                shape=[None, self.policy.obs_dim],
-                                name='obs' + '_' + prefix + '_' + str(task_id))
+            ph = self._input_placeholder(prefix, dtype=tf.float32,
+                                         shape=[None, self.policy.obs_dim],
+                                         name='obs' + '_' + prefix + '_' + str(task_id))
             all_phs_dict['%s_task%i_%s' % (prefix, task_id, 'observations')] = ph
             obs_phs.append(ph)
 
             # action ph
-            ph = tf.compat.v1.placeholder(dtype=tf.float32,
-                                shape=[None, self.policy.action_dim],
-                                name='action' + '_' + prefix + '_' + str(task_id))
+            ph = self._input_placeholder(prefix, dtype=tf.float32,
+                                         shape=[None, self.policy.action_dim],
+                                         name='action' + '_' + prefix + '_' + str(task_id))
             all_phs_dict['%s_task%i_%s' % (prefix, task_id, 'actions')] = ph
             action_phs.append(ph)
 
             # advantage ph
-            ph = tf.compat.v1.placeholder(dtype=tf.float32, shape=[None], name='advantage' + '_' + prefix + '_' + str(task_id))
+            ph = self._input_placeholder(prefix, dtype=tf.float32, shape=[None], name='advantage' + '_' + prefix + '_' + str(task_id))
             all_phs_dict['%s_task%i_%s' % (prefix, task_id, 'advantages')] = ph
             adv_phs.append(ph)
 
             # distribution / agent info
             dist_info_ph_dict = {}
             for info_key, shape in dist_info_specs:
-                ph = tf.compat.v1.placeholder(dtype=tf.float32,
-                                    shape=[None] + list(shape),
-                                    name='%s_%s_%i' % (info_key, prefix, task_id))
+                ph = self._input_placeholder(prefix, dtype=tf.float32,
+                                             shape=[None] + list(shape),
+                                             name='%s_%s_%i' % (info_key, prefix, task_id))
                 all_phs_dict['%s_task%i_agent_infos/%s' % (prefix, task_id, info_key)] = ph
                 dist_info_ph_dict[info_key] = ph
             dist_info_phs.append(dist_info_ph_dict)
 
         return obs_phs, action_phs, adv_phs, dist_info_phs, all_phs_dict
 
-    def _adapt_objective_sym(self, action_sym, adv_sym, dist_info_old_sym, dist_info_new_sym):
+    def _make_padded_input_placeholders(self, prefix=''):
+        """
+        Creates placeholders for the inputs of all tasks, padded to the same number of samples
+
+        Args:
+            prefix (str) : a string to prepend to the name of each variable
+
+        Returns:
+            (tuple) : a tuple containing the placeholders for each input type - shape: (n_tasks, n_samples, dim) -,
+            the mask of the valid samples - shape: (n_tasks, n_samples) - and for convenience, a dict containing all
+            placeholders created
+        """
+        dist_info_specs = self.policy.distribution.dist_info_specs
+        all_phs_dict = OrderedDict()
+
+        obs_ph = self._input_placeholder(prefix, dtype=tf.float32, shape=[None, None, self.policy.obs_dim],
+                                         name='obs_%s' % prefix)
+        all_phs_dict['%s_%s' % (prefix, 'observations')] = obs_ph
+
+        action_ph = self._input_placeholder(prefix, dtype=tf.float32, shape=[None, None, self.policy.action_dim],
+                                            name='action_%s' % prefix)
+        all_phs_dict['%s_%s' % (prefix, 'actions')] = action_ph
+
+        adv_ph = self._input_placeholder(prefix, dtype=tf.float32, shape=[None, None], name='advantage_%s' % prefix)
+        all_phs_dict['%s_%s' % (prefix, 'advantages')] = adv_ph
+
+        dist_info_ph_dict = {}
+        for info_key, shape in dist_info_specs:
+            ph = self._input_placeholder(prefix, dtype=tf.float32, shape=[None, None] + list(shape),
+                                         name='%s_%s' % (info_key, prefix))
+            all_phs_dict['%s_agent_infos/%s' % (prefix, info_key)] = ph
+            dist_info_ph_dict[info_key] = ph
+
+        mask_ph = self._input_placeholder(prefix, dtype=tf.float32, shape=[None, None], name='mask_%s' % prefix)
+        all_phs_dict['%s_%s' % (prefix, 'mask')] = mask_ph
+
+        return obs_ph, action_ph, adv_ph, dist_info_ph_dict, mask_ph, all_phs_dict
+
+    def _input_placeholder(self, prefix, dtype, shape, name):
+        """
+        Creates an input placeholder. If stage_inputs is set, the placeholders of the meta-update graph default to
+        the value of a variable, which holds the staged input when the placeholder isn't fed. The inputs of the
+        adaptation graph are only used by a single session.run and are always fed.
+
+        Returns:
+            (tf.Tensor) : placeholder
+        """
+        if not self.stage_inputs or prefix == 'adapt':
+            return tf.compat.v1.placeholder(dtype=dtype, shape=shape, name=name)
+
+        staged_var = tf.compat.v1.Variable(np.zeros([0 if dim is None else dim for dim in shape]),
+                                           dtype=dtype,
+                                           trainable=False,
+                                           validate_shape=False,
+                                           shape=tf.TensorShape(None),
+                                           name='%s_staged' % name)
+        ph = tf.compat.v1.placeholder_with_default(staged_var.read_value(), shape=shape, name=name)
+        self._staged_inputs[ph] = staged_var
+        return ph
+
+    @property
+    def adapt_input_plan(self):
+        """
+        (InputBindingPlan) : plan that binds the samples of the meta tasks to the placeholders of the adaptation graph
+        """
+        if self._adapt_input_plan is None:
+            self._adapt_input_plan = InputBindingPlan(self.adapt_input_ph_dict,
+                                                      prefixes=['adapt'],
+                                                      keys=self._optimization_keys,
+                                                      meta_batch_size=self.meta_batch_size,
+                                                      padded=self.vectorized_tasks)
+        return self._adapt_input_plan
+
+    @property
+    def meta_op_input_plan(self):
+        """
+        (InputBindingPlan) : plan that binds all_samples_data to the placeholders of the meta-update graph
+        """
+        if self._meta_op_input_plan is None:
+            self._meta_op_input_plan = InputBindingPlan(self.meta_op_phs_dict,
+                                                        prefixes=['step%i' % step_id for step_id
+                                                                  in range(self.num_inner_grad_steps + 1)],
+                                                        keys=self._optimization_keys,
+                                                        meta_batch_size=self.meta_batch_size,
+                                                        padded=self.vectorized_tasks,
+                                                        staged_inputs=self._staged_inputs)
+        return self._meta_op_input_plan
+
+    @staticmethod
+    def _reduce_mean_sym(x, mask=None):
+        """
+        Args:
+            x (tf.Tensor) : per-sample values
+            mask (tf.Tensor or None) : mask of the valid samples of padded inputs - shape: (n_tasks, n_samples)
+
+        Returns:
+            (tf.Tensor) : mean of x, or the per-task mean over the valid samples of x - shape: (n_tasks,) - if a mask
+            is given
+        """
+        if mask is None:
+            return tf.reduce_mean(input_tensor=x)
+        return tf.reduce_sum(input_tensor=x * mask, axis=1) / tf.maximum(tf.reduce_sum(input_tensor=mask, axis=1), 1.)
+
+    @staticmethod
+    def _reduce_sum_sym(x, mask=None):
+        """
+        Same as _reduce_mean_sym but sums over the (valid) samples
+        """
+        if mask is None:
+            return tf.reduce_sum(input_tensor=x)
+        return tf.reduce_sum(input_tensor=x * mask, axis=1)
+
+    def _adapt_objective_sym(self, action_sym, adv_sym, dist_info_old_sym, dist_info_new_sym, mask_sym=None):
         raise NotImplementedError
 
     def _build_inner_adaption(self):
@@ -180,6 +311,9 @@ class MAMLAlgo(MetaAlgo):
             adapt_input_list_ph (list): list of placeholders
 
         """
+        if self.vectorized_tasks:
+            return self._build_vectorized_inner_adaption()
+
         obs_phs, action_phs, adv_phs, dist_info_old_phs, adapt_input_ph_dict = self._make_input_placeholders('adapt')
 
         adapted_policies_params = []
@@ -201,6 +335,136 @@ class MAMLAlgo(MetaAlgo):
 
         return adapted_policies_params, adapt_input_ph_dict
 
+    def _build_vectorized_inner_adaption(self):
+        """
+        Creates the symbolic graph for the inner gradient update of all tasks at once. The policy params of the tasks
+        are stacked along a leading task dimension, so that the gradient of the sum of the task objectives w.r.t. the
+        stacked params holds the gradients of all tasks.
+
+        Returns:
+            adapted_policies_params (list): list of Ordered Dict containing the symbolic post-update parameters
+            adapt_input_list_ph (dict): dict of placeholders
+        """
+        obs_ph, action_ph, adv_ph, dist_info_old_ph, mask_ph, adapt_input_ph_dict = \
+            self._make_padded_input_placeholders('adapt')
+
+        with tf.compat.v1.variable_scope("adapt_all_tasks"):
+            with tf.compat.v1.variable_scope("adapt_objective"):
+                distribution_info_new = self.policy.batched_distribution_info_sym(
+                    obs_ph, params=self.policy.policies_params_stacked_phs)
+
+                # inner surrogate objectives - shape: (meta_batch_size,)
+                surr_objs_adapt = self._adapt_objective_sym(action_ph, adv_ph, dist_info_old_ph,
+                                                            distribution_info_new, mask_sym=mask_ph)
+
+            with tf.compat.v1.variable_scope("adapt_step"):
+                adapted_stacked_params = self._adapt_sym(tf.reduce_sum(input_tensor=surr_objs_adapt),
+                                                         self.policy.policies_params_stacked_phs)
+
+        adapted_params_per_key = OrderedDict([(key, tf.unstack(param, num=self.meta_batch_size, axis=0))
+                                              for key, param in adapted_stacked_params.items()])
+        adapted_policies_params = [OrderedDict([(key, params[i]) for key, params in adapted_params_per_key.items()])
+                                   for i in range(self.meta_batch_size)]
+        return adapted_policies_params, adapt_input_ph_dict
+
+    def _build_vectorized_meta_steps(self):
+        """
+        Creates the padded input placeholders of all steps of the meta-update graph and the inner updates between
+        them. The pre-update params are tiled along the task dimension, so that the inner gradients of all tasks are
+        computed in one batched pass. The placeholders are stored in self.meta_op_phs_dict.
+
+        Returns:
+            (list) : list of length num_inner_grad_steps + 1 with a dict per step holding the input placeholders
+                     ('observations', 'actions', 'advantages', 'dist_info_old', 'mask') and the symbolic
+                     distribution info of the (adapted) policies ('dist_info')
+        """
+        self.meta_op_phs_dict = OrderedDict()
+        inputs = []
+        for step_id in range(self.num_inner_grad_steps + 1):
+            obs_ph, action_ph, adv_ph, dist_info_old_ph, mask_ph, all_phs_dict = \
+                self._make_padded_input_placeholders('step%i' % step_id)
+            self.meta_op_phs_dict.update(all_phs_dict)
+            inputs.append(dict(observations=obs_ph, actions=action_ph, advantages=adv_ph,
+                               dist_info_old=dist_info_old_ph, mask=mask_ph))
+
+        # the gradients w.r.t. the tiled params are the per-task gradients
+        n_tasks = tf.shape(input=inputs[0]['observations'])[0]
+        pre_update_params = OrderedDict([(key, tf.tile(tf.expand_dims(param, axis=0),
+                                                       [n_tasks] + [1] * param.shape.ndims))
+                                         for key, param in self.policy.policy_params.items()])
+        return self._build_vectorized_steps_sym(inputs, pre_update_params)
+
+    def _build_vectorized_candidate_steps(self, steps, candidate_params):
+        """
+        Creates the meta-update graph of several candidate values of the pre-update params at once, by folding the
+        candidate dimension into the task dimension: the inputs of the steps are tiled once per candidate and each
+        (candidate, task) pair is adapted from the params of its candidate.
+
+        Args:
+            steps (list) : steps of the meta-update graph as returned by _build_vectorized_meta_steps
+            candidate_params (OrderedDict) : candidate pre-update params, with a leading candidate dimension
+
+        Returns:
+            (list) : steps as returned by _build_vectorized_meta_steps, whose task dimension holds the
+                     (candidate, task) pairs in candidate-major order
+        """
+        n_candidates = tf.shape(input=list(candidate_params.values())[0])[0]
+        n_tasks = tf.shape(input=steps[0]['observations'])[0]
+        inputs = [dict(observations=self._tile_tasks_sym(step['observations'], n_candidates),
+                       actions=self._tile_tasks_sym(step['actions'], n_candidates),
+                       advantages=self._tile_tasks_sym(step['advantages'], n_candidates),
+                       dist_info_old=OrderedDict([(key, self._tile_tasks_sym(value, n_candidates))
+                                                  for key, value in step['dist_info_old'].items()]),
+                       mask=self._tile_tasks_sym(step['mask'], n_candidates))
+                  for step in steps]
+        pre_update_params = OrderedDict([(key, tf.repeat(param, n_tasks, axis=0))
+                                         for key, param in candidate_params.items()])
+        return self._build_vectorized_steps_sym(inputs, pre_update_params)
+
+    @staticmethod
+    def _tile_tasks_sym(x, n):
+        """
+        Repeats the padded data of all tasks n times along the task dimension
+        """
+        return tf.tile(x, [n] + [1] * (x.shape.ndims - 1))
+
+    def _build_vectorized_steps_sym(self, inputs, pre_update_params):
+        """
+        Creates the inner updates between the steps of the meta-update graph
+
+        Args:
+            inputs (list) : dict of padded inputs of each step
+            pre_update_params (OrderedDict) : pre-update params of each task, stacked along the task dimension
+
+        Returns:
+            (list) : the dicts of inputs, with the symbolic distribution info of the (adapted) policies ('dist_info')
+        """
+        steps, current_policy_params = [], pre_update_params
+        for step_id, step_inputs in enumerate(inputs):
+            distribution_info_vars = self.policy.batched_distribution_info_sym(step_inputs['observations'],
+                                                                               params=current_policy_params)
+            steps.append(dict(step_inputs, dist_info=distribution_info_vars))
+
+            if step_id < self.num_inner_grad_steps:
+                surr_objs = self._adapt_objective_sym(step_inputs['actions'], step_inputs['advantages'],
+                                                      step_inputs['dist_info_old'], distribution_info_vars,
+                                                      mask_sym=step_inputs['mask'])
+                current_policy_params = self._adapt_sym(tf.reduce_sum(input_tensor=surr_objs), current_policy_params)
+
+        return steps
+
+    def _build_adapt_assign_op(self):
+        """
+        Creates the op that assigns the adapted parameters to the resident task variables of the policy
+
+        Returns:
+            (tf.Operation or None): assign op or None if the policy doesn't hold its post-update parameters in
+            tf.Variables
+        """
+        if getattr(self.policy, 'resident_task_params', False):
+            return self.policy.assign_task_parameters_sym(self.adapted_policies_params)
+        return None
+
     def _adapt_sym(self, surr_obj, params_var):
         """
         Creates the symbolic representation of the tf policy after one gradient step towards the surr_obj
@@ -240,14 +504,18 @@ class MAMLAlgo(MetaAlgo):
         sess = tf.compat.v1.get_default_session()
 
         # prepare feed dict
-        input_dict = self._extract_input_dict(samples, self._optimization_keys, prefix='adapt')
-        input_ph_dict = self.adapt_input_ph_dict
-
-        feed_dict_inputs = utils.create_feed_dict(placeholder_dict=input_ph_dict, value_dict=input_dict)
+        feed_dict_inputs = self.adapt_input_plan.bind([samples]).feed_dict
         feed_dict_params = self.policy.policies_params_feed_dict
 
         feed_dict = {**feed_dict_inputs, **feed_dict_params}  # merge the two feed dicts
 
+        if getattr(self.policy, 'resident_task_params', False):
+            # compute the adapted policy parameters and assign them to the task variables of the policy in one run
+            assert self._adapt_assign_op is not None
+            sess.run(self._adapt_assign_op, feed_dict=feed_dict)
+            self.policy.switch_to_post_update()
+            return
+
         # compute the post-update / adapted policy parameters
         adapted_policies_params_vals = sess.run(self.adapted_policies_params, feed_dict=feed_dict)
 
@@ -270,6 +538,9 @@ class MAMLAlgo(MetaAlgo):
         """
         assert len(samples_data_meta_batch) == self.meta_batch_size
 
+        if self.vectorized_tasks:
+            return self._extract_padded_input_dict(samples_data_meta_batch, keys, prefix=prefix)
+
         input_dict = OrderedDict()
 
         for meta_task in range(self.meta_batch_size):
@@ -291,6 +562,31 @@ class MAMLAlgo(MetaAlgo):
                     raise NotImplementedError
         return input_dict
 
+    def _extract_padded_input_dict(self, samples_data_meta_batch, keys, prefix=''):
+        """
+        Same as _extract_input_dict but stacks the data of all meta-tasks into arrays of shape
+        (meta_batch_size, max_samples, ...), zero-padded to the largest number of samples of a task. The mask of the
+        valid samples is stored under '<prefix>_mask'.
+
+        Returns:
+            OrderedDict containing the data from all_samples_data. The data keys follow the naming convention:
+                '<prefix>_<key_name>'
+        """
+        extracted_data = [utils.extract(samples_data, *keys) for samples_data in samples_data_meta_batch]
+
+        input_dict = OrderedDict()
+        for j, key in enumerate(keys):
+            data = [task_data[j] for task_data in extracted_data]
+            if isinstance(data[0], dict):
+                for k in data[0].keys():
+                    input_dict['%s_%s/%s' % (prefix, key, k)] = utils.pad_and_stack([d[k] for d in data])
+            elif isinstance(data[0], np.ndarray):
+                input_dict['%s_%s' % (prefix, key)] = utils.pad_and_stack(data)
+            else:
+                raise NotImplementedError
+        input_dict['%s_mask' % prefix] = padding_mask(samples_data_meta_batch)
+        return input_dict
+
     def _extract_input_dict_meta_op(self, all_samples_data, keys):
         """
         Creates the input dict for all the samples data required to perform the meta-update
@@ -134,6 +134,7 @@ class DICEMAML(MAMLAlgo):
             """ --- Build inner update graph for adapting the policy and sampling trajectories --- """
             # this graph is only used for adapting the policy and not computing the meta-updates
             self.adapted_policies_params, self.adapt_input_ph_dict = self._build_inner_adaption()
+            self._adapt_assign_op = self._build_adapt_assign_op()
 
 
         """ Build graph for meta-update """
@@ -211,7 +212,7 @@ class DICEMAML(MAMLAlgo):
         Returns:
             None
         """
-        meta_op_input_dict = self._extract_input_dict_meta_op(all_samples_data, self._optimization_keys)
+        meta_op_input_dict = self.meta_op_input_plan.bind(all_samples_data)
 
         if log: logger.log("Optimizing")
         loss_before = self.optimizer.optimize(input_val_dict=meta_op_input_dict)
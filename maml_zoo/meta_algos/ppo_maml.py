@@ -69,12 +69,12 @@ class PPOMAML(MAMLAlgo):
 
         self.build_graph()
 
-    def _adapt_objective_sym(self, action_sym, adv_sym, dist_info_old_sym, dist_info_new_sym):
+    def _adapt_objective_sym(self, action_sym, adv_sym, dist_info_old_sym, dist_info_new_sym, mask_sym=None):
         with tf.compat.v1.variable_scope("likelihood_ratio"):
             likelihood_ratio_adapt = self.policy.distribution.likelihood_ratio_sym(action_sym,
                                                                                    dist_info_old_sym, dist_info_new_sym)
         with tf.compat.v1.variable_scope("surrogate_loss"):
-            surr_obj_adapt = -tf.reduce_mean(input_tensor=likelihood_ratio_adapt * adv_sym)
+            surr_obj_adapt = -self._reduce_mean_sym(likelihood_ratio_adapt * adv_sym, mask_sym)
         return surr_obj_adapt
 
     def build_graph(self):
@@ -100,6 +100,11 @@ class PPOMAML(MAMLAlgo):
             """ --- Build inner update graph for adapting the policy and sampling trajectories --- """
             # this graph is only used for adapting the policy and not computing the meta-updates
             self.adapted_policies_params, self.adapt_input_ph_dict = self._build_inner_adaption()
+            self._adapt_assign_op = self._build_adapt_assign_op()
+
+            if self.vectorized_tasks:
+                self._build_vectorized_meta_update()
+                return
 
             """ ----- Build graph for the meta-update ----- """
             self.meta_op_phs_dict = OrderedDict()
@@ -193,6 +198,64 @@ class PPOMAML(MAMLAlgo):
                 outer_kl=mean_outer_kl,
             )
 
+    def _build_vectorized_meta_update(self):
+        """
+        Creates the graph for the meta-update of all tasks at once from padded inputs (see MAMLAlgo)
+        """
+        steps = self._build_vectorized_meta_steps()
+        last_step = steps[-1]
+
+        # per step: compute mean of kls over tasks
+        mean_inner_kl_per_step = tf.stack([
+            tf.reduce_mean(input_tensor=self._reduce_mean_sym(
+                self.policy.distribution.kl_sym(step['dist_info_old'], step['dist_info']), step['mask']))
+            for step in steps[:-1]])
+
+        """ Outer objective """
+        # Create placeholders
+        inner_kl_coeff = tf.compat.v1.placeholder(tf.float32, shape=[self.num_inner_grad_steps], name='inner_kl_coeff')
+        self.meta_op_phs_dict['inner_kl_coeff'] = inner_kl_coeff
+
+        if self.clip_outer:
+            clip_eps_ph = tf.compat.v1.placeholder(tf.float32, shape=[], name='clip_eps')
+            self.meta_op_phs_dict['clip_eps'] = clip_eps_ph
+        else:
+            outer_kl_coeff = tf.compat.v1.placeholder(tf.float32, shape=[], name='outer_kl_coef')
+            self.meta_op_phs_dict['outer_kl_coeff'] = outer_kl_coeff
+
+        # meta-objective - shape: (meta_batch_size,)
+        likelihood_ratio = self.policy.distribution.likelihood_ratio_sym(last_step['actions'],
+                                                                         last_step['dist_info_old'],
+                                                                         last_step['dist_info'])
+        outer_kls = self._reduce_mean_sym(self.policy.distribution.kl_sym(last_step['dist_info_old'],
+                                                                          last_step['dist_info']),
+                                          last_step['mask'])
+
+        if self.clip_outer:  # clipped likelihood ratio
+            clipped_obj = tf.minimum(likelihood_ratio * last_step['advantages'],
+                                     tf.clip_by_value(likelihood_ratio,
+                                                      1 - clip_eps_ph,
+                                                      1 + clip_eps_ph) * last_step['advantages'])
+            surr_objs = - self._reduce_mean_sym(clipped_obj, last_step['mask'])
+
+        else:  # outer kl penalty
+            surr_objs = - self._reduce_mean_sym(likelihood_ratio * last_step['advantages'], last_step['mask']) + \
+                        outer_kl_coeff * outer_kls
+
+        mean_outer_kl = tf.reduce_mean(input_tensor=outer_kls)
+        inner_kl_penalty = tf.reduce_mean(input_tensor=inner_kl_coeff * mean_inner_kl_per_step)
+
+        """ Mean over meta tasks """
+        meta_objective = tf.reduce_mean(input_tensor=surr_objs) + inner_kl_penalty
+
+        self.optimizer.build_graph(
+            loss=meta_objective,
+            target=self.policy,
+            input_ph_dict=self.meta_op_phs_dict,
+            inner_kl=mean_inner_kl_per_step,
+            outer_kl=mean_outer_kl,
+        )
+
     def optimize_policy(self, all_samples_data, log=True):
         """
         Performs MAML outer step
@@ -205,14 +268,14 @@ class PPOMAML(MAMLAlgo):
         Returns:
             None
         """
-        meta_op_input_dict = self._extract_input_dict_meta_op(all_samples_data, self._optimization_keys)
-
-        # add kl_coeffs / clip_eps to meta_op_input_dict
-        meta_op_input_dict['inner_kl_coeff'] = self.inner_kl_coeff
+        # add kl_coeffs / clip_eps to the inputs
+        extra_inputs = dict(inner_kl_coeff=self.inner_kl_coeff)
         if self.clip_outer:
-            meta_op_input_dict['clip_eps'] = self.clip_eps
+            extra_inputs['clip_eps'] = self.clip_eps
         else:
-            meta_op_input_dict['outer_kl_coeff'] = self.outer_kl_coeff
+            extra_inputs['outer_kl_coeff'] = self.outer_kl_coeff
+
+        meta_op_input_dict = self.meta_op_input_plan.bind(all_samples_data, extra_inputs=extra_inputs)
 
         if log: logger.log("Optimizing")
         loss_before = self.optimizer.optimize(input_val_dict=meta_op_input_dict)
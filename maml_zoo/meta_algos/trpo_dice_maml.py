@@ -63,6 +63,7 @@ class TRPO_DICEMAML(DICEMAML):
             """ --- Build inner update graph for adapting the policy and sampling trajectories --- """
             # this graph is only used for adapting the policy and not computing the meta-updates
             self.adapted_policies_params, self.adapt_input_ph_dict = self._build_inner_adaption()
+            self._adapt_assign_op = self._build_adapt_assign_op()
 
         """ Build graph for meta-update """
         meta_update_scope = tf.compat.v1.variable_scope(self.name + '_meta_update')
@@ -159,7 +160,7 @@ class TRPO_DICEMAML(DICEMAML):
         Returns:
             None
         """
-        meta_op_input_dict = self._extract_input_dict_meta_op(all_samples_data, self._optimization_keys)
+        meta_op_input_dict = self.meta_op_input_plan.bind(all_samples_data)
         logger.log("Computing KL before")
         mean_kl_before = self.optimizer.constraint_val(meta_op_input_dict)
 
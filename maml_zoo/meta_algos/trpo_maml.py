@@ -1,6 +1,7 @@
 from maml_zoo.logger import logger
 from maml_zoo.meta_algos.base import MAMLAlgo
-from maml_zoo.optimizers.conjugate_gradient_optimizer import ConjugateGradientOptimizer
+from maml_zoo.optimizers.conjugate_gradient_optimizer import ConjugateGradientOptimizer, FiniteDifferenceHvp, \
+    PerlmutterHvp
 
 import tensorflow as tf
 from collections import OrderedDict
@@ -19,6 +20,12 @@ class TRPOMAML(MAMLAlgo):
         meta_batch_size (int): number of meta-learning tasks
         num_inner_grad_steps (int) : number of gradient updates taken per maml iteration
         trainable_inner_step_size (boolean): whether make the inner step size a trainable variable
+        symbolic_hvp (bool): compute the Hessian vector products symbolically instead of with finite differences
+        in_graph_cg (bool): run the conjugate gradient in the graph - requires symbolic_hvp
+        batched_line_search (bool): evaluate the candidate steps of the line search in batches, with the candidates
+                                    stacked along the task dimension - requires vectorized_tasks
+        line_search_batch_size (int or None): number of candidate steps evaluated per batch - None evaluates all
+        subsample_factor (float): fraction of the samples of each task used for the Hessian vector products
     """
     def __init__(
             self,
@@ -27,6 +34,11 @@ class TRPOMAML(MAMLAlgo):
             step_size=0.01,
             inner_type='likelihood_ratio',
             exploration=False,
+            symbolic_hvp=False,
+            in_graph_cg=False,
+            batched_line_search=False,
+            line_search_batch_size=None,
+            subsample_factor=1.,
             **kwargs):
         super(TRPOMAML, self).__init__(*args, **kwargs)
 
@@ -40,24 +52,30 @@ class TRPOMAML(MAMLAlgo):
         if exploration:  # add adjusted average rewards tp optimization keys
             self._optimization_keys.append('adj_avg_rewards')
 
-        self.optimizer = ConjugateGradientOptimizer()
+        assert symbolic_hvp or not in_graph_cg
+        assert self.vectorized_tasks or not batched_line_search
+        self.batched_line_search = batched_line_search
+        hvp_approach = PerlmutterHvp() if symbolic_hvp else FiniteDifferenceHvp()
+        self.optimizer = ConjugateGradientOptimizer(hvp_approach=hvp_approach, in_graph_cg=in_graph_cg,
+                                                    line_search_batch_size=line_search_batch_size,
+                                                    subsample_factor=subsample_factor)
 
         self.build_graph()
 
-    def _adapt_objective_sym(self, action_sym, adv_sym, dist_info_old_sym, dist_info_new_sym):
+    def _adapt_objective_sym(self, action_sym, adv_sym, dist_info_old_sym, dist_info_new_sym, mask_sym=None):
         if self.inner_type == 'likelihood_ratio':
             with tf.compat.v1.variable_scope("likelihood_ratio"):
                 likelihood_ratio_adapt = self.policy.distribution.likelihood_ratio_sym(action_sym,
                                                                                        dist_info_old_sym,
                                                                                        dist_info_new_sym)
             with tf.compat.v1.variable_scope("surrogate_loss"):
-                surr_obj_adapt = -tf.reduce_mean(input_tensor=likelihood_ratio_adapt * adv_sym)
+                surr_obj_adapt = -self._reduce_mean_sym(likelihood_ratio_adapt * adv_sym, mask_sym)
 
         elif self.inner_type == 'log_likelihood':
             with tf.compat.v1.variable_scope("log_likelihood"):
                 log_likelihood_adapt = self.policy.distribution.log_likelihood_sym(action_sym, dist_info_new_sym)
             with tf.compat.v1.variable_scope("surrogate_loss"):
-                surr_obj_adapt = -tf.reduce_mean(input_tensor=log_likelihood_adapt * adv_sym)
+                surr_obj_adapt = -self._reduce_mean_sym(log_likelihood_adapt * adv_sym, mask_sym)
 
         else:
             raise NotImplementedError
@@ -89,6 +107,11 @@ class TRPOMAML(MAMLAlgo):
             """ --- Build inner update graph for adapting the policy and sampling trajectories --- """
             # this graph is only used for adapting the policy and not computing the meta-updates
             self.adapted_policies_params, self.adapt_input_ph_dict = self._build_inner_adaption()
+            self._adapt_assign_op = self._build_adapt_assign_op()
+
+            if self.vectorized_tasks:
+                self._build_vectorized_meta_update()
+                return
 
             """ ----- Build graph for the meta-update ----- """
             self.meta_op_phs_dict = OrderedDict()
@@ -170,6 +193,94 @@ class TRPOMAML(MAMLAlgo):
                 leq_constraint=(mean_outer_kl, self.step_size),
             )
 
+    def _build_vectorized_meta_update(self):
+        """
+        Creates the graph for the meta-update of all tasks at once from padded inputs (see MAMLAlgo)
+        """
+        steps = self._build_vectorized_meta_steps()
+
+        adj_avg_rewards = None
+        if self.exploration:
+            # add adj_avg_reward placeholder
+            adj_avg_rewards = tf.compat.v1.placeholder(dtype=tf.float32,
+                                                       shape=[None, None],
+                                                       name=f'adj_avg_rewards_{self.num_inner_grad_steps}')
+            self.meta_op_phs_dict['step%i_%s' % (self.num_inner_grad_steps, 'adj_avg_rewards')] = adj_avg_rewards
+
+        surr_objs, outer_kls = self._vectorized_outer_objectives_sym(steps, adj_avg_rewards)
+        mean_outer_kl = tf.reduce_mean(input_tensor=outer_kls)
+
+        """ Mean over meta tasks """
+        meta_objective = tf.reduce_mean(input_tensor=surr_objs)
+
+        line_search = None
+        if self.batched_line_search:
+            with tf.compat.v1.variable_scope("line_search"):
+                line_search = self._build_line_search_graph(steps, adj_avg_rewards)
+
+        self.optimizer.build_graph(
+            loss=meta_objective,
+            target=self.policy,
+            input_ph_dict=self.meta_op_phs_dict,
+            leq_constraint=(mean_outer_kl, self.step_size),
+            line_search=line_search,
+        )
+
+    def _vectorized_outer_objectives_sym(self, steps, adj_avg_rewards=None):
+        """
+        Creates the outer objectives and KL-divergences of the tasks of the vectorized meta-update graph
+
+        Args:
+            steps (list) : steps of the meta-update graph as returned by _build_vectorized_meta_steps
+            adj_avg_rewards (tf.Tensor or None) : padded adjusted average rewards if exploration is used
+
+        Returns:
+            (tf.Tensor) : outer surrogate objective of each task - shape: (n_tasks,)
+            (tf.Tensor) : outer KL-divergence of each task - shape: (n_tasks,)
+        """
+        initial_step, last_step = steps[0], steps[-1]
+
+        """ Outer objective """
+        likelihood_ratio = self.policy.distribution.likelihood_ratio_sym(last_step['actions'],
+                                                                         last_step['dist_info_old'],
+                                                                         last_step['dist_info'])
+        outer_kls = self._reduce_mean_sym(self.policy.distribution.kl_sym(last_step['dist_info_old'],
+                                                                          last_step['dist_info']),
+                                          last_step['mask'])
+
+        surr_objs = - self._reduce_mean_sym(likelihood_ratio * last_step['advantages'], last_step['mask'])
+
+        if adj_avg_rewards is not None:
+            log_likelihood_inital = self.policy.distribution.log_likelihood_sym(initial_step['actions'],
+                                                                                initial_step['dist_info'])
+            surr_objs += - self._reduce_mean_sym(adj_avg_rewards, last_step['mask']) * \
+                         self._reduce_mean_sym(log_likelihood_inital, initial_step['mask'])
+
+        return surr_objs, outer_kls
+
+    def _build_line_search_graph(self, steps, adj_avg_rewards=None):
+        """
+        Creates the graph that evaluates the meta-objective and the mean outer KL of a batch of candidate params of
+        the line search in one pass (see MAMLAlgo._build_vectorized_candidate_steps)
+
+        Returns:
+            (tuple) : placeholder of the flat candidate params - shape: (n_candidates, n_params) - and the meta
+                      objective and mean outer KL of each candidate - shape: (n_candidates,)
+        """
+        candidate_params_ph = tf.compat.v1.placeholder(dtype=tf.float32, shape=[None, self.policy.param_layout.size],
+                                                       name='candidate_params')
+        candidate_params = self.policy.param_layout.unflatten_sym(candidate_params_ph)
+
+        n_candidates = tf.shape(input=candidate_params_ph)[0]
+        candidate_steps = self._build_vectorized_candidate_steps(steps, candidate_params)
+        if adj_avg_rewards is not None:
+            adj_avg_rewards = self._tile_tasks_sym(adj_avg_rewards, n_candidates)
+        surr_objs, outer_kls = self._vectorized_outer_objectives_sym(candidate_steps, adj_avg_rewards)
+
+        candidate_losses = tf.reduce_mean(input_tensor=tf.reshape(surr_objs, [n_candidates, -1]), axis=1)
+        candidate_kls = tf.reduce_mean(input_tensor=tf.reshape(outer_kls, [n_candidates, -1]), axis=1)
+        return candidate_params_ph, candidate_losses, candidate_kls
+
     def optimize_policy(self, all_samples_data, log=True):
         """
         Performs MAML outer step
@@ -182,7 +293,7 @@ class TRPOMAML(MAMLAlgo):
         Returns:
             None
         """
-        meta_op_input_dict = self._extract_input_dict_meta_op(all_samples_data, self._optimization_keys)
+        meta_op_input_dict = self.meta_op_input_plan.bind(all_samples_data)
         logger.log("Computing KL before")
         mean_kl_before = self.optimizer.constraint_val(meta_op_input_dict)
 
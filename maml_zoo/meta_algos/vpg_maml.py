@@ -20,6 +20,9 @@ class VPGMAML(MAMLAlgo):
         meta_batch_size (int): number of meta-learning tasks
         num_inner_grad_steps (int) : number of gradient updates taken per maml iteration
         trainable_inner_step_size (boolean): whether make the inner step size a trainable variable
+        loss_after_every (int): log the loss after the meta-update every loss_after_every iterations - 0 never logs it
+        num_task_chunks (int): number of chunks of tasks the meta-gradient is accumulated over, which bounds the
+                               memory of the meta-update by the size of a chunk
     """
     def __init__(
             self,
@@ -28,12 +31,15 @@ class VPGMAML(MAMLAlgo):
             learning_rate=1e-3,
             inner_type='likelihood_ratio',
             exploration=False,
+            loss_after_every=1,
+            num_task_chunks=1,
             **kwargs):
 
         super(VPGMAML, self).__init__(*args, **kwargs)
         assert inner_type in ["log_likelihood", "likelihood_ratio"]
 
-        self.optimizer = MAMLFirstOrderOptimizer(learning_rate=learning_rate)
+        self.optimizer = MAMLFirstOrderOptimizer(learning_rate=learning_rate, num_minibatches=num_task_chunks,
+                                                 loss_after_every=loss_after_every)
         self.inner_type = inner_type
         self._optimization_keys = ['observations',
                                    'actions',
@@ -51,21 +57,21 @@ class VPGMAML(MAMLAlgo):
                              action_sym,
                              adv_sym,
                              dist_info_old_sym,
-                             dist_info_new_sym):
+                             dist_info_new_sym, mask_sym=None):
         if self.inner_type == 'likelihood_ratio':
             with tf.compat.v1.variable_scope("likelihood_ratio"):
                 likelihood_ratio_adapt = self.policy.distribution.likelihood_ratio_sym(action_sym,
                                                                                        dist_info_old_sym,
                                                                                        dist_info_new_sym)
             with tf.compat.v1.variable_scope("surrogate_loss"):
-                surr_obj_adapt = -tf.reduce_mean(input_tensor=likelihood_ratio_adapt * adv_sym)
+                surr_obj_adapt = -self._reduce_mean_sym(likelihood_ratio_adapt * adv_sym, mask_sym)
 
         elif self.inner_type == 'log_likelihood':
             with tf.compat.v1.variable_scope("log_likelihood"):
                 log_likelihood_adapt = self.policy.distribution.log_likelihood_sym(action_sym,
                                                                                    dist_info_new_sym)
             with tf.compat.v1.variable_scope("surrogate_loss"):
-                surr_obj_adapt = -tf.reduce_mean(input_tensor=log_likelihood_adapt * adv_sym)
+                surr_obj_adapt = -self._reduce_mean_sym(log_likelihood_adapt * adv_sym, mask_sym)
 
         else:
             raise NotImplementedError
@@ -95,6 +101,11 @@ class VPGMAML(MAMLAlgo):
             """ --- Build inner update graph for adapting the policy and sampling trajectories --- """
             # this graph is only used for adapting the policy and not computing the meta-updates
             self.adapted_policies_params, self.adapt_input_ph_dict = self._build_inner_adaption()
+            self._adapt_assign_op = self._build_adapt_assign_op()
+
+            if self.vectorized_tasks:
+                self._build_vectorized_meta_update()
+                return
 
             """ ----- Build graph for the meta-update ----- """
             self.meta_op_phs_dict = OrderedDict()
@@ -170,8 +181,44 @@ class VPGMAML(MAMLAlgo):
                 loss=meta_objective,
                 target=self.policy,
                 input_ph_dict=self.meta_op_phs_dict,
+                task_losses=surr_objs,
             )
 
+    def _build_vectorized_meta_update(self):
+        """
+        Creates the graph for the meta-update of all tasks at once from padded inputs (see MAMLAlgo)
+        """
+        steps = self._build_vectorized_meta_steps()
+        initial_step, last_step = steps[0], steps[-1]
+
+        """ Outer objective """
+        # meta-objective - shape: (meta_batch_size,)
+        log_likelihood = self.policy.distribution.log_likelihood_sym(last_step['actions'], last_step['dist_info'])
+        surr_objs = - self._reduce_mean_sym(log_likelihood * last_step['advantages'], last_step['mask'])
+
+        if self.exploration:
+            # add adj_avg_reward placeholder
+            adj_avg_rewards = tf.compat.v1.placeholder(dtype=tf.float32,
+                                                       shape=[None, None],
+                                                       name=f'adj_avg_rewards_{self.num_inner_grad_steps}')
+            self.meta_op_phs_dict[f'step{self.num_inner_grad_steps}_adj_avg_rewards'] = adj_avg_rewards
+
+            log_likelihood_inital = self.policy.distribution.log_likelihood_sym(initial_step['actions'],
+                                                                                initial_step['dist_info'])
+            surr_objs += - self._reduce_mean_sym(adj_avg_rewards, last_step['mask']) * \
+                         self._reduce_mean_sym(log_likelihood_inital, initial_step['mask'])
+
+        """ Mean over meta tasks """
+        meta_objective = tf.reduce_mean(input_tensor=surr_objs)
+
+        self.optimizer.build_graph(
+            loss=meta_objective,
+            target=self.policy,
+            input_ph_dict=self.meta_op_phs_dict,
+            task_losses=surr_objs,
+            task_batched_phs=list(self.meta_op_phs_dict.values()),
+        )
+
     def optimize_policy(self, all_samples_data, log=True):
         """
         Performs MAML outer step
@@ -184,17 +231,14 @@ class VPGMAML(MAMLAlgo):
         Returns:
             None
         """
-        meta_op_input_dict = self._extract_input_dict_meta_op(all_samples_data, self._optimization_keys)
+        meta_op_input_dict = self.meta_op_input_plan.bind(all_samples_data)
 
         if log:
             logger.log("Optimizing")
-        loss_before = self.optimizer.optimize(input_val_dict=meta_op_input_dict)
-
-        if log:
-            logger.log("Computing statistics")
-        loss_after = self.optimizer.loss(input_val_dict=meta_op_input_dict)
+        loss_before, loss_after = self.optimizer.optimize_with_stats(input_val_dict=meta_op_input_dict,
+                                                                     compute_stats=log)
 
         if log:
             logger.logkv('LossBefore', loss_before)
-            logger.logkv('LossAfter', loss_after)
-
+            if loss_after is not None:
+                logger.logkv('LossAfter', loss_after)
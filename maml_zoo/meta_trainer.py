@@ -1,6 +1,8 @@
 import tensorflow as tf
 import numpy as np
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from maml_zoo.logger import logger
 
 
@@ -19,6 +21,11 @@ class Trainer(object):
         start_itr (int) : Number of iterations policy has already trained for, if reloading
         num_inner_grad_steps (int) : Number of inner steps per maml iteration
         sess (tf.Session) : current tf session (if we loaded policy, for example)
+        stream_sample_processing (bool) : whether to process the samples of each task in a thread pool as soon as
+                                          the task has finished sampling, while the other tasks keep sampling
+                                          (requires a MAMLSampler and a sample processor with process_task_samples)
+        n_processing_threads (int or None) : number of threads processing the streamed tasks - defaults to the
+                                             ThreadPoolExecutor default
     """
     def __init__(
             self,
@@ -31,6 +38,8 @@ class Trainer(object):
             start_itr=0,
             num_inner_grad_steps=1,
             sess=None,
+            stream_sample_processing=False,
+            n_processing_threads=None,
             ):
         self.algo = algo
         self.env = env
@@ -47,6 +56,14 @@ class Trainer(object):
         self.best_val_reward = -np.inf
         self.best_itr = None
 
+        self.stream_sample_processing = stream_sample_processing
+        self._processing_pool = None
+        if stream_sample_processing:
+            assert hasattr(sample_processor, 'process_task_samples'), 'sample processor cannot process single tasks'
+            assert not getattr(sample_processor, 'batched_task_baselines', False), \
+                'the baselines of a meta-batch cannot be fitted at once when streaming tasks'
+            self._processing_pool = ThreadPoolExecutor(max_workers=n_processing_threads)
+
     def train(self, tester):
         """
         Trains policy on env using algo
@@ -85,7 +102,12 @@ class Trainer(object):
 
                     logger.log("Obtaining samples...")
                     time_env_sampling_start = time.time()
-                    paths = self.sampler.obtain_samples(log=True, log_prefix='Step_%d-' % step)
+                    if self.stream_sample_processing:
+                        task_futures = OrderedDict()
+                        paths = self.sampler.obtain_samples(log=True, log_prefix='Step_%d-' % step,
+                                                            task_callback=self._submit_task_processing(task_futures))
+                    else:
+                        paths = self.sampler.obtain_samples(log=True, log_prefix='Step_%d-' % step)
                     list_sampling_time.append(time.time() - time_env_sampling_start)
                     all_paths.append(paths)
 
@@ -93,11 +115,19 @@ class Trainer(object):
 
                     logger.log("Processing samples...")
                     time_proc_samples_start = time.time()
-                    samples_data = self.sample_processor.process_samples(paths, log='all', log_prefix='Step_%d-' % step)
+                    if self.stream_sample_processing:
+                        # waits for the tasks still being processed and merges the processed samples of all tasks
+                        tasks_samples_data = [task_futures[task].result() for task in sorted(task_futures)]
+                        samples_data = self.sample_processor.merge_task_samples(tasks_samples_data, log='all',
+                                                                                log_prefix='Step_%d-' % step)
+                    else:
+                        samples_data = self.sample_processor.process_samples(paths, log='all',
+                                                                             log_prefix='Step_%d-' % step)
                     all_samples_data.append(samples_data)
                     list_proc_samples_time.append(time.time() - time_proc_samples_start)
 
-                    self.log_diagnostics(sum(list(paths.values()), []), prefix='Step_%d-' % step)
+                    if not getattr(self.sampler, 'padded_output', False):
+                        self.log_diagnostics(sum(list(paths.values()), []), prefix='Step_%d-' % step)
 
                     """ ------------------- Inner Policy Update --------------------"""
 
@@ -154,11 +184,23 @@ class Trainer(object):
                     print(delim, delim, delim)
 
 
+        if self._processing_pool is not None:
+            self._processing_pool.shutdown()
         logger.log("Training finished")
         logger.log(f"Best iteration is {self.best_itr} with reward {self.best_val_reward}")
         self.sess.close()
         return self.best_itr
 
+    def _submit_task_processing(self, task_futures):
+        """
+        Returns:
+            (callable) : task callback of the sampler that submits the processing of the paths of a task to the
+                         thread pool and stores the future in task_futures
+        """
+        def task_callback(task, paths):
+            task_futures[task] = self._processing_pool.submit(self.sample_processor.process_task_samples, paths)
+        return task_callback
+
     def get_itr_snapshot(self, itr):
         """
         Gets the current policy and env for storage
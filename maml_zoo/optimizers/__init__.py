@@ -1,3 +1,4 @@
 from maml_zoo.optimizers.base import Optimizer
-from maml_zoo.optimizers.conjugate_gradient_optimizer import ConjugateGradientOptimizer
+from maml_zoo.optimizers.input_binding import InputBindingPlan, BoundInputs
+from maml_zoo.optimizers.conjugate_gradient_optimizer import ConjugateGradientOptimizer, FiniteDifferenceHvp, PerlmutterHvp
 from maml_zoo.optimizers.maml_first_order_optimizer import MAMLFirstOrderOptimizer
\ No newline at end of file
@@ -1,4 +1,5 @@
 from maml_zoo import utils
+from maml_zoo.optimizers.input_binding import BoundInputs
 
 class Optimizer(object):
     def __init__(self):
@@ -39,4 +40,7 @@ class Optimizer(object):
         raise NotImplementedError
 
     def create_feed_dict(self, input_val_dict):
+        if isinstance(input_val_dict, BoundInputs):
+            # already matched with the placeholders by an InputBindingPlan
+            return input_val_dict.feed_dict
         return utils.create_feed_dict(placeholder_dict=self._input_ph_dict, value_dict=input_val_dict)
@@ -1,8 +1,8 @@
 from maml_zoo.logger import logger
 import numpy as np
 import tensorflow as tf
-from collections import OrderedDict
 from maml_zoo.optimizers.base import Optimizer
+from maml_zoo.optimizers.input_binding import BoundInputs
 
 
 class FiniteDifferenceHvp(Optimizer):
@@ -36,7 +36,7 @@ class FiniteDifferenceHvp(Optimizer):
             if grad is None:
                 constraint_grads[idx] = tf.zeros_like(param)
 
-        constraint_gradient = tf.concat([tf.reshape(grad, [-1]) for grad in constraint_grads], axis=0)
+        constraint_gradient = target.param_layout.flatten_sym(constraint_grads)
 
         self._constraint_gradient = constraint_gradient
 
@@ -68,19 +68,16 @@ class FiniteDifferenceHvp(Optimizer):
         """
         assert isinstance(x, np.ndarray)
 
-        param_vals = self._target.get_param_values().copy()
-        flat_param_vals = _flatten_params(param_vals)
+        flat_param_vals = self._target.get_flat_param_values()
         eps = self.base_eps
-        params_plus_eps_vals = _unflatten_params(flat_param_vals + eps * x, params_example=param_vals)
-        self._target.set_params(params_plus_eps_vals)
+        self._target.set_flat_params(flat_param_vals + eps * x)
         constraint_grad_plus_eps = self.constraint_gradient(input_val_dict)
-        self._target.set_params(param_vals)
+        self._target.set_flat_params(flat_param_vals)
 
         if self.symmetric:
-            params_minus_eps_vals = _unflatten_params(flat_param_vals - eps * x, params_example=param_vals)
-            self._target.set_params(params_minus_eps_vals)
+            self._target.set_flat_params(flat_param_vals - eps * x)
             constraint_grad_minus_eps = self.constraint_gradient(input_val_dict)
-            self._target.set_params(param_vals)
+            self._target.set_flat_params(flat_param_vals)
             hx = (constraint_grad_plus_eps - constraint_grad_minus_eps)/(2 * eps)
 
         else:
@@ -104,6 +101,84 @@ class FiniteDifferenceHvp(Optimizer):
         return evaluate_hessian
 
 
+class PerlmutterHvp(Optimizer):
+    """
+    Computes Hessian vector products symbolically, as the gradient of the inner product between the constraint
+    gradient and the vector (Pearlmutter, 1994). Unlike FiniteDifferenceHvp the parameters of the target are never
+    perturbed, and the product can be built into other graphs such as an in-graph conjugate gradient loop.
+    """
+    def __init__(self):
+        self._target = None
+        self.reg_coeff = None
+        self._constraint_gradient = None
+        self._input_ph_dict = None
+        self._x_ph = None
+        self._hx = None
+
+    def build_graph(self, constraint_obj, target, input_val_dict, reg_coeff):
+        """
+        Sets the objective function and target weights for the optimize function
+
+        Args:
+            constraint_obj (tf_op) : constraint objective
+            target (Policy) : Policy whose values we are optimizing over
+            input_val_dict (dict) : dict containing the placeholders of the computation graph of the constraint
+            reg_coeff (float): regularization coefficient
+        """
+        self._target = target
+        self.reg_coeff = reg_coeff
+        self._input_ph_dict = input_val_dict
+
+        self._constraint_gradient = _flat_gradient_sym(constraint_obj, target.param_layout)
+        self._x_ph = tf.compat.v1.placeholder(dtype=self._constraint_gradient.dtype,
+                                              shape=self._constraint_gradient.shape, name='hvp_x')
+        self._hx = self.hvp_sym(self._x_ph)
+
+    def hvp_sym(self, x):
+        """
+        Builds the second derivative of the constraint val in the direction of the vector x
+
+        Args:
+            x (tf.Tensor): flat vector indicating the direction on which the Hessian has to be computed
+
+        Returns:
+            (tf.Tensor): flat second derivative in the direction of x
+        """
+        return _flat_gradient_sym(tf.reduce_sum(input_tensor=self._constraint_gradient * tf.stop_gradient(x)),
+                                  self._target.param_layout)
+
+    def Hx(self, input_val_dict, x):
+        """
+        Compute the second derivative of the constraint val in the direction of the vector x
+        Args:
+            input_val_dict (dict): inputs needed to compute the gradient of the constraint objective
+            x (np.ndarray): vector indicating the direction on which the Hessian has to be computed
+
+        Returns: (np.ndarray): second derivative in the direction of x
+
+        """
+        assert isinstance(x, np.ndarray)
+        sess = tf.compat.v1.get_default_session()
+        feed_dict = self.create_feed_dict(input_val_dict)
+        feed_dict[self._x_ph] = x
+        return sess.run(self._hx, feed_dict)
+
+    def build_eval(self, inputs):
+        """
+        Build the Hessian evaluation function. It let's you evaluate the hessian of the constraint objective
+        in any direction.
+        Args:
+            inputs (dict): inputs needed to compute the gradient of the constraint objective
+
+        Returns:
+            (function): function that evaluates the Hessian of the constraint objective in the input direction
+        """
+        def evaluate_hessian(x):
+            return self.Hx(inputs, x) + self.reg_coeff * x
+
+        return evaluate_hessian
+
+
 class ConjugateGradientOptimizer(Optimizer):
     """
     Performs constrained optimization via line search. The search direction is computed using a conjugate gradient
@@ -115,6 +190,8 @@ class ConjugateGradientOptimizer(Optimizer):
         reg_coeff (float) : A small value so that A -> A + reg*I
         subsample_factor (float) : Subsampling factor to reduce samples when using "conjugate gradient. Since the
         computation time for the descent direction dominates, this can greatly reduce the overall computation time.
+        Only the Hessian vector products are subsampled, per task, and only for inputs given as BoundInputs - the
+        gradient and the line search always use the full batch.
         backtrack_ratio (float) : ratio for decreasing the step size for the line search
         max_backtracks (int) : maximum number of backtracking iterations for the line search
         debug_nan (bool) : if set to True, NanGuard will be added to the compilation, and ipdb will be invoked when
@@ -122,6 +199,10 @@ class ConjugateGradientOptimizer(Optimizer):
         accept_violation (bool) : whether to accept the descent step if it violates the line search condition after
         exhausting all backtracking budgets
         hvp_approach (obj) : Hessian vector product approach
+        in_graph_cg (bool) : whether to run the conjugate gradient iterations in the graph (tf.while_loop), so that
+        the descent direction is computed in a single session run. Requires a symbolic hvp_approach (PerlmutterHvp)
+        line_search_batch_size (int or None) : number of candidate steps evaluated per session run by the batched
+        line search (see build_graph) - None evaluates all the candidates at once
     """
 
     def __init__(
@@ -134,6 +215,8 @@ class ConjugateGradientOptimizer(Optimizer):
             debug_nan=False,
             accept_violation=False,
             hvp_approach=FiniteDifferenceHvp(),
+            in_graph_cg=False,
+            line_search_batch_size=None,
             ):
 
         self._cg_iters = cg_iters
@@ -148,12 +231,19 @@ class ConjugateGradientOptimizer(Optimizer):
         self._debug_nan = debug_nan
         self._accept_violation = accept_violation
         self._hvp_approach = hvp_approach
+        self._in_graph_cg = in_graph_cg
+        self._line_search_batch_size = line_search_batch_size
         self._loss = None
         self._gradient = None
+        self._descent_direction = None
+        self._descent_direction_hvp = None
+        self._candidate_params_ph = None
+        self._candidate_losses = None
+        self._candidate_constraint_vals = None
         self._constraint_objective = None
         self._input_ph_dict = None
 
-    def build_graph(self, loss, target, input_ph_dict, leq_constraint):
+    def build_graph(self, loss, target, input_ph_dict, leq_constraint, line_search=None):
         """
         Sets the objective function and target weights for the optimize function
 
@@ -163,6 +253,9 @@ class ConjugateGradientOptimizer(Optimizer):
             inputs (list) : tuple of tf.placeholders for input data which may be subsampled. The first dimension corresponds to the number of data points
             extra_inputs (list) : tuple of tf.placeholders for hyperparameters (e.g. learning rate, if annealed)
             leq_constraint (tuple) : A constraint provided as a tuple (f, epsilon), of the form f(*inputs) <= epsilon.
+            line_search (tuple or None) : graph for the batched line search, provided as a tuple (params_ph, losses,
+            constraint_vals) where params_ph takes a batch of flat candidate params of the target and losses and
+            constraint_vals are the values of the loss and the constraint of each candidate
         """
         assert isinstance(loss, tf.Tensor)
         assert hasattr(target, 'get_params')
@@ -185,10 +278,23 @@ class ConjugateGradientOptimizer(Optimizer):
         for idx, (grad, param) in enumerate(zip(grads, params)):
             if grad is None:
                 grads[idx] = tf.zeros_like(param)
-        gradient = tf.concat([tf.reshape(grad, [-1]) for grad in grads], axis=0)
+        gradient = target.param_layout.flatten_sym(grads)
 
         self._gradient = gradient
 
+        if line_search is not None:
+            self._candidate_params_ph, self._candidate_losses, self._candidate_constraint_vals = line_search
+
+        if self._in_graph_cg:
+            assert hasattr(self._hvp_approach, 'hvp_sym'), "the in-graph conjugate gradient needs a symbolic hvp"
+
+            def f_Ax(x):
+                return self._hvp_approach.hvp_sym(x) + self._reg_coeff * x
+
+            self._descent_direction = conjugate_gradients_sym(f_Ax, gradient, cg_iters=self._cg_iters)
+            self._descent_direction_hvp = tf.reduce_sum(input_tensor=self._descent_direction *
+                                                        f_Ax(self._descent_direction))
+
     def loss(self, input_val_dict):
         """
         Computes the value of the loss for given inputs
@@ -250,21 +356,42 @@ class ConjugateGradientOptimizer(Optimizer):
 
         """
         logger.log("Start CG optimization")
+        hvp_input_val_dict = self._hvp_inputs(input_val_dict)
+
+        if self._in_graph_cg and hvp_input_val_dict is input_val_dict:
+            logger.log("computing loss before and descent direction")
+            sess = tf.compat.v1.get_default_session()
+            loss_before, descent_direction, descent_direction_hvp = sess.run(
+                [self._loss, self._descent_direction, self._descent_direction_hvp],
+                feed_dict=self.create_feed_dict(input_val_dict))
+        elif self._in_graph_cg:
+            logger.log("computing loss before and gradient")
+            sess = tf.compat.v1.get_default_session()
+            loss_before, gradient = sess.run([self._loss, self._gradient],
+                                             feed_dict=self.create_feed_dict(input_val_dict))
+
+            logger.log("computing descent direction")
+            # the full batch gradient is fed in place of the gradient of the subsampled inputs
+            hvp_feed_dict = dict(self.create_feed_dict(hvp_input_val_dict))
+            hvp_feed_dict[self._gradient] = gradient
+            descent_direction, descent_direction_hvp = sess.run(
+                [self._descent_direction, self._descent_direction_hvp], feed_dict=hvp_feed_dict)
+        else:
+            logger.log("computing loss before")
+            loss_before = self.loss(input_val_dict)
 
-        logger.log("computing loss before")
-        loss_before = self.loss(input_val_dict)
-
-        logger.log("performing update")
+            logger.log("performing update")
 
-        logger.log("computing gradient")
-        gradient = self.gradient(input_val_dict)
-        logger.log("gradient computed")
+            logger.log("computing gradient")
+            gradient = self.gradient(input_val_dict)
+            logger.log("gradient computed")
 
-        logger.log("computing descent direction")
-        Hx = self._hvp_approach.build_eval(input_val_dict)
-        descent_direction = conjugate_gradients(Hx, gradient, cg_iters=self._cg_iters)
+            logger.log("computing descent direction")
+            Hx = self._hvp_approach.build_eval(hvp_input_val_dict)
+            descent_direction = conjugate_gradients(Hx, gradient, cg_iters=self._cg_iters)
+            descent_direction_hvp = descent_direction.dot(Hx(descent_direction))
 
-        rat = 1. / (descent_direction.dot(Hx(descent_direction)) + 1e-8)
+        rat = 1. / (descent_direction_hvp + 1e-8)
         initial_step_size = np.sqrt(2.0 * self._max_constraint_val * rat)
 
         if np.isnan(initial_step_size):
@@ -274,19 +401,24 @@ class ConjugateGradientOptimizer(Optimizer):
         initial_descent_step = initial_step_size * descent_direction
         logger.log("descent direction computed")
 
-        prev_params = self._target.get_param_values()
-        prev_params_values = _flatten_params(prev_params)
+        prev_params_values = self._target.get_flat_param_values()
 
         loss, constraint_val, n_iter, violated = 0, 0, 0, False
-        for n_iter, ratio in enumerate(self._backtrack_ratio ** np.arange(self._max_backtracks)):
-            cur_step = ratio * initial_descent_step
-            cur_params_values = prev_params_values - cur_step
-            cur_params = _unflatten_params(cur_params_values, params_example=prev_params)
-            self._target.set_params(cur_params)
+        ratios = self._backtrack_ratio ** np.arange(self._max_backtracks)
+        if self._candidate_params_ph is not None:
+            n_iter, loss, constraint_val = self._batched_line_search(input_val_dict, prev_params_values,
+                                                                     initial_descent_step, ratios, loss_before)
+            cur_params_values = prev_params_values - ratios[n_iter] * initial_descent_step
+            self._target.set_flat_params(cur_params_values)
+        else:
+            for n_iter, ratio in enumerate(ratios):
+                cur_step = ratio * initial_descent_step
+                cur_params_values = prev_params_values - cur_step
+                self._target.set_flat_params(cur_params_values)
 
-            loss, constraint_val = self.loss(input_val_dict), self.constraint_val(input_val_dict)
-            if loss < loss_before and constraint_val <= self._max_constraint_val:
-                break
+                loss, constraint_val = self.loss(input_val_dict), self.constraint_val(input_val_dict)
+                if loss < loss_before and constraint_val <= self._max_constraint_val:
+                    break
 
         """ ------------------- Logging Stuff -------------------------- """
         if np.isnan(loss):
@@ -304,26 +436,58 @@ class ConjugateGradientOptimizer(Optimizer):
 
         if violated and not self._accept_violation:
             logger.log("Line search condition violated. Rejecting the step!")
-            self._target.set_params(prev_params)
+            self._target.set_flat_params(prev_params_values)
 
         logger.log("backtrack iters: %d" % n_iter)
         logger.log("computing loss after")
         logger.log("optimization finished")
 
+    def _hvp_inputs(self, input_val_dict):
+        """
+        Returns the inputs of the Hessian vector products - a per-task subsample of the inputs if subsample_factor < 1
+        """
+        if self._subsample_factor < 1 and isinstance(input_val_dict, BoundInputs) and input_val_dict.can_subsample:
+            return input_val_dict.subsample(self._subsample_factor)
+        return input_val_dict
+
+    def _batched_line_search(self, input_val_dict, prev_params_values, descent_step, ratios, loss_before):
+        """
+        Evaluates the loss and the constraint of the candidate steps, line_search_batch_size candidates per session
+        run, until a candidate satisfies the line search conditions
+
+        Args:
+            input_val_dict (dict): inputs for the optimization
+            prev_params_values (np.ndarray): flat params before the step
+            descent_step (np.ndarray): flat full step
+            ratios (np.ndarray): backtracking ratios of the candidate steps
+            loss_before (float): loss before the step
 
-def _unflatten_params(flat_params, params_example):
-    unflat_params = []
-    idx = 0
-    for key, param in params_example.items():
-        size_param = np.prod(param.shape)
-        reshaped_param = np.reshape(flat_params[idx:idx+size_param], newshape=param.shape)
-        unflat_params.append((key, reshaped_param))
-        idx += size_param
-    return OrderedDict(unflat_params)
+        Returns:
+            (int) : index of the first candidate that satisfies the conditions, or of the last candidate
+            (float) : loss of the candidate
+            (float) : constraint value of the candidate
+        """
+        sess = tf.compat.v1.get_default_session()
+        feed_dict = dict(self.create_feed_dict(input_val_dict))
+        batch_size = self._line_search_batch_size or len(ratios)
 
+        losses, constraint_vals = None, None
+        for start in range(0, len(ratios), batch_size):
+            batch_ratios = ratios[start:start + batch_size]
+            feed_dict[self._candidate_params_ph] = prev_params_values[None, :] - \
+                                                   batch_ratios[:, None] * descent_step[None, :]
+            losses, constraint_vals = sess.run([self._candidate_losses, self._candidate_constraint_vals], feed_dict)
+            accepted = np.nonzero((losses < loss_before) & (constraint_vals <= self._max_constraint_val))[0]
+            if len(accepted) > 0:
+                return start + accepted[0], losses[accepted[0]], constraint_vals[accepted[0]]
+        return len(ratios) - 1, losses[-1], constraint_vals[-1]
 
-def _flatten_params(params):
-    return np.concatenate([param.reshape(-1) for param in params.values()])
+
+def _flat_gradient_sym(ys, param_layout):
+    params = list(param_layout.params.values())
+    grads = tf.gradients(ys=ys, xs=params)
+    grads = [tf.zeros_like(param) if grad is None else grad for grad, param in zip(grads, params)]
+    return param_layout.flatten_sym(grads)
 
 
 def conjugate_gradients(f_Ax, b, cg_iters=10, verbose=False, residual_tol=1e-10):
@@ -359,3 +523,34 @@ def conjugate_gradients(f_Ax, b, cg_iters=10, verbose=False, residual_tol=1e-10)
         print(fmtstr % (i + 1, rdotr, np.linalg.norm(x)))
 
     return x
+
+
+def conjugate_gradients_sym(f_Ax, b, cg_iters=10, residual_tol=1e-10):
+    """
+    Same as conjugate_gradients, but built as a tf.while_loop
+
+    Args:
+        f_Ax (function) : function that builds the product of the matrix with a flat vector
+        b (tf.Tensor) : flat right hand side
+        cg_iters (int) : maximum number of iterations
+        residual_tol (float) : tolerance on the squared norm of the residual for stopping early
+
+    Returns:
+        (tf.Tensor) : the solution x of Ax = b
+    """
+    def cond(i, x, r, p, rdotr):
+        return tf.logical_and(i < cg_iters, rdotr >= residual_tol)
+
+    def body(i, x, r, p, rdotr):
+        z = f_Ax(p)
+        v = rdotr / tf.reduce_sum(input_tensor=p * z)
+        x += v * p
+        r -= v * z
+        newrdotr = tf.reduce_sum(input_tensor=r * r)
+        mu = newrdotr / rdotr
+        p = r + mu * p
+        return i + 1, x, r, p, newrdotr
+
+    _, x, _, _, _ = tf.compat.v1.while_loop(cond, body, [tf.constant(0), tf.zeros_like(b), b, b,
+                                                         tf.reduce_sum(input_tensor=b * b)])
+    return x
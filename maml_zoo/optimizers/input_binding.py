@@ -0,0 +1,187 @@
+from maml_zoo import utils
+from collections import OrderedDict
+import tensorflow as tf
+import numpy as np
+
+
+def padding_mask(samples_data_meta_batch):
+    """
+    Args:
+        samples_data_meta_batch (list) : list of dicts containing the processed data corresponding to each meta-task
+
+    Returns:
+        (ndarray) : mask of the valid samples when the data of the tasks is padded to the same length - shape:
+                    (meta_batch_size, max_samples)
+    """
+    n_samples = np.array([len(samples_data['observations']) for samples_data in samples_data_meta_batch])
+    return (np.arange(np.max(n_samples))[None, :] < n_samples[:, None]).astype(np.float32)
+
+
+def subsample_samples_data(all_samples_data, subsample_factor):
+    """
+    Draws a random subset of the samples of each task and step, without replacement. Only the valid samples of a
+    task are drawn from, so that the padding of the subsampled data is derived from the subsampled lengths.
+
+    Args:
+        all_samples_data (list) : list (one per step) of lists (len = meta_batch_size) containing dicts that hold
+                                  processed samples data
+        subsample_factor (float) : fraction of the samples of each task to keep - at least one sample is kept
+
+    Returns:
+        (list) : subsampled data with the same structure
+    """
+    subsampled_data = []
+    for samples_data_meta_batch in all_samples_data:
+        subsampled_data.append([])
+        for samples_data in samples_data_meta_batch:
+            n_samples = len(samples_data['observations'])
+            n_subsamples = max(1, int(round(n_samples * subsample_factor)))
+            idx = np.sort(np.random.choice(n_samples, n_subsamples, replace=False))
+            subsampled_data[-1].append(_take_samples(samples_data, idx, n_samples))
+    return subsampled_data
+
+
+def _take_samples(value, idx, n_samples):
+    if isinstance(value, dict):
+        return dict([(key, _take_samples(val, idx, n_samples)) for key, val in value.items()])
+    if isinstance(value, np.ndarray) and value.ndim > 0 and len(value) == n_samples:
+        return value[idx]
+    return value
+
+
+class BoundInputs(object):
+    """
+    Inputs of a graph that are already matched with their placeholders. Can be passed to the optimizers in place of
+    an input_val_dict.
+
+    Args:
+        feed_dict (dict) : feed dict of the inputs - empty for inputs that are staged in variables
+        plan (InputBindingPlan or None) : plan that bound the inputs
+        all_samples_data (list or None) : samples data the inputs were bound from
+        extra_inputs (dict or None) : extra inputs the inputs were bound with
+    """
+    def __init__(self, feed_dict, plan=None, all_samples_data=None, extra_inputs=None):
+        self.feed_dict = feed_dict
+        self._plan = plan
+        self._all_samples_data = all_samples_data
+        self._extra_inputs = extra_inputs
+
+    @property
+    def can_subsample(self):
+        return self._plan is not None
+
+    def subsample(self, subsample_factor):
+        """
+        Binds a random subset of the samples of each task (see subsample_samples_data). The subsampled inputs are
+        always fed, so that the staged inputs keep holding the full batch.
+
+        Args:
+            subsample_factor (float) : fraction of the samples of each task to keep
+
+        Returns:
+            (BoundInputs) : the bound subsampled inputs
+        """
+        assert self.can_subsample
+        return self._plan.bind(subsample_samples_data(self._all_samples_data, subsample_factor),
+                               extra_inputs=self._extra_inputs, stage=False)
+
+
+class InputBindingPlan(object):
+    """
+    Compiled mapping from the processed samples data to the input placeholders of a graph. The placeholder names
+    ('<prefix>_task<i>_<key>' or '<prefix>_task<i>_<key>/<info_key>', or '<prefix>_<key>' for padded inputs) are
+    matched once when the plan is built, so that binding the data of an iteration just walks a list of slots instead
+    of building string-keyed dicts.
+
+    Placeholders that read staged inputs (see MAMLAlgo.stage_inputs) are not fed. Their values are assigned once per
+    bind to the variables they read, so that all session.run calls on the bound inputs reuse them without refeeding.
+
+    Args:
+        input_ph_dict (dict) : dict of the input placeholders of the graph
+        prefixes (list) : prefix of the placeholders of each step of the samples data, e.g. ['step0', 'step1']
+        keys (list) : keys of the processed samples data that are inputs of the graph
+        meta_batch_size (int) : number of meta tasks
+        padded (bool) : whether the data of all tasks is padded into one placeholder per key and step
+        staged_inputs (dict or None) : dict mapping placeholders to the variables holding their staged values
+    """
+    def __init__(self, input_ph_dict, prefixes, keys, meta_batch_size, padded=False, staged_inputs=None):
+        self._n_steps = len(prefixes)
+        self._slots = []  # (placeholder, step, task, key, info_key) - task is None for padded inputs
+        self._mask_slots = []  # (placeholder, step)
+
+        # group the placeholders of dict-valued data (e.g. agent_infos/mean) under the name of the data
+        phs_by_name = OrderedDict()
+        for ph_name, ph in input_ph_dict.items():
+            name, _, info_key = ph_name.partition('/')
+            phs_by_name.setdefault(name, []).append((ph_name, ph, info_key or None))
+
+        bound_names = set()
+        for step, prefix in enumerate(prefixes):
+            name_prefixes = [(None, prefix)] if padded else [(task, '%s_task%i' % (prefix, task))
+                                                             for task in range(meta_batch_size)]
+            for task, name_prefix in name_prefixes:
+                for key in keys:
+                    for ph_name, ph, info_key in phs_by_name.get('%s_%s' % (name_prefix, key), []):
+                        self._slots.append((ph, step, task, key, info_key))
+                        bound_names.add(ph_name)
+
+            mask_name = '%s_mask' % prefix
+            if padded and mask_name in input_ph_dict and mask_name not in bound_names:
+                self._mask_slots.append((input_ph_dict[mask_name], step))
+                bound_names.add(mask_name)
+
+        # the remaining placeholders are hyperparameters and the like, which have to be given as extra inputs
+        self.extra_input_phs = OrderedDict([(name, ph) for name, ph in input_ph_dict.items()
+                                            if name not in bound_names])
+
+        self._stage_phs, self._stage_op = OrderedDict(), None
+        staged_inputs = staged_inputs or dict()
+        staged_slots = [slot for slot in self._slots + self._mask_slots if slot[0] in staged_inputs]
+        if staged_slots:
+            assign_ops = []
+            for slot in staged_slots:
+                ph = slot[0]
+                self._stage_phs[ph] = tf.compat.v1.placeholder(dtype=ph.dtype, shape=ph.shape)
+                assign_ops.append(tf.compat.v1.assign(staged_inputs[ph], self._stage_phs[ph], validate_shape=False))
+            self._stage_op = tf.group(*assign_ops)
+
+    def bind(self, all_samples_data, extra_inputs=None, stage=True):
+        """
+        Matches the samples data with the placeholders and stages the inputs that are held by variables
+
+        Args:
+            all_samples_data (list) : list (one per prefix) of lists (len = meta_batch_size) containing dicts that
+                                      hold processed samples data
+            extra_inputs (dict or None) : values of the placeholders that are not filled from the samples data
+            stage (bool) : whether to stage the inputs that are held by variables - if False they are fed instead
+
+        Returns:
+            (BoundInputs) : the bound inputs
+        """
+        assert len(all_samples_data) == self._n_steps
+        values = []
+        for ph, step, task, key, info_key in self._slots:
+            if task is None:
+                data = [samples_data[key] for samples_data in all_samples_data[step]]
+                value = utils.pad_and_stack([d[info_key] for d in data] if info_key is not None else data)
+            else:
+                value = all_samples_data[step][task][key]
+                if info_key is not None:
+                    value = value[info_key]
+            values.append((ph, utils.as_placeholder_dtype(ph, value)))
+        for ph, step in self._mask_slots:
+            values.append((ph, padding_mask(all_samples_data[step])))
+
+        if not stage:
+            feed_dict = dict(values)
+        else:
+            feed_dict = dict([(ph, value) for ph, value in values if ph not in self._stage_phs])
+        if stage and self._stage_op is not None:
+            stage_feed_dict = dict([(self._stage_phs[ph], value) for ph, value in values if ph in self._stage_phs])
+            tf.compat.v1.get_default_session().run(self._stage_op, feed_dict=stage_feed_dict)
+
+        extra_inputs = extra_inputs or dict()
+        assert set(self.extra_input_phs.keys()) <= set(extra_inputs.keys()), \
+            "extra inputs must provide the values of all placeholders that are not filled from the samples data"
+        feed_dict.update([(ph, extra_inputs[name]) for name, ph in self.extra_input_phs.items()])
+        return BoundInputs(feed_dict, plan=self, all_samples_data=all_samples_data, extra_inputs=extra_inputs)
@@ -1,6 +1,7 @@
 from maml_zoo.logger import logger
 from maml_zoo.optimizers.base import Optimizer
 import tensorflow as tf
+import numpy as np
 
 class MAMLFirstOrderOptimizer(Optimizer):
     """
@@ -13,9 +14,12 @@ class MAMLFirstOrderOptimizer(Optimizer):
         max_epochs: number of maximum epochs for training
         tolerance (float): tolerance for early stopping. If the loss fucntion decreases less than
         the specified tolerance after an epoch, then the training stops.
-        num_minibatches (int): number of mini-batches for performing the gradient step. The mini-batch size is
-        batch size//num_minibatches.
+        num_minibatches (int): number of chunks of tasks the gradient step is split into. The gradients of the chunks
+        are accumulated in variables and applied in one update, so that only the graph of one chunk is evaluated at a
+        time. Requires the per-task losses to be given to build_graph.
         verbose (bool): Whether to log or not the optimization process
+        loss_after_every (int): optimize_with_stats computes the loss after the update on every loss_after_every-th
+        call - 0 never computes it
 
     """
 
@@ -27,7 +31,8 @@ class MAMLFirstOrderOptimizer(Optimizer):
             max_epochs=1,
             tolerance=1e-6,
             num_minibatches=1,
-            verbose=False):
+            verbose=False,
+            loss_after_every=1):
 
         self._target = None
         if tf_optimizer_args is None:
@@ -37,14 +42,21 @@ class MAMLFirstOrderOptimizer(Optimizer):
         self._tf_optimizer = tf_optimizer_cls(**tf_optimizer_args)
         self._max_epochs = max_epochs
         self._tolerance = tolerance
-        self._num_minibatches = num_minibatches  # Unused
+        self._num_minibatches = num_minibatches
         self._verbose = verbose
+        self._loss_after_every = loss_after_every
+        self._n_optimize_calls = 0
         self._all_inputs = None
         self._train_op = None
         self._loss = None
         self._input_ph_dict = None
+        self._chunk_losses = None
+        self._accumulate_ops = None
+        self._reset_accumulators_op = None
+        self._task_batched_phs = None
+        self._n_tasks_ph = None
 
-    def build_graph(self, loss, target, input_ph_dict, *args, **kwargs):
+    def build_graph(self, loss, target, input_ph_dict, task_losses=None, task_batched_phs=None, *args, **kwargs):
         """
         Sets the objective function and target weights for the optimize function
 
@@ -52,6 +64,11 @@ class MAMLFirstOrderOptimizer(Optimizer):
             loss (tf_op) : minimization objective
             target (Policy) : Policy whose values we are optimizing over
             input_ph_dict (dict) : dict containing the placeholders of the computation graph corresponding to loss
+            task_losses (list or tf.Tensor or None) : losses of the tasks whose mean is the objective - either a list
+                                                      with one scalar per task or a tensor of shape (n_tasks,)
+            task_batched_phs (list or None) : placeholders whose first axis holds the tasks - if given, the chunks
+                                              of tasks are evaluated by slicing their values and task_losses must
+                                              be a tensor
         """
         assert isinstance(loss, tf.Tensor)
         assert hasattr(target, 'get_params')
@@ -60,7 +77,57 @@ class MAMLFirstOrderOptimizer(Optimizer):
         self._target = target
         self._input_ph_dict = input_ph_dict
         self._loss = loss
-        self._train_op = self._tf_optimizer.minimize(loss, var_list=target.get_params())
+        if self._num_minibatches > 1:
+            assert task_losses is not None, "accumulating the gradient over chunks of tasks requires the task losses"
+            self._build_accumulation_graph(task_losses, task_batched_phs)
+        else:
+            self._train_op = self._tf_optimizer.minimize(loss, var_list=target.get_params())
+
+    def _build_accumulation_graph(self, task_losses, task_batched_phs):
+        """
+        Builds the ops that compute the loss of a chunk of tasks and add its gradient to the accumulators, and the
+        train op that applies the accumulated gradient
+        """
+        params = list(self._target.get_params().values())
+
+        if task_batched_phs is None:
+            chunks = np.array_split(np.arange(len(task_losses)), min(self._num_minibatches, len(task_losses)))
+            self._chunk_losses = [tf.add_n([task_losses[i] for i in chunk]) / len(task_losses) for chunk in chunks]
+        else:
+            # the same ops are run on each chunk, with the values of the task batched placeholders sliced
+            self._task_batched_phs = list(task_batched_phs)
+            self._n_tasks_ph = tf.compat.v1.placeholder(dtype=tf.float32, shape=[], name='n_tasks')
+            self._chunk_losses = [tf.reduce_sum(input_tensor=task_losses) / self._n_tasks_ph]
+
+        accumulators = [tf.compat.v1.Variable(tf.zeros(param.shape, dtype=param.dtype), trainable=False,
+                                              name='grad_accumulator') for param in params]
+        self._reset_accumulators_op = tf.group(*[tf.compat.v1.assign(accumulator, tf.zeros_like(accumulator))
+                                                 for accumulator in accumulators])
+        self._accumulate_ops = []
+        for chunk_loss in self._chunk_losses:
+            grads = tf.gradients(ys=chunk_loss, xs=params)
+            self._accumulate_ops.append(tf.group(*[tf.compat.v1.assign_add(accumulator, grad)
+                                                   for accumulator, grad in zip(accumulators, grads)]))
+        self._train_op = self._tf_optimizer.apply_gradients(
+            [(accumulator.read_value(), param) for accumulator, param in zip(accumulators, params)])
+
+    def _chunk_runs(self, feed_dict):
+        """
+        Yields the loss op, the accumulation op and the feed dict of each chunk of tasks
+        """
+        if self._task_batched_phs is None:
+            for chunk_loss, accumulate_op in zip(self._chunk_losses, self._accumulate_ops):
+                yield chunk_loss, accumulate_op, feed_dict
+            return
+
+        assert all([ph in feed_dict for ph in self._task_batched_phs]), \
+            "the inputs of chunks of tasks are sliced from the feed dict and can't be staged"
+        n_tasks = len(feed_dict[self._task_batched_phs[0]])
+        for chunk in np.array_split(np.arange(n_tasks), min(self._num_minibatches, n_tasks)):
+            chunk_feed_dict = dict(feed_dict)
+            chunk_feed_dict.update([(ph, feed_dict[ph][chunk[0]:chunk[-1] + 1]) for ph in self._task_batched_phs])
+            chunk_feed_dict[self._n_tasks_ph] = n_tasks
+            yield self._chunk_losses[0], self._accumulate_ops[0], chunk_feed_dict
 
     def loss(self, input_val_dict):
         """
@@ -75,8 +142,13 @@ class MAMLFirstOrderOptimizer(Optimizer):
         """
         sess = tf.compat.v1.get_default_session()
         feed_dict = self.create_feed_dict(input_val_dict)
-        loss = sess.run(self._loss, feed_dict=feed_dict)
-        return loss
+        return self._compute_loss(sess, feed_dict)
+
+    def _compute_loss(self, sess, feed_dict):
+        if self._chunk_losses is None:
+            return sess.run(self._loss, feed_dict=feed_dict)
+        return sum([sess.run(chunk_loss, feed_dict=chunk_feed_dict)
+                    for chunk_loss, _, chunk_feed_dict in self._chunk_runs(feed_dict)])
 
     def optimize(self, input_val_dict):
         """
@@ -92,7 +164,36 @@ class MAMLFirstOrderOptimizer(Optimizer):
 
         sess = tf.compat.v1.get_default_session()
         feed_dict = self.create_feed_dict(input_val_dict)
+        return self._run_epochs(sess, feed_dict)
+
+    def optimize_with_stats(self, input_val_dict, compute_stats=True):
+        """
+        Carries out the optimization step and computes the loss before and after it. The inputs are converted into a
+        feed dict once and shared by all the session runs, and the loss before optimization is fetched together with
+        the first update. The loss after optimization is the only extra forward pass - it is skipped when
+        compute_stats is False and on the calls that are not on the loss_after_every cadence.
+
+        Args:
+            input_val_dict (dict): dict containing the values to be fed into the computation graph
+            compute_stats (bool): whether the loss after optimization may be computed on this call
+
+        Returns:
+            (float) loss before optimization
+            (float or None) loss after optimization - None if it has been skipped
+
+        """
+        sess = tf.compat.v1.get_default_session()
+        feed_dict = self.create_feed_dict(input_val_dict)
+
+        loss_before_opt = self._run_epochs(sess, feed_dict)
+
+        loss_after_opt = None
+        if compute_stats and self._loss_after_every and self._n_optimize_calls % self._loss_after_every == 0:
+            loss_after_opt = self._compute_loss(sess, feed_dict)
+        self._n_optimize_calls += 1
+        return loss_before_opt, loss_after_opt
 
+    def _run_epochs(self, sess, feed_dict):
         # Overload self._batch size
         # dataset = MAMLBatchDataset(inputs, num_batches=self._batch_size, extra_inputs=extra_inputs,
         # meta_batch_size=self.meta_batch_size, num_grad_updates=self.num_grad_updates)
@@ -103,8 +204,15 @@ class MAMLFirstOrderOptimizer(Optimizer):
             if self._verbose:
                 logger.log("Epoch %d" % epoch)
 
-            loss, _ = sess.run([self._loss, self._train_op], feed_dict)
-            if not loss_before_opt:
+            if self._chunk_losses is None:
+                loss, _ = sess.run([self._loss, self._train_op], feed_dict)
+            else:
+                sess.run(self._reset_accumulators_op)
+                loss = 0.
+                for chunk_loss, accumulate_op, chunk_feed_dict in self._chunk_runs(feed_dict):
+                    loss += sess.run([chunk_loss, accumulate_op], chunk_feed_dict)[0]
+                sess.run(self._train_op)
+            if loss_before_opt is None:
                 loss_before_opt = loss
 
             # if self._verbose:
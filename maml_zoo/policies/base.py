@@ -1,6 +1,7 @@
 from maml_zoo.utils.utils import remove_scope_from_name
-from maml_zoo.utils import Serializable
+from maml_zoo.utils import Serializable, ParamLayout
 import tensorflow as tf
+import numpy as np
 from collections import OrderedDict
 
 
@@ -45,8 +46,7 @@ class Policy(Serializable):
 
         self._dist = None
         self.policy_params = None
-        self._assign_ops = None
-        self._assign_phs = None
+        self._param_layout = None
 
     def build_graph(self):
         """
@@ -170,15 +170,31 @@ class Policy(Serializable):
         """
         return self.policy_params
 
+    @property
+    def param_layout(self):
+        """
+        Returns:
+            (ParamLayout) : layout of the trainable weights of the network in one flat vector
+        """
+        if self._param_layout is None:
+            self._param_layout = ParamLayout(self.get_params())
+        return self._param_layout
+
     def get_param_values(self):
         """
-        Gets a list of all the current weights in the network (in original code it is flattened, why?)
+        Gets the current weights of the network, fetched at once as views of one flat buffer
 
         Returns:
-            (list) : list of values for parameters
+            (OrderedDict) : dict of variable names and corresponding parameter values
         """
-        param_values = tf.compat.v1.get_default_session().run(self.policy_params)
-        return param_values
+        return self.param_layout.unflatten(self.get_flat_param_values())
+
+    def get_flat_param_values(self):
+        """
+        Returns:
+            (ndarray) : current weights of the network in one flat float32 vector (see param_layout)
+        """
+        return self.param_layout.get_flat()
 
     def set_params(self, policy_params):
         """
@@ -189,18 +205,16 @@ class Policy(Serializable):
         """
         assert all([k1 == k2 for k1, k2 in zip(self.get_params().keys(), policy_params.keys())]), \
             "parameter keys must match with variable"
+        self.set_flat_params(self.param_layout.flatten(policy_params))
 
-        if self._assign_ops is None:
-            assign_ops, assign_phs = [], []
-            for var in self.get_params().values():
-                assign_placeholder = tf.compat.v1.placeholder(dtype=var.dtype)
-                assign_op = tf.compat.v1.assign(var, assign_placeholder)
-                assign_ops.append(assign_op)
-                assign_phs.append(assign_placeholder)
-            self._assign_ops = assign_ops
-            self._assign_phs = assign_phs
-        feed_dict = dict(zip(self._assign_phs, policy_params.values()))
-        tf.compat.v1.get_default_session().run(self._assign_ops, feed_dict=feed_dict)
+    def set_flat_params(self, flat_params):
+        """
+        Sets the parameters for the graph with a single assign op
+
+        Args:
+            flat_params (ndarray): flat vector of the parameter values (see param_layout)
+        """
+        self.param_layout.set_flat(flat_params)
 
     def __getstate__(self):
         state = {
@@ -216,6 +230,19 @@ class Policy(Serializable):
 
 
 class MetaPolicy(Policy):
+    """
+    Policy with a pre-update policy and meta_batch_size post-update (task specific) policies
+
+    Note:
+        by default, the parameters of the post-update policies are stored in numpy arrays and fed into the
+        lightweight policy graph through tf.placeholders. If resident_task_params is set, the post-update parameters
+        are instead held by non-trainable per-task tf.Variables that the policy graph reads directly. They are then
+        updated in-graph (see assign_task_parameters_sym) and no parameters need to be fed.
+        If policies_params_stacked_phs is set, the parameters of all tasks are fed through one placeholder per
+        variable with a leading task dimension and policies_params_phs holds the per-task slices of them.
+    """
+    resident_task_params = False
+    params_version = 0  # incremented whenever the params of the current policies change (e.g. for sampler workers)
 
     def __init__(self, *args, **kwargs):
         super(MetaPolicy, self).__init__(*args, **kwargs)
@@ -223,7 +250,14 @@ class MetaPolicy(Policy):
         self.policies_params_vals = None
         self.policy_params_keys = None
         self.policies_params_phs = None
+        self.policies_params_stacked_phs = None
         self.meta_batch_size = None
+        self._stacked_params_vals = None
+
+        self._resident_task_vars = OrderedDict()  # task variable -> (pre-update variable, task param tensors)
+        self._copy_task_params_op = None
+        self._task_params_assign_op = None
+        self._task_params_assign_phs = None
 
     def build_graph(self):
         """
@@ -236,8 +270,27 @@ class MetaPolicy(Policy):
         Switches get_action to pre-update policy
         """
         self._pre_update_mode = True
-        # replicate pre-update policy params meta_batch_size times
-        self.policies_params_vals = [self.get_param_values() for _ in range(self.meta_batch_size)]
+        self.params_version += 1
+        if self.resident_task_params:
+            # copy the pre-update params into the task variables in-graph
+            if self._copy_task_params_op is None:
+                self._copy_task_params_op = self._build_copy_task_params_op()
+            tf.compat.v1.get_default_session().run(self._copy_task_params_op)
+            return
+        # replicate the pre-update policy params meta_batch_size times, from a single fetch and without copies
+        flat_params = self.get_flat_param_values()
+        self.policies_params_vals = [self.param_layout.unflatten(flat_params)] * self.meta_batch_size
+        self._stacked_params_vals = self.param_layout.unflatten(self.param_layout.replicate(flat_params,
+                                                                                           self.meta_batch_size))
+
+    def switch_to_post_update(self):
+        """
+        Switches get_action to the post-update policies - only valid if the task parameters have been assigned
+        in-graph to the resident task variables
+        """
+        assert self.resident_task_params
+        self._pre_update_mode = False
+        self.params_version += 1
 
     def get_actions(self, observations):
         if self._pre_update_mode:
@@ -265,24 +318,136 @@ class MetaPolicy(Policy):
             updated_policies_parameters (list): List of size meta-batch size. Each contains a dict with the policies
             parameters as numpy arrays
         """
-        self.policies_params_vals = updated_policies_parameters
+        if self.resident_task_params:
+            if self._task_params_assign_op is None:
+                self._task_params_assign_phs = OrderedDict([(tensor, tf.compat.v1.placeholder(tf.float32, shape=tensor.shape))
+                                                            for _, task_params in self._resident_task_vars.values()
+                                                            for tensor in task_params])
+                self._task_params_assign_op = self.assign_task_parameters_sym(
+                    [OrderedDict([(key, self._task_params_assign_phs[task_params_phs[key]])
+                                  for key in self.policy_params_keys])
+                     for task_params_phs in self.policies_params_phs])
+            feed_dict = dict([(self._task_params_assign_phs[self.policies_params_phs[i][key]], params_vals[key])
+                              for i, params_vals in enumerate(updated_policies_parameters)
+                              for key in self.policy_params_keys])
+            tf.compat.v1.get_default_session().run(self._task_params_assign_op, feed_dict=feed_dict)
+        else:
+            self.policies_params_vals = updated_policies_parameters
+            self._stacked_params_vals = None
         self._pre_update_mode = False
+        self.params_version += 1
+
+    def assign_task_parameters_sym(self, policies_params_sym):
+        """
+        Creates an op that assigns the given symbolic parameters to the resident task variables. All parameters are
+        computed before the first variable is assigned, so they may depend on the current task variables.
+
+        Args:
+            policies_params_sym (list): List of size meta-batch size. Each contains a dict with the symbolic
+            parameters of the policy
+
+        Returns:
+            (tf.Operation): op that assigns all task variables
+        """
+        assert self.resident_task_params and len(policies_params_sym) == self.meta_batch_size
+        params_sym_by_task_param = dict([(task_params_phs[key], params_sym[key])
+                                         for task_params_phs, params_sym in zip(self.policies_params_phs, policies_params_sym)
+                                         for key in self.policy_params_keys])
+        with tf.control_dependencies(list(params_sym_by_task_param.values())):
+            assign_ops = []
+            for task_var, (var, task_params) in self._resident_task_vars.items():
+                if self._is_stacked_task_var(task_var, var):
+                    value = tf.stack([params_sym_by_task_param[task_param] for task_param in task_params], axis=0)
+                else:
+                    value = params_sym_by_task_param[task_params[0]]
+                assign_ops.append(task_var.assign(value))
+        return tf.group(*assign_ops)
+
+    def _build_copy_task_params_op(self):
+        """
+        Returns:
+            (tf.Operation): op that copies the pre-update parameters into all resident task variables
+        """
+        assign_ops = []
+        for task_var, (var, task_params) in self._resident_task_vars.items():
+            if self._is_stacked_task_var(task_var, var):
+                assign_ops.append(task_var.assign(tf.stack([var] * len(task_params), axis=0)))
+            else:
+                assign_ops.append(task_var.assign(var))
+        return tf.group(*assign_ops)
+
+    @staticmethod
+    def _is_stacked_task_var(task_var, var):
+        return task_var.shape.ndims == var.shape.ndims + 1
 
     def _create_placeholders_for_vars(self, scope, graph_keys=tf.compat.v1.GraphKeys.TRAINABLE_VARIABLES):
         var_list = tf.compat.v1.get_collection(graph_keys, scope=scope)
         placeholders = []
         for var in var_list:
             var_name = remove_scope_from_name(var.name, scope.split('/')[0])
-            placeholders.append((var_name, tf.compat.v1.placeholder(tf.float32, shape=var.shape, name="%s_ph" % var_name)))
+            if self.resident_task_params:
+                # non-trainable copy of the variable whose value is read by the post-update graph
+                task_var = tf.compat.v1.get_variable(name="%s_task_var" % var_name.replace('/', '_'),
+                                                     shape=var.shape,
+                                                     dtype=tf.float32,
+                                                     initializer=tf.compat.v1.zeros_initializer(),
+                                                     trainable=False,
+                                                     )
+                task_param = tf.identity(task_var, name="%s_task_param" % var_name.replace('/', '_'))
+                self._resident_task_vars[task_var] = (var, [task_param])
+                placeholders.append((var_name, task_param))
+            else:
+                placeholders.append((var_name, tf.compat.v1.placeholder(tf.float32, shape=var.shape, name="%s_ph" % var_name)))
         return OrderedDict(placeholders)
 
+    def _create_stacked_placeholders_for_vars(self, scope, graph_keys=tf.compat.v1.GraphKeys.TRAINABLE_VARIABLES):
+        """
+        Creates a single placeholder (or resident task variable) per variable holding the parameters of all
+        meta_batch_size tasks stacked along a leading task dimension
+
+        Returns:
+            (tuple) : ordered dict of the stacked parameters - shape: (meta_batch_size,) + var.shape and a list of
+                      size meta-batch size with ordered dicts of the parameters of each task (slices of the former)
+        """
+        var_list = tf.compat.v1.get_collection(graph_keys, scope=scope)
+        stacked_placeholders, task_placeholders = [], []
+        for var in var_list:
+            var_name = remove_scope_from_name(var.name, scope.split('/')[0])
+            shape = [self.meta_batch_size] + var.shape.as_list()
+            if self.resident_task_params:
+                task_var = tf.compat.v1.get_variable(name="%s_task_var" % var_name.replace('/', '_'),
+                                                     shape=shape,
+                                                     dtype=tf.float32,
+                                                     initializer=tf.compat.v1.zeros_initializer(),
+                                                     trainable=False,
+                                                     )
+                stacked_param = tf.identity(task_var, name="%s_task_param" % var_name.replace('/', '_'))
+            else:
+                task_var = None
+                stacked_param = tf.compat.v1.placeholder(tf.float32, shape=shape, name="%s_ph" % var_name)
+            task_params = tf.unstack(stacked_param, num=self.meta_batch_size, axis=0)
+            if task_var is not None:
+                self._resident_task_vars[task_var] = (var, task_params)
+            stacked_placeholders.append((var_name, stacked_param))
+            task_placeholders.append((var_name, task_params))
+        task_placeholders = [OrderedDict([(var_name, task_params[idx]) for var_name, task_params in task_placeholders])
+                             for idx in range(self.meta_batch_size)]
+        return OrderedDict(stacked_placeholders), task_placeholders
+
     @property
     def policies_params_feed_dict(self):
         """
             returns fully prepared feed dict for feeding the currently saved policy parameter values
-            into the lightweight policy graph
-        """
+            into the lightweight policy graph (empty if the parameters are held by resident task variables)
+        """
+        if self.resident_task_params:
+            return dict()
+        if self.policies_params_stacked_phs is not None:
+            if self._stacked_params_vals is None:
+                self._stacked_params_vals = OrderedDict([(key, np.stack([self.policies_params_vals[i][key]
+                                                                         for i in range(self.meta_batch_size)], axis=0))
+                                                         for key in self.policy_params_keys])
+            return dict([(self.policies_params_stacked_phs[key], self._stacked_params_vals[key])
+                         for key in self.policy_params_keys])
         return dict(list((self.policies_params_phs[i][key], self.policies_params_vals[i][key])
                          for key in self.policy_params_keys for i in range(self.meta_batch_size)))
-
-
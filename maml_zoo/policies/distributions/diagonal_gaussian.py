@@ -30,9 +30,9 @@ class DiagonalGaussian(Distribution):
         new_means = new_dist_info_vars["mean"]
         new_log_stds = new_dist_info_vars["log_std"]
 
-        # assert ranks
-        tf.compat.v1.assert_rank(old_means, 2), tf.compat.v1.assert_rank(old_log_stds, 2)
-        tf.compat.v1.assert_rank(new_means, 2), tf.compat.v1.assert_rank(new_log_stds, 2)
+        # assert ranks - 3 if the dist infos of several tasks are stacked along a leading task dimension
+        tf.compat.v1.assert_rank_in(old_means, [2, 3]), tf.compat.v1.assert_rank_in(old_log_stds, [2, 3])
+        tf.compat.v1.assert_rank_in(new_means, [2, 3]), tf.compat.v1.assert_rank_in(new_log_stds, [2, 3])
 
         old_std = tf.exp(old_log_stds)
         new_std = tf.exp(new_log_stds)
@@ -2,13 +2,51 @@ from maml_zoo.policies.base import MetaPolicy
 from maml_zoo.policies.gaussian_mlp_policy import GaussianMLPPolicy
 import numpy as np
 import tensorflow as tf
-from maml_zoo.policies.networks.mlp import forward_mlp
+from maml_zoo.policies.worker_gaussian_mlp_policy import WorkerGaussianMLPPolicy
+from maml_zoo.policies.networks.mlp import forward_mlp, forward_batched_mlp, forward_mlp_numpy, NUMPY_NONLINEARITIES, \
+    NUMPY_NONLINEARITY_NAMES
+from collections import OrderedDict
 
 
 class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
-    def __init__(self, meta_batch_size, *args, **kwargs):
+    """
+    Gaussian MLP policy holding a pre-update policy and meta_batch_size post-update policies
+
+    Args:
+        meta_batch_size (int) : number of meta tasks
+        columnar_agent_infos (bool) : whether get_actions returns the agent infos as a dict of arrays
+                                      {'mean': (meta_batch_size, batch_size, action_dim),
+                                       'log_std': (meta_batch_size, action_dim)}
+                                      instead of a list of lists of per-env dicts
+        numpy_inference (bool) : whether get_actions evaluates the policies in numpy instead of running the tf graph.
+                                 The weights are cached on switch_to_pre_update / update_task_parameters and the
+                                 networks of all tasks are evaluated with one batched einsum per layer
+        resident_task_params (bool) : whether the post-update parameters are held by per-task tf.Variables that are
+                                      assigned in-graph by the meta algo instead of being fed on every call
+        batched_task_graph (bool) : whether the post-update policies are built as a single network whose parameters
+                                    are stacked along a leading task dimension, so that all tasks are evaluated with
+                                    one batched matmul per layer instead of meta_batch_size separate networks
+    """
+    def __init__(self, meta_batch_size, *args, columnar_agent_infos=False, numpy_inference=False,
+                 resident_task_params=False, batched_task_graph=False, **kwargs):
         self.quick_init(locals())  # store init arguments for serialization
         self.meta_batch_size = meta_batch_size
+        self.columnar_agent_infos = columnar_agent_infos
+        self.numpy_inference = numpy_inference
+        self.resident_task_params = resident_task_params
+        self.batched_task_graph = batched_task_graph
+        assert not (numpy_inference and resident_task_params), \
+            "numpy inference needs the post-update parameters in numpy and can't be used with resident task params"
+
+        self._numpy_pre_update_params = None
+        self._numpy_post_update_params = None
+
+        self.policies_params_stacked_phs = None
+        self._stacked_params_vals = None
+        self._resident_task_vars = OrderedDict()  # task variable -> (pre-update variable, task param tensors)
+        self._copy_task_params_op = None
+        self._task_params_assign_op = None
+        self._task_params_assign_phs = None
 
         self.pre_update_action_var = None
         self.pre_update_mean_var = None
@@ -20,6 +58,10 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
 
         super(MetaGaussianMLPPolicy, self).__init__(*args, **kwargs)
 
+        if self.numpy_inference:
+            assert self.hidden_nonlinearity in NUMPY_NONLINEARITIES and self.output_nonlinearity in NUMPY_NONLINEARITIES, \
+                "numpy inference does not support the non-linearities of the policy"
+
     def build_graph(self):
         """
         Builds computational graph for policy
@@ -33,53 +75,136 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
 
         # Create lightweight policy graph that takes the policy parameters as placeholders
         with tf.compat.v1.variable_scope(self.name + "_ph_graph"):
-            mean_network_phs_meta_batch, log_std_network_phs_meta_batch = [], []
-
-            self.post_update_action_var = []
-            self.post_update_mean_var = []
-            self.post_update_log_std_var = []
+            if self.batched_task_graph:
+                self._build_batched_post_update_graph()
+            else:
+                self._build_post_update_graphs()
 
-            # build meta_batch_size graphs for post-update policies --> thereby the policy parameters are placeholders
-            obs_var_per_task = tf.split(self.obs_var, self.meta_batch_size, axis=0)
+            self.policy_params_keys = list(self.policies_params_phs[0].keys())
 
-            for idx in range(self.meta_batch_size):
-                with tf.compat.v1.variable_scope("task_%i" % idx):
+            if self.resident_task_params:
+                # op that copies the pre-update params into the task variables
+                self._copy_task_params_op = self._build_copy_task_params_op()
 
-                    with tf.compat.v1.variable_scope("mean_network"):
-                        # create mean network parameter placeholders
-                        mean_network_phs = self._create_placeholders_for_vars(
-                            scope=self.name + "/mean_network")  # -> returns ordered dict
-                        mean_network_phs_meta_batch.append(mean_network_phs)
+    def _build_post_update_graphs(self):
+        """
+        Builds a separate lightweight graph for each of the meta_batch_size post-update policies
+        """
+        mean_network_phs_meta_batch, log_std_network_phs_meta_batch = [], []
+
+        self.post_update_action_var = []
+        self.post_update_mean_var = []
+        self.post_update_log_std_var = []
+
+        # build meta_batch_size graphs for post-update policies --> thereby the policy parameters are placeholders
+        # (or read from resident task variables)
+        obs_var_per_task = tf.split(self.obs_var, self.meta_batch_size, axis=0)
+
+        for idx in range(self.meta_batch_size):
+            with tf.compat.v1.variable_scope("task_%i" % idx):
+
+                with tf.compat.v1.variable_scope("mean_network"):
+                    # create mean network parameter placeholders
+                    mean_network_phs = self._create_placeholders_for_vars(
+                        scope=self.name + "/mean_network")  # -> returns ordered dict
+                    mean_network_phs_meta_batch.append(mean_network_phs)
+
+                    # forward pass through the mean mpl
+                    _, mean_var = forward_mlp(output_dim=self.action_dim,
+                                              hidden_sizes=self.hidden_sizes,
+                                              hidden_nonlinearity=self.hidden_nonlinearity,
+                                              output_nonlinearity=self.output_nonlinearity,
+                                              input_var=obs_var_per_task[idx],
+                                              mlp_params=mean_network_phs,
+                                              )
+
+                with tf.compat.v1.variable_scope("log_std_network"):
+                    # create log_stf parameter placeholders
+                    log_std_network_phs = self._create_placeholders_for_vars(scope=self.name + "/log_std_network") # -> returns ordered dict
+                    log_std_network_phs_meta_batch.append(log_std_network_phs)
+
+                    log_std_var = list(log_std_network_phs.values())[0]  # weird stuff since log_std_network_phs is ordered dict
+
+                action_var = mean_var + tf.random.normal(shape=tf.shape(input=mean_var)) * tf.exp(log_std_var)
+
+                self.post_update_action_var.append(action_var)
+                self.post_update_mean_var.append(mean_var)
+                self.post_update_log_std_var.append(log_std_var)
+
+        # merge mean_network_phs and log_std_network_phs into policies_params_phs
+        self.policies_params_phs = []
+        for idx, odict in enumerate(mean_network_phs_meta_batch): # Mutate mean_network_ph here
+            odict.update(log_std_network_phs_meta_batch[idx])
+            self.policies_params_phs.append(odict)
+
+    def _build_batched_post_update_graph(self):
+        """
+        Builds one lightweight graph for all post-update policies whose parameters are stacked along a leading task
+        dimension. policies_params_phs holds the per-task slices of the stacked parameters.
+        """
+        with tf.compat.v1.variable_scope("all_tasks"):
+            with tf.compat.v1.variable_scope("mean_network"):
+                mean_network_phs, mean_network_phs_meta_batch = self._create_stacked_placeholders_for_vars(
+                    scope=self.name + "/mean_network")
 
-                        # forward pass through the mean mpl
-                        _, mean_var = forward_mlp(output_dim=self.action_dim,
+                obs_var = tf.reshape(self.obs_var, [self.meta_batch_size, -1, self.obs_dim])
+                _, mean_var = forward_batched_mlp(output_dim=self.action_dim,
                                                   hidden_sizes=self.hidden_sizes,
                                                   hidden_nonlinearity=self.hidden_nonlinearity,
                                                   output_nonlinearity=self.output_nonlinearity,
-                                                  input_var=obs_var_per_task[idx],
+                                                  input_var=obs_var,
                                                   mlp_params=mean_network_phs,
                                                   )
 
-                    with tf.compat.v1.variable_scope("log_std_network"):
-                        # create log_stf parameter placeholders
-                        log_std_network_phs = self._create_placeholders_for_vars(scope=self.name + "/log_std_network") # -> returns ordered dict
-                        log_std_network_phs_meta_batch.append(log_std_network_phs)
+            with tf.compat.v1.variable_scope("log_std_network"):
+                log_std_network_phs, log_std_network_phs_meta_batch = self._create_stacked_placeholders_for_vars(
+                    scope=self.name + "/log_std_network")
 
-                        log_std_var = list(log_std_network_phs.values())[0]  # weird stuff since log_std_network_phs is ordered dict
+                log_std_var = list(log_std_network_phs.values())[0]  # shape: (meta_batch_size, 1, action_dim)
 
-                    action_var = mean_var + tf.random.normal(shape=tf.shape(input=mean_var)) * tf.exp(log_std_var)
+            action_var = mean_var + tf.random.normal(shape=tf.shape(input=mean_var)) * tf.exp(log_std_var)
 
-                    self.post_update_action_var.append(action_var)
-                    self.post_update_mean_var.append(mean_var)
-                    self.post_update_log_std_var.append(log_std_var)
+        self.post_update_action_var = tf.unstack(action_var, num=self.meta_batch_size, axis=0)
+        self.post_update_mean_var = tf.unstack(mean_var, num=self.meta_batch_size, axis=0)
+        self.post_update_log_std_var = tf.unstack(log_std_var, num=self.meta_batch_size, axis=0)
 
-            # merge mean_network_phs and log_std_network_phs into policies_params_phs
-            self.policies_params_phs = []
-            for idx, odict in enumerate(mean_network_phs_meta_batch): # Mutate mean_network_ph here
-                odict.update(log_std_network_phs_meta_batch[idx])
-                self.policies_params_phs.append(odict)
+        self.policies_params_stacked_phs = mean_network_phs
+        self.policies_params_stacked_phs.update(log_std_network_phs)
+        self.policies_params_phs = []
+        for idx, odict in enumerate(mean_network_phs_meta_batch):
+            odict.update(log_std_network_phs_meta_batch[idx])
+            self.policies_params_phs.append(odict)
 
-            self.policy_params_keys = list(self.policies_params_phs[0].keys())
+    def batched_distribution_info_sym(self, obs_var, params):
+        """
+        Return the symbolic distribution information about the actions of several tasks at once
+
+        Args:
+            obs_var (tf.Tensor) : symbolic variable for observations - shape: (n_tasks, batch_size, obs_dim)
+            params (dict) : a dictionary of tensors with the parameters of the MLP of all tasks, stacked along a
+                            leading task dimension
+
+        Returns:
+            (dict) : a dictionary of tf tensors for the policy output distribution - the mean has the shape
+                     (n_tasks, batch_size, action_dim) and the log_std the shape (n_tasks, 1, action_dim)
+        """
+        mean_network_params = OrderedDict()
+        log_std_network_params = []
+        for name, param in params.items():
+            if 'log_std_network' in name:
+                log_std_network_params.append(param)
+            else:
+                mean_network_params[name] = param
+
+        assert len(log_std_network_params) == 1
+        _, mean_var = forward_batched_mlp(output_dim=self.action_dim,
+                                          hidden_sizes=self.hidden_sizes,
+                                          hidden_nonlinearity=self.hidden_nonlinearity,
+                                          output_nonlinearity=self.output_nonlinearity,
+                                          input_var=obs_var,
+                                          mlp_params=mean_network_params,
+                                          )
+        return dict(mean=mean_var, log_std=log_std_network_params[0])
 
     def get_action(self, observation, task=0):
         """
@@ -93,8 +218,11 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
         """
         observation = np.repeat(np.expand_dims(np.expand_dims(observation, axis=0), axis=0), self.meta_batch_size, axis=0)
         action, agent_infos = self.get_actions(observation)
-        action, agent_infos = action[task][0], dict(mean=agent_infos[task][0]['mean'], log_std=agent_infos[task][0]['log_std'])
-        return action, agent_infos
+        if self.columnar_agent_infos:
+            agent_infos = dict(mean=agent_infos['mean'][task][0], log_std=agent_infos['log_std'][task])
+        else:
+            agent_infos = dict(mean=agent_infos[task][0]['mean'], log_std=agent_infos[task][0]['log_std'])
+        return action[task][0], agent_infos
 
     def get_actions(self, observations):
         """
@@ -103,10 +231,13 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
 
         Returns:
             (tuple) : A tuple containing a list of numpy arrays of action, and a list of list of dicts of agent infos
+                      (or a dict of arrays if columnar_agent_infos is set)
         """
         assert len(observations) == self.meta_batch_size
 
-        if self._pre_update_mode:
+        if self.numpy_inference:
+            actions, agent_infos = self._get_numpy_actions(observations)
+        elif self._pre_update_mode:
             actions, agent_infos = self._get_pre_update_actions(observations)
         else:
             actions, agent_infos = self._get_post_update_actions(observations)
@@ -133,7 +264,7 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
                                              self.pre_update_log_std_var],
                                             feed_dict=feed_dict)
         log_stds = np.concatenate(log_stds) # Get rid of fake batch size dimension (would be better to do this in tf, if we can match batch sizes)
-        agent_infos = [[dict(mean=mean, log_std=log_stds[idx]) for mean in means[idx]] for idx in range(self.meta_batch_size)]
+        agent_infos = self._build_agent_infos(means, log_stds)
         return actions, agent_infos
 
     def _get_post_update_actions(self, observations):
@@ -142,7 +273,7 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
             observations (list): List of numpy arrays of shape (meta_batch_size, batch_size, obs_dim)
 
         """
-        assert self.policies_params_vals is not None
+        assert self.resident_task_params or self.policies_params_vals is not None
         obs_stack = np.concatenate(observations, axis=0)
         feed_dict = {self.obs_var: obs_stack}
         feed_dict.update(self.policies_params_feed_dict)
@@ -153,6 +284,130 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
                                              self.post_update_log_std_var],
                                             feed_dict=feed_dict)
         log_stds = np.concatenate(log_stds) # Get rid of fake batch size dimension (would be better to do this in tf, if we can match batch sizes)
-        agent_infos = [[dict(mean=mean, log_std=log_stds[idx]) for mean in means[idx]] for idx in range(self.meta_batch_size)]
+        agent_infos = self._build_agent_infos(means, log_stds)
         return actions, agent_infos
 
+    def _get_numpy_actions(self, observations):
+        """
+        Evaluates the pre- or post-update policies with the cached numpy weights
+
+        Args:
+            observations (list): List of numpy arrays of shape (meta_batch_size, batch_size, obs_dim)
+
+        """
+        observations = np.asarray(observations, dtype=np.float32)
+        assert observations.ndim == 3 and observations.shape[2] == self.obs_dim
+        meta_batch_size, batch_size, _ = observations.shape
+
+        if self._pre_update_mode:
+            if self._numpy_pre_update_params is None:
+                self._numpy_pre_update_params = self._stack_param_values([self.get_param_values()])
+            # all tasks share the pre-update weights -> evaluate them as a single task
+            params = self._numpy_pre_update_params
+            observations = observations.reshape((1, meta_batch_size * batch_size, self.obs_dim))
+        else:
+            assert self._numpy_post_update_params is not None
+            params = self._numpy_post_update_params
+
+        mean_network_params = OrderedDict([(key, value) for key, value in params.items()
+                                           if key.startswith('mean_network')])
+        means = forward_mlp_numpy(output_dim=self.action_dim,
+                                  hidden_sizes=self.hidden_sizes,
+                                  hidden_nonlinearity=self.hidden_nonlinearity,
+                                  output_nonlinearity=self.output_nonlinearity,
+                                  input_var=observations,
+                                  mlp_params=mean_network_params,
+                                  ).reshape((meta_batch_size, batch_size, self.action_dim))
+
+        # same as in the tf graph: the actions are sampled with the raw log std, the pre-update agent infos hold
+        # the log std clipped at min_log_std
+        log_stds = np.concatenate([value[:, 0] for key, value in params.items() if key.startswith('log_std_network')])
+        log_stds = np.tile(log_stds, (meta_batch_size // len(log_stds), 1))
+        noise = np.random.normal(size=means.shape).astype(np.float32)
+        actions = means + noise * np.exp(log_stds)[:, None, :]
+        if self._pre_update_mode:
+            log_stds = np.maximum(log_stds, self.min_log_std)
+        return actions, self._build_agent_infos(means, log_stds)
+
+    def _stack_param_values(self, policies_params_vals):
+        """
+        Stacks the parameter values of several policies along a new leading dimension
+
+        Args:
+            policies_params_vals (list) : list of dicts with the parameter values of each policy
+
+        Returns:
+            (OrderedDict) : dict of the stacked parameter values
+        """
+        return OrderedDict([(key, np.stack([np.asarray(params_vals[key], dtype=np.float32)
+                                            for params_vals in policies_params_vals], axis=0))
+                            for key in self.policy_params_keys])
+
+    def switch_to_pre_update(self):
+        """
+        Switches get_action to pre-update policy and refreshes the cached numpy weights
+        """
+        super(MetaGaussianMLPPolicy, self).switch_to_pre_update()
+        if self.numpy_inference:
+            self._numpy_pre_update_params = self._stack_param_values(self.policies_params_vals[:1])
+
+    def update_task_parameters(self, updated_policies_parameters):
+        """
+        Args:
+            updated_policies_parameters (list): List of size meta-batch size. Each contains a dict with the policies
+            parameters as numpy arrays
+        """
+        super(MetaGaussianMLPPolicy, self).update_task_parameters(updated_policies_parameters)
+        if self.numpy_inference:
+            self._numpy_post_update_params = self._stack_param_values(updated_policies_parameters)
+
+    def set_flat_params(self, flat_params):
+        """
+        Sets the parameters for the graph and invalidates the cached numpy pre-update weights
+
+        Args:
+            flat_params (ndarray): flat vector of the parameter values (see param_layout)
+        """
+        super(MetaGaussianMLPPolicy, self).set_flat_params(flat_params)
+        self._numpy_pre_update_params = None
+        self.params_version += 1
+
+    def get_worker_policy(self):
+        """
+        Returns:
+            (WorkerGaussianMLPPolicy) : picklable numpy copy of the policy for the sampler workers - without
+                                        parameters (see get_worker_params)
+        """
+        assert self.hidden_nonlinearity in NUMPY_NONLINEARITY_NAMES and \
+               self.output_nonlinearity in NUMPY_NONLINEARITY_NAMES, \
+            "the workers can't evaluate the non-linearities of the policy"
+        return WorkerGaussianMLPPolicy(obs_dim=self.obs_dim,
+                                       action_dim=self.action_dim,
+                                       hidden_sizes=self.hidden_sizes,
+                                       hidden_nonlinearity=NUMPY_NONLINEARITY_NAMES[self.hidden_nonlinearity],
+                                       output_nonlinearity=NUMPY_NONLINEARITY_NAMES[self.output_nonlinearity],
+                                       min_log_std=self.min_log_std)
+
+    def get_worker_params(self):
+        """
+        Returns:
+            (tuple) : param values of the current policies stacked along a leading task dimension - a single policy
+                      shared by all tasks in pre-update mode - and whether they are the pre-update params
+        """
+        if self._pre_update_mode:
+            return self._stack_param_values([self.get_param_values()]), True
+        assert not self.resident_task_params, "the post-update params of resident task variables can't be fetched"
+        return self._stack_param_values(self.policies_params_vals), False
+
+    def _build_agent_infos(self, means, log_stds):
+        """
+        Args:
+            means (list) : list of numpy arrays of shape (meta_batch_size, batch_size, action_dim)
+            log_stds (ndarray) : log stds of the task policies - shape: (meta_batch_size, action_dim)
+
+        Returns:
+            (dict or list) : agent infos, either columnar or as a list of list of dicts
+        """
+        if self.columnar_agent_infos:
+            return dict(mean=np.stack(means, axis=0), log_std=log_stds)
+        return [[dict(mean=mean, log_std=log_stds[idx]) for mean in means[idx]] for idx in range(self.meta_batch_size)]
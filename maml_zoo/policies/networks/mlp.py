@@ -1,6 +1,28 @@
+import numpy as np
 import tensorflow as tf
 from maml_zoo.utils.utils import get_original_tf_name, get_last_scope
 
+# names of the tf non-linearities supported by forward_mlp_numpy - the names can be pickled (e.g. to sampler workers)
+NUMPY_NONLINEARITY_NAMES = {
+    None: 'identity',
+    tf.identity: 'identity',
+    tf.tanh: 'tanh',
+    tf.nn.relu: 'relu',
+    tf.nn.sigmoid: 'sigmoid',
+    tf.nn.softplus: 'softplus',
+}
+
+# numpy counterparts of the tf non-linearities, indexed by the tf non-linearity and by its name
+NUMPY_NONLINEARITIES = {
+    'identity': lambda x: x,
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1. / (1. + np.exp(-x)),
+    'softplus': lambda x: np.logaddexp(x, 0),
+}
+NUMPY_NONLINEARITIES.update([(nonlinearity, NUMPY_NONLINEARITIES[name])
+                             for nonlinearity, name in NUMPY_NONLINEARITY_NAMES.items()])
+
 
 def create_mlp(name,
                output_dim,
@@ -119,6 +141,110 @@ def forward_mlp(output_dim,
     return input_var, output_var # Todo why return input_var?
 
 
+def forward_batched_mlp(output_dim,
+                        hidden_sizes,
+                        hidden_nonlinearity,
+                        output_nonlinearity,
+                        input_var,
+                        mlp_params,
+                        ):
+    """
+    Creates the forward pass of the mlps of several tasks at once. The params of the tasks are stacked along a leading
+    task dimension, i.e. a kernel has the shape (n_tasks, in_dim, out_dim) and a bias the shape (n_tasks, out_dim),
+    so that each layer is a single batched matmul. Assumes that the params are passed in the same order as for
+    forward_mlp.
+
+    Args:
+        output_dim (int): dimension of the output
+        hidden_sizes (tuple): tuple with the hidden sizes of the fully connected network
+        hidden_nonlinearity (tf): non-linearity for the activations in the hidden layers
+        output_nonlinearity (tf or None): output non-linearity. None results in no non-linearity being applied
+        input_var (tf.Tensor): input of the network - shape: (n_tasks, batch_size, in_dim)
+        mlp_params (OrderedDict): OrderedDict of the stacked params of the neural network
+
+    Returns:
+        input_var (tf.Tensor): Input of the network as a symbolic variable
+        output_var (tf.Tensor): Output of the network - shape: (n_tasks, batch_size, output_dim)
+    """
+    x = input_var
+    idx = 0
+    sizes = tuple(hidden_sizes) + (output_dim,)
+
+    if output_nonlinearity is None:
+        output_nonlinearity = tf.identity
+
+    for name, param in mlp_params.items():
+        assert str(idx) in name or (idx == len(hidden_sizes) and "output" in name)
+
+        if "kernel" in name:
+            assert param.shape[1:] == (x.shape[-1], sizes[idx])
+            x = tf.matmul(x, param)
+        elif "bias" in name:
+            assert param.shape[1:] == (sizes[idx],)
+            x = tf.add(x, tf.expand_dims(param, axis=1))
+            if "hidden" in name:
+                x = hidden_nonlinearity(x)
+            elif "output" in name:
+                x = output_nonlinearity(x)
+            else:
+                raise NameError
+            idx += 1
+        else:
+            raise NameError
+    return input_var, x
+
+
+def forward_mlp_numpy(output_dim,
+                      hidden_sizes,
+                      hidden_nonlinearity,
+                      output_nonlinearity,
+                      input_var,
+                      mlp_params,
+                      ):
+    """
+    NumPy version of forward_mlp that evaluates the mlp of several tasks at once. The params of the tasks are stacked
+    along a leading task dimension, i.e. a kernel has the shape (n_tasks, in_dim, out_dim) and a bias the shape
+    (n_tasks, out_dim). Assumes that the params are passed in the same order as for forward_mlp.
+
+    Args:
+        output_dim (int): dimension of the output
+        hidden_sizes (tuple): tuple with the hidden sizes of the fully connected network
+        hidden_nonlinearity (tf or str): non-linearity for the activations in the hidden layers - must be a key of
+                                         NUMPY_NONLINEARITIES
+        output_nonlinearity (tf, str or None): output non-linearity - must be a key of NUMPY_NONLINEARITIES
+        input_var (np.ndarray): input of the network - shape: (n_tasks, batch_size, in_dim)
+        mlp_params (OrderedDict): OrderedDict of the stacked params of the neural network
+
+    Returns:
+        (np.ndarray): output of the network - shape: (n_tasks, batch_size, output_dim)
+    """
+    x = input_var
+    idx = 0
+    sizes = tuple(hidden_sizes) + (output_dim,)
+    hidden_nonlinearity = NUMPY_NONLINEARITIES[hidden_nonlinearity]
+    output_nonlinearity = NUMPY_NONLINEARITIES[output_nonlinearity]
+
+    for name, param in mlp_params.items():
+        assert str(idx) in name or (idx == len(hidden_sizes) and "output" in name)
+
+        if "kernel" in name:
+            assert param.shape[1:] == (x.shape[-1], sizes[idx])
+            x = np.matmul(x, param)  # batched over tasks - same as einsum('tbi,tio->tbo')
+        elif "bias" in name:
+            assert param.shape[1:] == (sizes[idx],)
+            x = x + param[:, None, :]
+            if "hidden" in name:
+                x = hidden_nonlinearity(x)
+            elif "output" in name:
+                x = output_nonlinearity(x)
+            else:
+                raise NameError
+            idx += 1
+        else:
+            raise NameError
+    return x
+
+
 def create_rnn(name,
                cell_type,
                output_dim,
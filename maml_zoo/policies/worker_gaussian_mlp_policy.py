@@ -0,0 +1,72 @@
+from maml_zoo.policies.networks.mlp import forward_mlp_numpy
+import numpy as np
+from collections import OrderedDict
+
+
+class WorkerGaussianMLPPolicy(object):
+    """
+    NumPy copy of the policies of a MetaGaussianMLPPolicy that is held by a sampler worker, so that the worker can
+    sample complete rollouts of its envs without sending the observations to the main process. It holds no tf
+    objects and can be pickled to the workers - the parameters of the tasks of the envs are set with set_params
+    whenever the policies change.
+
+    Args:
+        obs_dim (int) : dimensionality of the observation space
+        action_dim (int) : dimensionality of the action space
+        hidden_sizes (tuple) : hidden sizes of the mean network
+        hidden_nonlinearity (str) : name of the hidden non-linearity (see NUMPY_NONLINEARITY_NAMES)
+        output_nonlinearity (str) : name of the output non-linearity (see NUMPY_NONLINEARITY_NAMES)
+        min_log_std (float) : minimum log std reported in the agent infos of the pre-update policy
+    """
+
+    def __init__(self, obs_dim, action_dim, hidden_sizes, hidden_nonlinearity, output_nonlinearity, min_log_std):
+        self.obs_dim = obs_dim
+        self.action_dim = action_dim
+        self.hidden_sizes = hidden_sizes
+        self.hidden_nonlinearity = hidden_nonlinearity
+        self.output_nonlinearity = output_nonlinearity
+        self.min_log_std = min_log_std
+
+        self._mean_network_params = None
+        self._log_stds = None
+        self._pre_update = True
+
+    def set_params(self, task_params, env_task_ids, pre_update):
+        """
+        Sets the parameters of the policies of the envs
+
+        Args:
+            task_params (OrderedDict) : param values of the task policies stacked along a leading task dimension
+            env_task_ids (np.ndarray) : index of the policy in task_params of every env of the worker
+            pre_update (bool) : whether the params are the ones of the pre-update policy
+        """
+        # gathers the params of the policy of every env, so that all envs are evaluated with one matmul per layer
+        self._mean_network_params = OrderedDict([(key, value[env_task_ids]) for key, value in task_params.items()
+                                                 if key.startswith('mean_network')])
+        self._log_stds = np.concatenate([value[:, 0] for key, value in task_params.items()
+                                         if key.startswith('log_std_network')])[env_task_ids]
+        self._pre_update = pre_update
+
+    def get_actions(self, observations):
+        """
+        Args:
+            observations (np.ndarray) : observations of the envs - shape: (n_envs, obs_dim)
+
+        Returns:
+            (tuple) : actions of shape (n_envs, action_dim) and the agent infos as a dict of arrays (mean, log_std)
+                      with leading dimension n_envs
+        """
+        assert self._mean_network_params is not None, 'the params of the policies have not been set'
+        means = forward_mlp_numpy(output_dim=self.action_dim,
+                                  hidden_sizes=self.hidden_sizes,
+                                  hidden_nonlinearity=self.hidden_nonlinearity,
+                                  output_nonlinearity=self.output_nonlinearity,
+                                  input_var=np.asarray(observations, dtype=np.float32)[:, None, :],
+                                  mlp_params=self._mean_network_params,
+                                  )[:, 0, :]
+
+        # same as MetaGaussianMLPPolicy: the actions are sampled with the raw log std, the pre-update agent infos
+        # hold the log std clipped at min_log_std
+        actions = means + np.random.normal(size=means.shape).astype(np.float32) * np.exp(self._log_stds)
+        log_stds = np.maximum(self._log_stds, self.min_log_std) if self._pre_update else self._log_stds
+        return actions, dict(mean=means, log_std=log_stds)
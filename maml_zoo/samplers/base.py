@@ -44,7 +44,17 @@ class SampleProcessor(object):
         gae_lambda (float) : Generalized Advantage Estimation lambda
         normalize_adv (bool) : indicates whether to normalize the estimated advantages (zero mean and unit std)
         positive_adv (bool) : indicates whether to shift the (normalized) advantages so that they are all positive
+        batched_task_baselines (bool) : indicates whether to fit the baselines of all tasks of a meta-batch at once
+                                        (see Baseline.fit_tasks) instead of refitting the baseline for each task
+        vectorized_advantages (bool) : indicates whether to compute the returns and advantages of all paths at once
+                                       on zero-padded (num_paths, max_path_length) arrays instead of path by path
+        dtype (np.dtype or None) : dtype of the returns and advantages (e.g. np.float32 together with a float32
+                                   sampler, so that the samples data is fed without conversion) - if None float64
     """
+    # the DICE sample processors share process_samples without calling __init__
+    batched_task_baselines = False
+    vectorized_advantages = False
+    dtype = None
 
     def __init__(
             self,
@@ -53,6 +63,9 @@ class SampleProcessor(object):
             gae_lambda=1,
             normalize_adv=False,
             positive_adv=False,
+            batched_task_baselines=False,
+            vectorized_advantages=False,
+            dtype=None,
             ):
 
         assert 0 <= discount <= 1.0, 'discount factor must be in [0,1]'
@@ -64,6 +77,9 @@ class SampleProcessor(object):
         self.gae_lambda = gae_lambda
         self.normalize_adv = normalize_adv
         self.positive_adv = positive_adv
+        self.batched_task_baselines = batched_task_baselines
+        self.vectorized_advantages = vectorized_advantages
+        self.dtype = dtype
         self.avg_return = -np.inf
 
     def process_samples(self, paths, log=False, log_prefix=''):
@@ -98,19 +114,19 @@ class SampleProcessor(object):
 
     """ helper functions """
 
-    def _compute_samples_data(self, paths):
+    def _compute_samples_data(self, paths, compute_advantages=True):
         assert type(paths) == list
 
-        # 1) compute discounted rewards (returns)
-        for idx, path in enumerate(paths):
-            path["returns"] = utils.discount_cumsum(path["rewards"], self.discount)
+        if compute_advantages:
+            # 1) compute discounted rewards (returns)
+            paths = self._compute_returns(paths)
 
-        # 2) fit baseline estimator using the path returns and predict the return baselines
-        self.baseline.fit(paths, target_key="returns")
-        all_path_baselines = [self.baseline.predict(path) for path in paths]
+            # 2) fit baseline estimator using the path returns and predict the return baselines
+            self.baseline.fit(paths, target_key="returns")
+            all_path_baselines = [self.baseline.predict(path) for path in paths]
 
-        # 3) compute advantages and adjusted rewards
-        paths = self._compute_advantages(paths, all_path_baselines)
+            # 3) compute advantages and adjusted rewards
+            paths = self._compute_advantages(paths, all_path_baselines)
 
         # 4) stack path data
         observations, actions, rewards, dones, returns, advantages, env_infos, agent_infos = self._concatenate_path_data(paths)
@@ -135,6 +151,42 @@ class SampleProcessor(object):
 
         return samples_data, paths
 
+    def _compute_meta_batch_advantages(self, paths_meta_batch):
+        """
+        Computes the returns and advantages of the paths of all tasks, i.e. steps 1) - 3) of _compute_samples_data
+        for the whole meta-batch, fitting one baseline per task
+
+        Args:
+            paths_meta_batch (list): list (len = meta_batch_size) of lists of paths
+        """
+        all_paths = [path for paths in paths_meta_batch for path in paths]
+
+        # 1) compute discounted rewards (returns)
+        self._compute_returns(all_paths)
+
+        # 2) fit baseline estimators using the path returns and predict the return baselines
+        if self.batched_task_baselines:
+            all_task_baselines = self.baseline.fit_tasks(paths_meta_batch, target_key="returns")
+        else:
+            all_task_baselines = []
+            for paths in paths_meta_batch:
+                self.baseline.fit(paths, target_key="returns")
+                all_task_baselines.append([self.baseline.predict(path) for path in paths])
+
+        # 3) compute advantages
+        self._compute_advantages(all_paths, [path_baselines for task_baselines in all_task_baselines
+                                             for path_baselines in task_baselines])
+
+    def _concatenate_task_paths(self, tasks_paths):
+        """
+        Args:
+            tasks_paths (list): list (len = meta_batch_size) of the paths of each task
+
+        Returns:
+            (list) : paths of all tasks
+        """
+        return [path for paths in tasks_paths for path in paths]
+
     def _log_path_stats(self, paths, log=False, log_prefix=''):
         # compute log stats
         average_discounted_return = np.mean([path["returns"][0] for path in paths])
@@ -153,19 +205,61 @@ class SampleProcessor(object):
 
         return np.mean(undiscounted_returns)
 
+    def _compute_returns(self, paths):
+        if self.vectorized_advantages:
+            path_lengths, path_idx, time_idx = self._padding_index(paths)
+            rewards = self._pad_paths([path["rewards"] for path in paths], path_lengths, path_idx, time_idx)
+            returns = utils.discount_cumsum_padded(rewards, self.discount)
+            returns = self._as_dtype(returns)
+            for path, path_returns in zip(paths, self._unpad_paths(returns, path_lengths, path_idx, time_idx)):
+                path["returns"] = path_returns
+            return paths
+
+        for idx, path in enumerate(paths):
+            path["returns"] = self._as_dtype(utils.discount_cumsum(path["rewards"], self.discount))
+        return paths
+
     def _compute_advantages(self, paths, all_path_baselines):
         assert len(paths) == len(all_path_baselines)
 
+        if self.vectorized_advantages:
+            path_lengths, path_idx, time_idx = self._padding_index(paths)
+            rewards = self._pad_paths([path["rewards"] for path in paths], path_lengths, path_idx, time_idx)
+            baselines = self._pad_paths(all_path_baselines, path_lengths, path_idx, time_idx)
+            mask = (np.arange(np.max(path_lengths))[None, :] < path_lengths[:, None]).astype(np.float64)
+            advantages = self._as_dtype(utils.gae_padded(rewards, baselines, mask, self.discount, self.gae_lambda))
+            for path, path_advantages in zip(paths, self._unpad_paths(advantages, path_lengths, path_idx, time_idx)):
+                path["advantages"] = path_advantages
+            return paths
+
         for idx, path in enumerate(paths):
             path_baselines = np.append(all_path_baselines[idx], 0)
             deltas = path["rewards"] + \
                 self.discount * path_baselines[1:] - \
                 path_baselines[:-1]
-            path["advantages"] = utils.discount_cumsum(
-                deltas, self.discount * self.gae_lambda)
+            path["advantages"] = self._as_dtype(utils.discount_cumsum(
+                deltas, self.discount * self.gae_lambda))
 
         return paths
 
+    def _as_dtype(self, array):
+        return array if self.dtype is None else array.astype(self.dtype, copy=False)
+
+    @staticmethod
+    def _padding_index(paths):
+        path_lengths = np.array([len(path["rewards"]) for path in paths])
+        return (path_lengths,) + utils.padding_index(path_lengths)
+
+    @staticmethod
+    def _pad_paths(arrays, path_lengths, path_idx, time_idx):
+        padded = np.zeros((len(path_lengths), np.max(path_lengths)))
+        padded[path_idx, time_idx] = np.concatenate(arrays)
+        return padded
+
+    @staticmethod
+    def _unpad_paths(padded, path_lengths, path_idx, time_idx):
+        return np.split(padded[path_idx, time_idx], np.cumsum(path_lengths)[:-1])
+
     def _concatenate_path_data(self, paths):
         observations = np.concatenate([path["observations"] for path in paths])
         actions = np.concatenate([path["actions"] for path in paths])
@@ -13,6 +13,9 @@ class DiceSampleProcessor(SampleProcessor):
         - zero-pads paths to max_path_length
         - stacks the padded path data
 
+    The paths can also be given already padded and stacked, as emitted by MAMLSampler(padded_output=True) - they are
+    then processed as a whole without handling the individual paths.
+
     Args:
         baseline (Baseline) : a time dependent reward baseline object
         max_path_length (int): maximum path length
@@ -21,6 +24,7 @@ class DiceSampleProcessor(SampleProcessor):
         positive_adv (bool) : indicates whether to shift the (normalized) advantages so that they are all positive
         return_baseline (Baseline): (optional) a state(-time) dependent baseline -
                                     if provided it is also fitted and used to calculate GAE advantage estimates
+        dtype (np.dtype or None) : dtype of the adjusted rewards, advantages and mask - if None float64
 
     """
 
@@ -32,7 +36,8 @@ class DiceSampleProcessor(SampleProcessor):
             gae_lambda=1,
             normalize_adv=True,
             positive_adv=False,
-            return_baseline=None
+            return_baseline=None,
+            dtype=None,
     ):
 
         assert 0 <= discount <= 1.0, 'discount factor must be in [0,1]'
@@ -46,6 +51,7 @@ class DiceSampleProcessor(SampleProcessor):
         self.normalize_adv = normalize_adv
         self.positive_adv = positive_adv
         self.return_baseline = return_baseline
+        self.dtype = dtype
 
     def process_samples(self, paths, log=False, log_prefix=''):
         """
@@ -59,7 +65,8 @@ class DiceSampleProcessor(SampleProcessor):
             - logging statistics of the paths
 
         Args:
-            paths (list): A list of paths of size (batch_size) x [5] x (max_path_length)
+            paths (list or dict): A list of paths of size (batch_size) x [5] x (max_path_length) or the paths padded
+                                  to max_path_length (see MAMLSampler(padded_output=True))
             log (boolean): indicates whether to log
             log_prefix (str): prefix for the logging keys
 
@@ -74,8 +81,8 @@ class DiceSampleProcessor(SampleProcessor):
                     - agent_infos: dict of ndarrays of shape (batch_size, max_path_length, ?)
 
         """
-        assert type(paths) == list, 'paths must be a list'
-        assert paths[0].keys() >= {'observations', 'actions', 'rewards'}
+        assert type(paths) == list or isinstance(paths, dict), 'paths must be a list or padded paths'
+        assert (paths if isinstance(paths, dict) else paths[0]).keys() >= {'observations', 'actions', 'rewards'}
         assert self.baseline, 'baseline must be specified - use self.build_sample_processor(baseline_obj)'
 
         # fits baseline, compute advantages and stack path data
@@ -90,6 +97,8 @@ class DiceSampleProcessor(SampleProcessor):
     """ helper functions """
 
     def _compute_samples_data(self, paths):
+        if isinstance(paths, dict):
+            return self._compute_padded_samples_data(paths)
         assert type(paths) == list
 
         # 1) compute discounted rewards and return
@@ -129,10 +138,79 @@ class DiceSampleProcessor(SampleProcessor):
 
         return samples_data, paths
 
+    def _compute_padded_samples_data(self, padded_paths):
+        """
+        Same as _compute_samples_data for paths that are already padded to max_path_length
+
+        Args:
+            padded_paths (dict) : dict of arrays of shape (batch_size, max_path_length, ...), including the mask of the
+                                  valid steps
+
+        Returns:
+            (tuple) : samples data and the padded paths
+        """
+        mask = padded_paths["mask"]
+        assert mask.shape[1] == self.max_path_length
+
+        # 1) compute discounted rewards
+        discount_array = np.cumprod(np.concatenate([np.ones(1), np.ones(self.max_path_length - 1) * self.discount]))
+        padded_paths["discounted_rewards"] = self._as_dtype(padded_paths["rewards"] * discount_array)
+
+        # 2) fit baseline estimator using the discounted rewards and predict the baselines
+        self.baseline.fit_padded(padded_paths, target_key='discounted_rewards')
+        baselines = self.baseline.predict_padded(padded_paths)
+
+        # 3) compute adjusted rewards (r - b)
+        adjusted_rewards = self._as_dtype((padded_paths["discounted_rewards"] - baselines) * mask)
+        padded_paths["adjusted_rewards"] = adjusted_rewards
+
+        # 5) if desired normalize / shift adjusted_rewards
+        if self.normalize_adv:
+            adjusted_rewards = utils.normalize_advantages(adjusted_rewards)
+        if self.positive_adv:
+            adjusted_rewards = utils.shift_advantages_to_positive(adjusted_rewards)
+
+        # 6) create samples_data object
+        samples_data = dict(
+            mask=mask,
+            observations=padded_paths["observations"],
+            actions=padded_paths["actions"],
+            rewards=padded_paths["rewards"],
+            env_infos=padded_paths["env_infos"],
+            agent_infos=padded_paths["agent_infos"],
+            adjusted_rewards=adjusted_rewards,
+        )
+
+        # if return baseline is provided also compute GAE advantage estimates
+        if self.return_baseline is not None:
+            padded_paths["returns"] = self._as_dtype(utils.discount_cumsum_padded(padded_paths["rewards"],
+                                                                                  self.discount))
+            self.return_baseline.fit_padded(padded_paths, target_key='returns')
+            advantages = self._as_dtype(utils.gae_padded(padded_paths["rewards"],
+                                                         self.return_baseline.predict_padded(padded_paths),
+                                                         mask, self.discount, self.gae_lambda))
+            padded_paths["advantages"] = advantages
+            if self.normalize_adv:
+                advantages = utils.normalize_advantages(advantages)
+            if self.positive_adv:
+                advantages = utils.shift_advantages_to_positive(advantages)
+            samples_data['advantages'] = advantages
+
+        return samples_data, padded_paths
+
+    def _concatenate_task_paths(self, tasks_paths):
+        if isinstance(tasks_paths[0], dict):
+            return utils.concat_tensor_dict_list(tasks_paths)
+        return super(DiceSampleProcessor, self)._concatenate_task_paths(tasks_paths)
+
     def _log_path_stats(self, paths, log=False, log_prefix=''):
         # compute log stats
-        average_discounted_return = [sum(path["discounted_rewards"]) for path in paths]
-        undiscounted_returns = [sum(path["rewards"]) for path in paths]
+        if isinstance(paths, dict):  # padded paths
+            average_discounted_return = np.sum(paths["discounted_rewards"], axis=1)
+            undiscounted_returns = np.sum(paths["rewards"], axis=1)
+        else:
+            average_discounted_return = [sum(path["discounted_rewards"]) for path in paths]
+            undiscounted_returns = [sum(path["rewards"]) for path in paths]
 
         if log == 'reward':
             logger.logkv(log_prefix + 'AverageReturn', np.mean(undiscounted_returns))
@@ -140,7 +218,7 @@ class DiceSampleProcessor(SampleProcessor):
         elif log == 'all' or log is True:
             logger.logkv(log_prefix + 'AverageDiscountedReturn', np.mean(average_discounted_return))
             logger.logkv(log_prefix + 'AverageReturn', np.mean(undiscounted_returns))
-            logger.logkv(log_prefix + 'NumTrajs', len(paths))
+            logger.logkv(log_prefix + 'NumTrajs', len(undiscounted_returns))
             logger.logkv(log_prefix + 'StdReturn', np.std(undiscounted_returns))
             logger.logkv(log_prefix + 'MaxReturn', np.max(undiscounted_returns))
             logger.logkv(log_prefix + 'MinReturn', np.min(undiscounted_returns))
@@ -148,9 +226,13 @@ class DiceSampleProcessor(SampleProcessor):
     def _compute_discounted_rewards(self, paths):
         discount_array = np.cumprod(np.concatenate([np.ones(1), np.ones(self.max_path_length - 1) * self.discount]))
 
-        for path in paths:
-            path_length = path['rewards'].shape[0]
-            path["discounted_rewards"] = path['rewards'] * discount_array[:path_length]
+        # discounts the rewards of all paths at once
+        path_lengths = np.array([path['rewards'].shape[0] for path in paths])
+        _, time_idx = utils.padding_index(path_lengths)
+        discounted_rewards = np.concatenate([path['rewards'] for path in paths]) * discount_array[time_idx]
+        discounted_rewards = self._as_dtype(discounted_rewards)
+        for path, path_discounted_rewards in zip(paths, np.split(discounted_rewards, np.cumsum(path_lengths)[:-1])):
+            path["discounted_rewards"] = path_discounted_rewards
         return paths
 
     def _compute_adjusted_rewards(self, paths, all_path_baselines):
@@ -159,7 +241,7 @@ class DiceSampleProcessor(SampleProcessor):
         for idx, path in enumerate(paths):
             path_baselines = all_path_baselines[idx]
             deltas = path["discounted_rewards"] - path_baselines
-            path["adjusted_rewards"] = deltas
+            path["adjusted_rewards"] = self._as_dtype(deltas)
         return paths
 
     def _pad_and_stack_paths(self, paths):
@@ -169,7 +251,7 @@ class DiceSampleProcessor(SampleProcessor):
             path_length = path["observations"].shape[0]
             assert self.max_path_length >= path_length
 
-            mask.append(self._pad(np.ones(path_length), path_length))
+            mask.append(self._pad(np.ones(path_length, dtype=self.dtype), path_length))
             observations.append(self._pad(path["observations"], path_length))
             actions.append(self._pad(path["actions"], path_length))
             rewards.append(self._pad(path["rewards"], path_length))
@@ -205,7 +287,7 @@ class DiceSampleProcessor(SampleProcessor):
 
         # a) compute returns
         for idx, path in enumerate(paths):
-            path["returns"] = utils.discount_cumsum(path["rewards"], self.discount)
+            path["returns"] = self._as_dtype(utils.discount_cumsum(path["rewards"], self.discount))
 
         # b) fit return baseline estimator using the path returns and predict the return baselines
         self.return_baseline.fit(paths, target_key='returns')
@@ -217,8 +299,8 @@ class DiceSampleProcessor(SampleProcessor):
             deltas = path["rewards"] + \
                      self.discount * path_baselines[1:] - \
                      path_baselines[:-1]
-            path["advantages"] = utils.discount_cumsum(
-                deltas, self.discount * self.gae_lambda)
+            path["advantages"] = self._as_dtype(utils.discount_cumsum(
+                deltas, self.discount * self.gae_lambda))
 
         # d) pad paths and stack them
         advantages = []
@@ -1,6 +1,7 @@
 from maml_zoo.samplers.base import SampleProcessor
 from maml_zoo.samplers.dice_sample_processor import DiceSampleProcessor
 import numpy as np
+import copy
 
 class MAMLSampleProcessor(SampleProcessor):
 
@@ -26,16 +27,55 @@ class MAMLSampleProcessor(SampleProcessor):
         assert isinstance(paths_meta_batch, dict), 'paths must be a dict'
         assert self.baseline, 'baseline must be specified'
 
-        samples_data_meta_batch = []
-        all_paths = []
+        if self.batched_task_baselines or self.vectorized_advantages:
+            # computes the advantages of the whole meta-batch at once, then stacks the path data of each task
+            self._compute_meta_batch_advantages(list(paths_meta_batch.values()))
+            tasks_samples_data = [self._compute_samples_data(paths, compute_advantages=False)
+                                  for paths in paths_meta_batch.values()]
+        else:
+            # fits baseline, compute advantages and stack path data
+            tasks_samples_data = [self._compute_samples_data(paths) for paths in paths_meta_batch.values()]
 
-        for meta_task, paths in paths_meta_batch.items():
+        return self.merge_task_samples(tasks_samples_data, log=log, log_prefix=log_prefix)
 
-            # fits baseline, compute advantages and stack path data
-            samples_data, paths = self._compute_samples_data(paths)
+    def process_task_samples(self, paths):
+        """
+        Processes the paths of a single task of the meta-batch (computing the returns, fitting the baseline,
+        estimating the advantages and stacking the path data), e.g. as soon as the task has finished sampling.
+        The baselines are fitted on copies, so that several tasks can be processed concurrently in threads.
+
+        Args:
+            paths (list or dict): paths of the task - size: (batch_size) x [5] x (max_path_length)
+
+        Returns:
+            (tuple) : samples data and processed paths of the task, to be merged with merge_task_samples
+        """
+        task_processor = copy.copy(self)
+        task_processor.baseline = copy.deepcopy(self.baseline)
+        if getattr(self, 'return_baseline', None) is not None:
+            task_processor.return_baseline = copy.deepcopy(self.return_baseline)
+        return task_processor._compute_samples_data(paths)
+
+    def merge_task_samples(self, tasks_samples_data, log=False, log_prefix=''):
+        """
+        Computes the statistics over the meta-batch of the processed samples of each task
+
+        Args:
+            tasks_samples_data (list): list (len = meta_batch_size) of the (samples data, paths) of each task
+            log (boolean): indicates whether to log
+            log_prefix (str): prefix for the logging keys
+
+        Returns:
+            (list of dicts) : Processed sample data among the meta-batch;
+                size: [meta_batch_size] x [7] x (batch_size x max_path_length)
+        """
+        samples_data_meta_batch = []
+        all_paths = []
 
+        for samples_data, paths in tasks_samples_data:
             samples_data_meta_batch.append(samples_data)
-            all_paths.extend(paths)
+            all_paths.append(paths)
+        all_paths = self._concatenate_task_paths(all_paths)
 
         # 7) compute normalized trajectory-batch rewards (for E-MAML)
         overall_avg_reward = np.mean(np.concatenate([samples_data['rewards'] for samples_data in samples_data_meta_batch]))
@@ -51,3 +91,5 @@ class MAMLSampleProcessor(SampleProcessor):
 
 class DiceMAMLSampleProcessor(DiceSampleProcessor):
     process_samples = MAMLSampleProcessor.process_samples
+    process_task_samples = MAMLSampleProcessor.process_task_samples
+    merge_task_samples = MAMLSampleProcessor.merge_task_samples
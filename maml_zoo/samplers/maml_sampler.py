@@ -1,5 +1,7 @@
 from maml_zoo.samplers.base import Sampler
-from maml_zoo.samplers.vectorized_env_executor import MAMLParallelEnvExecutor, MAMLIterativeEnvExecutor
+from maml_zoo.samplers.vectorized_env_executor import MAMLParallelEnvExecutor, MAMLIterativeEnvExecutor, \
+    MAMLBatchEnvExecutor
+from maml_zoo.samplers.rollout_buffer import RolloutBuffer, stack_info_dicts
 from maml_zoo.logger import logger
 from maml_zoo.utils import utils
 from collections import OrderedDict
@@ -7,7 +9,6 @@ from collections import OrderedDict
 from pyprind import ProgBar
 import numpy as np
 import time
-import itertools
 
 
 class MAMLSampler(Sampler):
@@ -15,12 +16,36 @@ class MAMLSampler(Sampler):
     Sampler for Meta-RL
 
     Args:
-        env (maml_zoo.envs.base.MetaEnv) : environment object
+        env (maml_zoo.envs.base.MetaEnv) : environment object - if it is a batch env (maml_zoo.envs.base.BatchMetaEnv),
+                                           all envs are stepped at once by a MAMLBatchEnvExecutor
         policy (maml_zoo.policies.base.Policy) : policy object
         batch_size (int) : number of trajectories per task
         meta_batch_size (int) : number of meta tasks
         max_path_length (int) : max number of steps per trajectory
         envs_per_task (int) : number of envs to run vectorized for each task (influences the memory usage)
+        parallel (bool) : whether to run the envs in parallel worker processes
+        n_workers (int or None) : number of parallel worker processes the envs are distributed among -
+                                  defaults to one worker per meta task
+        shared_memory (bool) : whether the parallel workers exchange the step data through shared memory buffers
+        pipelined (bool) : whether to split the envs of each task into two groups held by different workers and
+                           compute the actions of one group while the other group is simulated (requires parallel)
+        padded_output (bool) : whether to return the paths of each task as one dict of arrays padded to
+                               max_path_length, with a mask of the valid steps, instead of a list of path dicts (as
+                               consumed by the DICE sample processors)
+        dtype (np.dtype or None) : dtype of the sampled data (e.g. np.float32 to match the input placeholders of the
+                                   graph) - if None the data is kept in the dtype returned by the envs
+        exact_task_budget (bool) : whether to give every task a quota of rollouts_per_meta_task x max_path_length
+                                   samples instead of stepping all envs until the meta-batch holds total_samples.
+                                   The envs of a task are left idle (neither simulated nor fed to the policy) once
+                                   the paths of the task cover its quota, and the paths still running when the task
+                                   has collected its quota are discarded
+        truncate_paths (bool) : whether to truncate the running paths of a task so that the task collects exactly
+                                its quota (requires exact_task_budget) - otherwise running paths are completed and a
+                                task may exceed its quota by the length of its paths in flight
+        worker_policies (bool) : whether the parallel workers hold a numpy copy of the policies of their tasks and
+                                 sample complete rollouts without exchanging observations and actions with the main
+                                 process - the parameters are only sent to the workers when they have changed (see
+                                 MetaPolicy.params_version). Requires parallel and a policy with get_worker_policy
     """
 
     def __init__(
@@ -31,7 +56,15 @@ class MAMLSampler(Sampler):
             meta_batch_size,
             max_path_length,
             envs_per_task=None,
-            parallel=False
+            parallel=False,
+            n_workers=None,
+            shared_memory=False,
+            pipelined=False,
+            padded_output=False,
+            dtype=None,
+            exact_task_budget=False,
+            truncate_paths=False,
+            worker_policies=False,
             ):
         super(MAMLSampler, self).__init__(env, policy, rollouts_per_meta_task, max_path_length)
         assert hasattr(env, 'set_task')
@@ -39,16 +72,43 @@ class MAMLSampler(Sampler):
         self.envs_per_task = rollouts_per_meta_task if envs_per_task is None else envs_per_task
         self.meta_batch_size = meta_batch_size
         self.total_samples = meta_batch_size * rollouts_per_meta_task * max_path_length
+        self.task_quota = rollouts_per_meta_task * max_path_length
         self.parallel = parallel
+        self.pipelined = pipelined
+        self.padded_output = padded_output
+        self.dtype = dtype
+        self.exact_task_budget = exact_task_budget
+        self.truncate_paths = truncate_paths
+        self.worker_policies = worker_policies
         self.total_timesteps_sampled = 0
+        assert not pipelined or parallel, 'pipelined sampling requires parallel envs'
+        assert not (pipelined and exact_task_budget), 'exact task budgets are not supported by pipelined sampling'
+        assert not truncate_paths or exact_task_budget, 'truncating paths requires exact_task_budget'
+        assert not worker_policies or (parallel and not (pipelined or exact_task_budget or padded_output)), \
+            'worker policies require parallel envs and do not support pipelined, budgeted or padded sampling'
+        assert not (worker_policies and getattr(policy, 'resident_task_params', False)), \
+            'worker policies need the task params in numpy and do not support resident task params'
 
         # setup vectorized environment
 
-        if self.parallel:
-            self.vec_env = MAMLParallelEnvExecutor(env, self.meta_batch_size, self.envs_per_task, self.max_path_length)
+        if getattr(env, 'is_batch_env', False):
+            assert not parallel, 'batch envs are stepped in the main process'
+            self.vec_env = MAMLBatchEnvExecutor(env, self.meta_batch_size, self.envs_per_task, self.max_path_length)
+        elif self.parallel:
+            self.vec_env = MAMLParallelEnvExecutor(env, self.meta_batch_size, self.envs_per_task, self.max_path_length,
+                                                   n_workers=n_workers, shared_memory=shared_memory,
+                                                   n_env_groups=2 if pipelined else 1)
         else:
             self.vec_env = MAMLIterativeEnvExecutor(env, self.meta_batch_size, self.envs_per_task, self.max_path_length)
 
+        # preallocated storage of the running paths
+        self.rollout_buffer = RolloutBuffer(self.vec_env.num_envs, self.max_path_length, dtype=dtype)
+
+        # numpy copies of the policy held by the workers
+        self._worker_params_version = None
+        if self.worker_policies:
+            self.vec_env.set_worker_policy(policy.get_worker_policy())
+
     def update_tasks(self):
         """
         Samples a new goal for each meta task
@@ -61,104 +121,435 @@ class MAMLSampler(Sampler):
         assert len(tasks) == self.meta_batch_size
         self.vec_env.set_tasks(tasks)
 
-    def obtain_samples(self, log=False, log_prefix=''):
+    def obtain_samples(self, log=False, log_prefix='', task_callback=None):
         """
         Collect batch_size trajectories from each task
 
         Args:
             log (boolean): whether to log sampling times
             log_prefix (str) : prefix for logger
+            task_callback (callable or None) : if given, the paths of each task are streamed to
+                                               task_callback(task, paths) as soon as the task has collected its quota
+                                               of samples (rollouts_per_meta_task x max_path_length), while the
+                                               other tasks keep sampling - paths of the task that finish afterwards
+                                               are discarded
 
         Returns: 
-            (dict) : A dict of paths of size [meta_batch_size] x (batch_size) x [5] x (max_path_length)
+            (dict) : A dict of paths of size [meta_batch_size] x (batch_size) x [5] x (max_path_length) - if
+                     padded_output a dict of size [meta_batch_size] of dicts of arrays of shape
+                     (batch_size, max_path_length, ...) that also hold the mask of the valid steps
         """
 
         # initial setup / preparation
-        paths = OrderedDict()
-        for i in range(self.meta_batch_size):
-            paths[i] = []
+        if self.padded_output:
+            paths = []  # (task ids, padded paths) of the paths that finished together
+        else:
+            paths = OrderedDict()
+            for i in range(self.meta_batch_size):
+                paths[i] = []
 
-        n_samples = 0
-        running_paths = [_get_empty_running_paths_dict() for _ in range(self.vec_env.num_envs)]
+        self.rollout_buffer.reset()
+        self._task_callback = task_callback
+        self._task_samples = np.zeros(self.meta_batch_size, dtype=np.int64)
+        self._streamed_tasks = np.zeros(self.meta_batch_size, dtype=bool)
 
         pbar = ProgBar(self.total_samples)
-        policy_time, env_time = 0, 0
 
         policy = self.policy
         policy.reset(dones=[True] * self.meta_batch_size)
 
+        env_steps_saved = None
+        if self.pipelined:
+            policy_time, env_time = self._sample_pipelined(paths, pbar)
+        elif self.exact_task_budget:
+            policy_time, env_time, env_steps_saved = self._sample_task_budget(paths, pbar)
+        elif self.worker_policies:
+            policy_time, env_time = self._sample_worker_rollouts(paths, pbar)
+        else:
+            policy_time, env_time = self._sample(paths, pbar)
+        pbar.stop()
+
+        if task_callback is not None:
+            # streams the tasks that did not reach their quota before the total number of samples was collected
+            self._stream_tasks(paths, np.flatnonzero(~self._streamed_tasks))
+        self._task_callback = None
+
+        if self.padded_output:
+            paths = self._split_padded_paths(paths)
+
+        if self.exact_task_budget:
+            self.total_timesteps_sampled += int(np.sum(self._task_samples))
+        else:
+            self.total_timesteps_sampled += self.total_samples
+        if log:
+            logger.logkv(log_prefix + "PolicyExecTime", policy_time)
+            logger.logkv(log_prefix + "EnvExecTime", env_time)
+            if env_steps_saved is not None:
+                logger.logkv(log_prefix + "EnvStepsSaved", env_steps_saved)
+
+        return paths
+
+    def _sample(self, paths, pbar):
+        """
+        Alternates between computing the actions of all envs and stepping all envs
+
+        Returns:
+            (tuple) : time spent in the policy and time spent stepping the envs
+        """
+        n_samples = 0
+        policy_time, env_time = 0, 0
+
         # initial reset of envs
         obses = self.vec_env.reset()
-        
-        while n_samples < self.total_samples:
-            
+
+        while n_samples < self.total_samples and not self._streamed_tasks.all():
+
             # execute policy
             t = time.time()
-            obs_per_task = np.split(np.asarray(obses), self.meta_batch_size)
-            actions, agent_infos = policy.get_actions(obs_per_task)
+            obses = np.asarray(obses, dtype=self.dtype)
+            actions, agent_infos = self._get_actions(obses)
             policy_time += time.time() - t
 
             # step environments
             t = time.time()
-            actions = np.concatenate(actions) # stack meta batch
             next_obses, rewards, dones, env_infos = self.vec_env.step(actions)
             env_time += time.time() - t
 
-            #  stack agent_infos and if no infos were provided (--> None) create empty dicts
-            agent_infos, env_infos = self._handle_info_dicts(agent_infos, env_infos)
-
-            new_samples = 0
-            for idx, observation, action, reward, env_info, agent_info, done in zip(itertools.count(), obses, actions,
-                                                                                    rewards, env_infos, agent_infos,
-                                                                                    dones):
-                # append new samples to running paths
-                if isinstance(reward, np.ndarray):
-                    reward = reward[0]
-                running_paths[idx]["observations"].append(observation)
-                running_paths[idx]["actions"].append(action)
-                running_paths[idx]["rewards"].append(reward)
-                running_paths[idx]["dones"].append(done)
-                running_paths[idx]["env_infos"].append(env_info)
-                running_paths[idx]["agent_infos"].append(agent_info)
-
-                # if running path is done, add it to paths and empty the running path
-                if done:
-                    paths[idx // self.envs_per_task].append(dict(
-                        observations=np.asarray(running_paths[idx]["observations"]),
-                        actions=np.asarray(running_paths[idx]["actions"]),
-                        rewards=np.asarray(running_paths[idx]["rewards"]),
-                        dones=np.asarray(running_paths[idx]["dones"]),
-                        env_infos=utils.stack_tensor_dict_list(running_paths[idx]["env_infos"]),
-                        agent_infos=utils.stack_tensor_dict_list(running_paths[idx]["agent_infos"]),
-                    ))
-                    new_samples += len(running_paths[idx]["rewards"])
-                    running_paths[idx] = _get_empty_running_paths_dict()
-
+            new_samples = self._add_step(paths, obses, actions, rewards, dones, env_infos, agent_infos,
+                                         self.envs_per_task)
             pbar.update(new_samples)
             n_samples += new_samples
             obses = next_obses
-        pbar.stop()
 
-        self.total_timesteps_sampled += self.total_samples
-        if log:
-            logger.logkv(log_prefix + "PolicyExecTime", policy_time)
-            logger.logkv(log_prefix + "EnvExecTime", env_time)
+        return policy_time, env_time
 
-        return paths
+    def _sample_pipelined(self, paths, pbar):
+        """
+        Steps the env groups of the executor asynchronously: while the workers of one group simulate, the actions of
+        the next group are computed. Every group collects an equal share of the samples.
 
-    def _handle_info_dicts(self, agent_infos, env_infos):
-        if not env_infos:
-            env_infos = [dict() for _ in range(self.vec_env.num_envs)]
-        if not agent_infos:
-            agent_infos = [dict() for _ in range(self.vec_env.num_envs)]
+        Returns:
+            (tuple) : time spent in the policy and time spent blocked on the env workers - the simulation time that
+                      is overlapped with the policy execution is not included in the latter
+        """
+        vec_env = self.vec_env
+        n_groups = vec_env.n_env_groups
+        envs_per_task = self.envs_per_task // n_groups
+        group_quota = self.total_samples / n_groups
+        group_samples = np.zeros(n_groups)
+        policy_time, env_time = 0, 0
+
+        # initial reset of envs
+        t = time.time()
+        obses = np.asarray(vec_env.reset(), dtype=self.dtype)
+        env_time += time.time() - t
+
+        group_obses = [obses[start:end] for start, end in vec_env.group_slices]
+        group_actions, group_agent_infos = [None] * n_groups, [None] * n_groups
+
+        # fill the pipeline
+        for group in range(n_groups):
+            t = time.time()
+            group_actions[group], group_agent_infos[group] = self._get_actions(group_obses[group])
+            policy_time += time.time() - t
+            vec_env.step_async(group_actions[group], group)
+
+        active_groups = list(range(n_groups))
+        while active_groups:
+            for group in list(active_groups):
+                t = time.time()
+                next_obses, rewards, dones, env_infos = vec_env.step_wait(group)
+                env_time += time.time() - t
+
+                new_samples = self._add_step(paths, group_obses[group], group_actions[group], rewards, dones,
+                                             env_infos, group_agent_infos[group], envs_per_task,
+                                             env_offset=vec_env.group_slices[group][0])
+                pbar.update(new_samples)
+                group_samples[group] += new_samples
+
+                if group_samples[group] >= group_quota or self._streamed_tasks.all():
+                    active_groups.remove(group)
+                    continue
+
+                # compute the next actions of the group while the other groups are simulated
+                t = time.time()
+                group_obses[group] = np.asarray(next_obses, dtype=self.dtype)
+                group_actions[group], group_agent_infos[group] = self._get_actions(group_obses[group])
+                policy_time += time.time() - t
+                vec_env.step_async(group_actions[group], group)
+
+        return policy_time, env_time
+
+    def _sample_worker_rollouts(self, paths, pbar):
+        """
+        Sends the parameters of the policies to the workers if they have changed and lets every worker sample
+        complete paths of its envs with its copy of the policies
+
+        Returns:
+            (tuple) : time spent sending the parameters of the policies and time spent waiting for the workers
+        """
+        t = time.time()
+        if self._worker_params_version != self.policy.params_version:
+            task_params, pre_update = self.policy.get_worker_params()
+            self.vec_env.set_worker_params(task_params, pre_update)
+            self._worker_params_version = self.policy.params_version
+        policy_time = time.time() - t
+
+        t = time.time()
+        env_paths = self.vec_env.rollout(self.total_samples / self.vec_env.num_envs, dtype=self.dtype)
+        env_time = time.time() - t
+
+        for env_idx, path in env_paths:
+            task = self.vec_env.env_task_ids[env_idx]
+            paths[task].append(path)
+            self._task_samples[task] += len(path["rewards"])
+            pbar.update(len(path["rewards"]))
+        return policy_time, env_time
+
+    def _sample_task_budget(self, paths, pbar):
+        """
+        Steps only the active envs, i.e. the envs whose task has not collected its quota yet. An env becomes idle once
+        the finished and running paths of its task cover the quota (with truncate_paths the running paths beyond the
+        quota are truncated), so that every task collects its quota of samples.
+
+        Returns:
+            (tuple) : time spent in the policy, time spent stepping the envs and the number of env steps saved
+                      compared to stepping all envs until the last task is done
+        """
+        vec_env, rollout_buffer = self.vec_env, self.rollout_buffer
+        env_task_ids = vec_env.env_task_ids
+        active = np.ones(vec_env.num_envs, dtype=bool)
+        n_iterations, n_env_steps = 0, 0
+        policy_time, env_time = 0, 0
+
+        # initial reset of envs
+        obses = np.asarray(vec_env.reset(), dtype=self.dtype)
+
+        while True:
+            if self.truncate_paths:
+                self._truncate_task_paths(paths, active)
+            if not active.any():
+                break
+            env_ids = np.flatnonzero(active)
+
+            # execute policy
+            t = time.time()
+            actions, agent_infos = self._get_env_actions(obses, env_ids)
+            policy_time += time.time() - t
+
+            # step environments
+            t = time.time()
+            next_obses, rewards, dones, env_infos = vec_env.step(actions, env_ids=env_ids)
+            env_time += time.time() - t
+
+            if not isinstance(env_infos, dict):
+                env_infos = stack_info_dicts(env_infos) if env_infos else dict()
+            new_samples = self._add_step(paths, obses[env_ids], actions, rewards, dones, env_infos, agent_infos,
+                                         None, env_ids=env_ids)
+            pbar.update(new_samples)
+            obses[env_ids] = np.asarray(next_obses, dtype=obses.dtype)
+            n_iterations += 1
+            n_env_steps += len(env_ids)
+
+            # envs whose path finished do not start a new path once the paths of their task cover the quota, the
+            # envs of a task that has collected its quota are left idle
+            running_samples = np.bincount(env_task_ids, weights=rollout_buffer.path_lengths * active,
+                                          minlength=self.meta_batch_size)
+            covered_tasks = self._task_samples + running_samples >= self.task_quota
+            done_env_ids = env_ids[np.flatnonzero(dones)]
+            active[done_env_ids[covered_tasks[env_task_ids[done_env_ids]]]] = False
+            active[self._task_samples[env_task_ids] >= self.task_quota] = False
+
+        return policy_time, env_time, n_iterations * vec_env.num_envs - n_env_steps
+
+    def _truncate_task_paths(self, paths, active):
+        """
+        Leaves idle as many active envs of each task as needed for the next step not to exceed the quota of the task.
+        The running paths of these envs (the shortest ones of the task) are truncated and moved to paths.
+        """
+        env_task_ids, path_lengths = self.vec_env.env_task_ids, self.rollout_buffer.path_lengths
+        n_active = np.bincount(env_task_ids[active], minlength=self.meta_batch_size)
+        running_samples = np.bincount(env_task_ids, weights=path_lengths * active, minlength=self.meta_batch_size)
+        remaining = np.maximum(self.task_quota - self._task_samples - running_samples, 0).astype(int)
+
+        truncated_env_ids = []
+        for task in np.flatnonzero(n_active > remaining):
+            task_env_ids = np.flatnonzero(active & (env_task_ids == task))
+            task_env_ids = task_env_ids[np.argsort(-path_lengths[task_env_ids], kind='stable')]
+            truncated_env_ids.extend(task_env_ids[remaining[task]:])
+        if not truncated_env_ids:
+            return
+
+        truncated_env_ids = np.sort(truncated_env_ids)
+        active[truncated_env_ids] = False
+        self._pop_paths(paths, truncated_env_ids[path_lengths[truncated_env_ids] > 0])
+
+    def _get_env_actions(self, obses, env_ids):
+        """
+        Computes the actions of the given envs only. The observations of the envs are grouped by task and padded to
+        the largest number of envs of a task, since the policy takes the same number of observations per task.
+
+        Returns:
+            (tuple) : actions of the envs and their agent infos stacked into a dict of arrays
+        """
+        task_ids = self.vec_env.env_task_ids[env_ids]
+        n_task_envs = np.bincount(task_ids, minlength=self.meta_batch_size)
+        slots = np.arange(len(env_ids)) - (np.cumsum(n_task_envs) - n_task_envs)[task_ids]  # env_ids are task-major
+        envs_per_task = int(np.max(n_task_envs))
+
+        obs_per_task = np.zeros((self.meta_batch_size, envs_per_task) + obses.shape[1:], dtype=obses.dtype)
+        obs_per_task[task_ids, slots] = obses[env_ids]
+        actions, agent_infos = self.policy.get_actions(list(obs_per_task))
+
+        actions = np.stack([np.asarray(task_actions) for task_actions in actions])[task_ids, slots]
+        agent_infos, _ = self._handle_info_dicts(agent_infos, dict(), envs_per_task)
+        return actions, utils.index_tensor_dict(agent_infos, task_ids * envs_per_task + slots)
+
+    def _get_actions(self, obses):
+        """
+        Computes the actions of the envs (ordered task-major)
+
+        Returns:
+            (tuple) : stacked actions and the agent infos returned by the policy
+        """
+        obs_per_task = np.split(obses, self.meta_batch_size)
+        actions, agent_infos = self.policy.get_actions(obs_per_task)
+        return np.concatenate(actions), agent_infos  # stack meta batch
+
+    def _add_step(self, paths, obses, actions, rewards, dones, env_infos, agent_infos, envs_per_task, env_offset=0,
+                  env_ids=None):
+        """
+        Appends a step of a contiguous range of env slots (or of the envs in env_ids, with already stacked infos) to
+        the running paths and moves the finished paths to paths.
+        The finished paths of tasks that were already streamed are discarded.
+
+        Returns:
+            (int) : number of samples in the finished paths
+        """
+        if env_ids is None:
+            env_ids = np.arange(env_offset, env_offset + len(obses))
+
+            #  stack agent_infos and env_infos into arrays (empty dicts if no infos were provided)
+            agent_infos, env_infos = self._handle_info_dicts(agent_infos, env_infos, envs_per_task)
+
+        # append new samples to the running paths
+        self.rollout_buffer.add(observations=obses,
+                                actions=actions,
+                                rewards=rewards,
+                                dones=dones,
+                                env_infos=env_infos,
+                                agent_infos=agent_infos,
+                                env_ids=env_ids,
+                                )
+
+        return self._pop_paths(paths, env_ids[np.flatnonzero(dones)])
+
+    def _pop_paths(self, paths, done_env_ids):
+        """
+        Moves the running paths of the given envs to paths
+
+        Returns:
+            (int) : number of samples in the paths
+        """
+        # add the paths to paths padded and empty the running paths
+        if self.padded_output:
+            if len(done_env_ids) == 0:
+                return 0
+            padded_paths = self.rollout_buffer.pop_padded_paths(done_env_ids)
+            task_ids = self.vec_env.env_task_ids[done_env_ids]
+            keep = np.flatnonzero(~self._streamed_tasks[task_ids])
+            if len(keep) < len(task_ids):
+                task_ids, padded_paths = task_ids[keep], utils.index_tensor_dict(padded_paths, keep)
+            paths.append((task_ids, padded_paths))
+            np.add.at(self._task_samples, task_ids, np.sum(padded_paths["mask"], axis=1).astype(np.int64))
+            new_samples = int(np.sum(padded_paths["mask"]))
         else:
-            assert len(agent_infos) == self.meta_batch_size
-            assert len(agent_infos[0]) == self.envs_per_task
-            agent_infos = sum(agent_infos, [])  # stack agent_infos
+            # add the path to paths and empty the running path
+            new_samples = 0
+            for idx in done_env_ids:
+                task = self.vec_env.env_task_ids[idx]
+                path = self.rollout_buffer.pop_path(idx)
+                if self._streamed_tasks[task]:
+                    continue
+                paths[task].append(path)
+                self._task_samples[task] += len(path["rewards"])
+                new_samples += len(path["rewards"])
+
+        if self._task_callback is not None:
+            self._stream_tasks(paths, np.flatnonzero((self._task_samples >= self.task_quota) & ~self._streamed_tasks))
+        return new_samples
+
+    def _stream_tasks(self, paths, tasks):
+        """
+        Hands the paths of the given tasks over to the task callback and marks the tasks as streamed
+        """
+        for task in tasks:
+            self._streamed_tasks[task] = True
+            if self.padded_output:
+                task_chunks = [chunk for chunk in paths if np.any(chunk[0] == task)]
+                task_paths = self._split_padded_paths(task_chunks, tasks=[task])[task]
+            else:
+                task_paths = paths[task]
+            self._task_callback(task, task_paths)
 
-        assert len(agent_infos) == self.meta_batch_size * self.envs_per_task == len(env_infos)
-        return agent_infos, env_infos
+    def _split_padded_paths(self, padded_path_chunks, tasks=None):
+        """
+        Concatenates the padded paths that finished in the different steps and splits them by task
+
+        Args:
+            padded_path_chunks (list) : (task ids, padded paths) of the paths that finished together
+            tasks (list or None) : tasks to return the paths of - defaults to all tasks
+
+        Returns:
+            (OrderedDict) : dict of the padded paths of each task
+        """
+        tasks = range(self.meta_batch_size) if tasks is None else tasks
+        task_ids = np.concatenate([chunk_task_ids for chunk_task_ids, _ in padded_path_chunks])
+        padded_paths = utils.concat_tensor_dict_list([chunk for _, chunk in padded_path_chunks])
+        return OrderedDict([(task, utils.index_tensor_dict(padded_paths, np.flatnonzero(task_ids == task)))
+                            for task in tasks])
+
+    def _handle_info_dicts(self, agent_infos, env_infos, envs_per_task=None):
+        """
+        Stacks the agent and env infos of one step into dicts of arrays with a leading (num_envs) dimension
+
+        Args:
+            agent_infos (list or dict) : either a list (meta_batch_size) of lists (envs_per_task) of dicts or
+                                         columnar agent infos - a dict of arrays that are either per env
+                                         (meta_batch_size, envs_per_task, dim) or shared by a task (meta_batch_size, dim)
+            env_infos (list or dict) : list (num_envs) of dicts or a dict of arrays with leading dimension num_envs
+            envs_per_task (int or None) : number of envs per task the infos belong to - defaults to all envs per task
+
+        Returns:
+            (tuple) : stacked agent_infos and env_infos
+        """
+        envs_per_task = self.envs_per_task if envs_per_task is None else envs_per_task
+        num_envs = self.meta_batch_size * envs_per_task
+
+        if not isinstance(env_infos, dict):  # batch envs already return stacked env infos
+            if not env_infos:
+                env_infos = [dict() for _ in range(num_envs)]
+            assert len(env_infos) == num_envs
+            env_infos = stack_info_dicts(env_infos)
+
+        if not agent_infos:
+            return dict(), env_infos
 
+        if isinstance(agent_infos, dict):
+            stacked_agent_infos = dict()
+            for key, value in agent_infos.items():
+                value = np.asarray(value)
+                assert value.shape[0] == self.meta_batch_size
+                if value.ndim == 3:
+                    assert value.shape[1] == envs_per_task
+                    value = value.reshape((num_envs,) + value.shape[2:])
+                else:
+                    value = np.repeat(value, envs_per_task, axis=0)
+                stacked_agent_infos[key] = value
+            return stacked_agent_infos, env_infos
 
-def _get_empty_running_paths_dict():
-    return dict(observations=[], actions=[], rewards=[], dones=[], env_infos=[], agent_infos=[])
+        assert len(agent_infos) == self.meta_batch_size
+        assert len(agent_infos[0]) == envs_per_task
+        agent_infos = [info for task_agent_infos in agent_infos for info in task_agent_infos]
+        assert len(agent_infos) == num_envs
+        return utils.stack_tensor_dict_list(agent_infos), env_infos
@@ -0,0 +1,233 @@
+import numpy as np
+
+
+class RolloutBuffer(object):
+    """
+    Preallocated columnar storage for the running paths of a vectorized sampler. Every array has the shape
+    (num_envs, max_path_length, ...) and is filled with one vectorized assignment per step. The arrays are allocated
+    lazily at the first step (the shapes and dtypes are inferred from the data) and then reused for all paths.
+    The keys, shapes and dtypes of the env and agent infos may change from step to step: info keys that show up after
+    the first step, go missing or hold non-numeric values are stored in object arrays (None for the steps without a
+    value) and the buffer of an info key is promoted when a step holds values that can't be cast to its dtype.
+
+    Args:
+        num_envs (int): number of environments that are stepped in parallel
+        max_path_length (int): max number of steps per trajectory
+        dtype (np.dtype or None): dtype of the non-boolean data - if None float32 data is kept as float32 and
+                                  everything else is stored as float64
+    """
+
+    def __init__(self, num_envs, max_path_length, dtype=None):
+        self.num_envs = num_envs
+        self.max_path_length = max_path_length
+        self.dtype = dtype
+        self.path_lengths = np.zeros(num_envs, dtype=int)
+        self._env_ids = np.arange(num_envs)
+        self._data = None
+
+    def reset(self):
+        """
+        Discards all running paths
+        """
+        self.path_lengths[:] = 0
+
+    def add(self, observations, actions, rewards, dones, env_infos, agent_infos, env_ids=None):
+        """
+        Appends one step of every env (or of the envs in env_ids) to its running path
+
+        Args:
+            observations (np.ndarray): observations of shape (n, obs_dim)
+            actions (np.ndarray): actions of shape (n, action_dim)
+            rewards (np.ndarray): rewards of shape (n,)
+            dones (np.ndarray): dones of shape (n,)
+            env_infos (dict): dict of arrays with leading dimension n
+            agent_infos (dict): dict of arrays with leading dimension n
+            env_ids (np.ndarray or None): indices of the n envs the step data belongs to - defaults to all envs
+        """
+        env_ids = self._env_ids if env_ids is None else np.asarray(env_ids)
+        step_data = dict(
+            observations=np.asarray(observations),
+            actions=np.asarray(actions),
+            rewards=np.reshape(rewards, (len(env_ids),)),
+            dones=np.reshape(dones, (len(env_ids),)),
+            env_infos=env_infos,
+            agent_infos=agent_infos,
+        )
+        time_steps = self.path_lengths[env_ids]
+        assert np.all(time_steps < self.max_path_length), 'running path exceeds max_path_length'
+
+        if self._data is None:
+            self._data = self._allocate(step_data, len(env_ids))
+        self._write(self._data, step_data, env_ids, time_steps)
+        for key in ("env_infos", "agent_infos"):
+            self._write_infos(self._data[key], step_data[key], env_ids, time_steps)
+        self.path_lengths[env_ids] += 1
+
+    def pop_path(self, env_id):
+        """
+        Removes the running path of an env from the buffer
+
+        Args:
+            env_id (int): index of the env whose path is finished
+
+        Returns:
+            (dict): path dict with observations, actions, rewards, dones, env_infos and agent_infos - the arrays are
+                    copies of the buffer slices since the slot is reused by the next path of the env
+        """
+        path_length = self.path_lengths[env_id]
+        path = self._read(self._data, env_id, path_length)
+        self.path_lengths[env_id] = 0
+        return path
+
+    def pop_padded_paths(self, env_ids):
+        """
+        Removes the running paths of several envs from the buffer, keeping them padded to max_path_length
+
+        Args:
+            env_ids (np.ndarray): indices of the envs whose paths are finished
+
+        Returns:
+            (dict): dict with observations, actions, rewards, dones, env_infos and agent_infos of shape
+                    (len(env_ids), max_path_length, ...) - zero after the end of each path - and the mask of the valid
+                    steps of shape (len(env_ids), max_path_length)
+        """
+        env_ids = np.asarray(env_ids)
+        mask = np.arange(self.max_path_length)[None, :] < self.path_lengths[env_ids][:, None]
+        padded_paths = self._read_padded(self._data, env_ids, mask)
+        padded_paths["mask"] = mask.astype(self.dtype or np.float64)
+        self.path_lengths[env_ids] = 0
+        return padded_paths
+
+    """ helper functions """
+
+    def _allocate(self, step_data, n_envs, infos=False):
+        buffers = dict()
+        for key, value in step_data.items():
+            if isinstance(value, dict):
+                buffers[key] = self._allocate(value, n_envs, infos=True)
+            else:
+                value = np.asarray(value)
+                assert value.shape[0] == n_envs
+                dtype = self._info_dtype(value.dtype) if infos else self._data_dtype(value.dtype)
+                buffers[key] = np.zeros((self.num_envs, self.max_path_length) + value.shape[1:], dtype=dtype)
+        return buffers
+
+    def _data_dtype(self, dtype):
+        # keep booleans and float32 data as they are, everything else is stored as float64 (or in self.dtype)
+        if dtype == np.bool_:
+            return dtype
+        return self.dtype or np.result_type(dtype, np.float32)
+
+    def _info_dtype(self, dtype):
+        # infos additionally keep integers as they are and store non-numeric data as objects
+        if dtype.kind in 'biu':
+            return dtype
+        if dtype.kind == 'f':
+            return self._data_dtype(dtype)
+        return np.dtype(object)
+
+    def _write(self, buffers, step_data, env_ids, time_steps):
+        for key, value in step_data.items():
+            if not isinstance(value, dict):
+                buffers[key][env_ids, time_steps] = value
+
+    def _write_infos(self, buffers, infos, env_ids, time_steps):
+        for key in list(buffers.keys()):
+            if key not in infos:
+                self._write_missing(buffers, key, env_ids, time_steps)
+
+        for key, value in infos.items():
+            if isinstance(value, dict):
+                assert not isinstance(buffers.get(key), np.ndarray), 'info %s changed from an array to a dict' % key
+                self._write_infos(buffers.setdefault(key, dict()), value, env_ids, time_steps)
+                continue
+            assert not isinstance(buffers.get(key), dict), 'info %s changed from a dict to an array' % key
+
+            value = np.asarray(value)
+            if key not in buffers:
+                # the earlier steps of the running paths hold no value for the key
+                buffers[key] = np.full((self.num_envs, self.max_path_length), None, dtype=object)
+            buffer = buffers[key]
+            if buffer.shape[2:] != value.shape[1:]:
+                # the shape of the values changed -> store one object (of any shape) per step
+                buffer, value = _object_steps(buffer), _object_column(value)
+            elif not np.can_cast(value.dtype, buffer.dtype, casting='same_kind'):
+                buffer = buffer.astype(self._promote_info_dtype(buffer.dtype, value.dtype))
+            buffer[env_ids, time_steps] = value
+            buffers[key] = buffer
+
+    def _write_missing(self, buffers, key, env_ids, time_steps):
+        if isinstance(buffers[key], dict):
+            for nested_key in list(buffers[key].keys()):
+                self._write_missing(buffers[key], nested_key, env_ids, time_steps)
+            return
+        buffers[key] = _object_steps(buffers[key])
+        buffers[key][env_ids, time_steps] = None
+
+    def _promote_info_dtype(self, buffer_dtype, value_dtype):
+        if buffer_dtype.kind in 'biuf' and value_dtype.kind in 'biuf':
+            return self._info_dtype(np.result_type(buffer_dtype, value_dtype))
+        return np.dtype(object)
+
+    def _read_padded(self, buffers, env_ids, mask):
+        padded = dict()
+        for key, value in buffers.items():
+            if isinstance(value, dict):
+                padded[key] = self._read_padded(value, env_ids, mask)
+            else:
+                padded[key] = value[env_ids]  # fancy indexing copies the rows
+                padded[key][~mask] = 0  # clear the steps of earlier paths of the slots
+        return padded
+
+    def _read(self, buffers, env_id, path_length):
+        return dict([(key, self._read(value, env_id, path_length)) if isinstance(value, dict)
+                     else (key, value[env_id, :path_length].copy()) for key, value in buffers.items()])
+
+
+def stack_info_dicts(info_dicts):
+    """
+    Stacks the info dicts of several envs into a dict of arrays with leading dimension len(info_dicts). Unlike
+    utils.stack_tensor_dict_list the dicts may hold different keys: keys that are missing in some of the dicts or
+    hold values that can't be stacked into a numeric array are stored in object arrays (None where missing).
+
+    Args:
+        info_dicts (list): list of (possibly nested) info dicts
+
+    Returns:
+        (dict) : dict of arrays
+    """
+    keys = list(dict.fromkeys([key for info_dict in info_dicts for key in info_dict]))
+    stacked = dict()
+    for key in keys:
+        values = [info_dict.get(key) for info_dict in info_dicts]
+        if all([isinstance(value, dict) for value in values]):
+            stacked[key] = stack_info_dicts(values)
+            continue
+        if all([key in info_dict for info_dict in info_dicts]):
+            try:
+                value = np.asarray(values)
+                if value.dtype.kind in 'biuf':
+                    stacked[key] = value
+                    continue
+            except ValueError:  # ragged values
+                pass
+        stacked[key] = _object_column(values)
+    return stacked
+
+
+def _object_column(values):
+    # one object per element of the leading dimension, so that values of any shape fit
+    column = np.empty(len(values), dtype=object)
+    for idx, value in enumerate(values):
+        column[idx] = value
+    return column
+
+
+def _object_steps(buffer):
+    # converts a buffer into one object per (env, time step)
+    if buffer.ndim == 2 and buffer.dtype == object:
+        return buffer
+    steps = np.empty(buffer.shape[:2], dtype=object)
+    for idx in np.ndindex(*buffer.shape[:2]):
+        steps[idx] = buffer[idx]
+    return steps
@@ -1,7 +1,16 @@
+from maml_zoo.samplers.rollout_buffer import RolloutBuffer, stack_info_dicts
 import numpy as np
 import pickle as pickle
-from multiprocessing import Process, Pipe
+from multiprocessing import Process, Pipe, Event
+from multiprocessing.sharedctypes import RawArray
+import ctypes
+import itertools
 import copy
+from collections import OrderedDict
+
+# commands of the shared memory workers
+CMD_STEP, CMD_RESET, CMD_SET_TASK, CMD_CLOSE, CMD_SET_POLICY, CMD_ROLLOUT = range(6)
+WORKER_POLL_INTERVAL = 1.  # seconds between the liveness checks of a worker that is waited for
 
 
 class MAMLIterativeEnvExecutor(object):
@@ -21,33 +30,37 @@ class MAMLIterativeEnvExecutor(object):
         self.envs = np.asarray([copy.deepcopy(env) for _ in range(meta_batch_size * envs_per_task)])
         self.ts = np.zeros(len(self.envs), dtype='int')  # time steps
         self.max_path_length = max_path_length
+        self.env_task_ids = np.repeat(np.arange(meta_batch_size), envs_per_task)
 
-    def step(self, actions):
+    def step(self, actions, env_ids=None):
         """
         Steps the wrapped environments with the provided actions
 
         Args:
-            actions (list): lists of actions, of length meta_batch_size x envs_per_task
+            actions (list): lists of actions, of length meta_batch_size x envs_per_task (or len(env_ids))
+            env_ids (np.ndarray or None): ascending indices of the envs to step - the other envs are left idle.
+                                          Defaults to all envs
 
         Returns
             (tuple): a length 4 tuple of lists, containing obs (np.array), rewards (float), dones (bool),
-             env_infos (dict). Each list is of length meta_batch_size x envs_per_task
+             env_infos (dict). Each list is of length meta_batch_size x envs_per_task (or len(env_ids))
              (assumes that every task has same number of envs)
         """
-        assert len(actions) == self.num_envs
+        env_ids = np.arange(self.num_envs) if env_ids is None else np.asarray(env_ids)
+        assert len(actions) == len(env_ids)
 
-        all_results = [env.step(a) for (a, env) in zip(actions, self.envs)]
+        all_results = [env.step(a) for (a, env) in zip(actions, self.envs[env_ids])]
 
         # stack results split to obs, rewards, ...
         obs, rewards, dones, env_infos = list(map(list, zip(*all_results)))
 
         # reset env when done or max_path_length reached
         dones = np.asarray(dones)
-        self.ts += 1
-        dones = np.logical_or(self.ts >= self.max_path_length, dones)
+        self.ts[env_ids] += 1
+        dones = np.logical_or(self.ts[env_ids] >= self.max_path_length, dones)
         for i in np.argwhere(dones).flatten():
-            obs[i] = self.envs[i].reset()
-            self.ts[i] = 0
+            obs[i] = self.envs[env_ids[i]].reset()
+            self.ts[env_ids[i]] = 0
 
         return obs, rewards, dones, env_infos
 
@@ -85,30 +98,173 @@ class MAMLIterativeEnvExecutor(object):
         return len(self.envs)
 
 
+class MAMLBatchEnvExecutor(object):
+    """
+    Wraps a batch environment (maml_zoo.envs.base.BatchMetaEnv) and provides the same interface as the other
+    executors. All env slots are stepped with one call to the batch env and the slots whose path is done or has
+    reached max_path_length are reset with one masked reset call - there is no python loop over the envs.
+
+    Args:
+        env (maml_zoo.envs.base.BatchMetaEnv): batch meta environment object
+        meta_batch_size (int): number of meta tasks
+        envs_per_task (int): number of environments per meta task
+        max_path_length (int): maximum length of sampled environment paths - if the max_path_length is reached,
+                               the respective environment is reset
+    """
+
+    def __init__(self, env, meta_batch_size, envs_per_task, max_path_length):
+        self.env = copy.deepcopy(env)
+        self.env.set_num_envs(meta_batch_size * envs_per_task)
+        self.ts = np.zeros(meta_batch_size * envs_per_task, dtype='int')  # time steps
+        self.max_path_length = max_path_length
+        self.env_task_ids = np.repeat(np.arange(meta_batch_size), envs_per_task)
+
+    def step(self, actions, env_ids=None):
+        """
+        Steps the wrapped environments with the provided actions
+
+        Args:
+            actions (np.ndarray): actions of shape (meta_batch_size x envs_per_task, action_dim) (or
+                                  (len(env_ids), action_dim))
+            env_ids (np.ndarray or None): ascending indices of the envs whose results are returned - all env slots
+                                          are simulated by the one vectorized step of the batch env regardless (the
+                                          other slots with zero actions) and their results are discarded.
+                                          Defaults to all envs
+
+        Returns
+            (tuple): a length 4 tuple containing obs (np.ndarray), rewards (np.ndarray), dones (np.ndarray) and
+             env_infos (dict of np.ndarray), each with leading dimension meta_batch_size x envs_per_task
+             (or len(env_ids))
+        """
+        if env_ids is not None:
+            assert len(actions) == len(env_ids)
+            all_actions = np.zeros((self.num_envs,) + np.shape(actions)[1:])
+            all_actions[env_ids] = actions
+            actions = all_actions
+        assert len(actions) == self.num_envs
+
+        obs, rewards, dones, env_infos = self.env.step(np.asarray(actions))
+
+        # reset env when done or max_path_length reached
+        self.ts += 1
+        dones = np.logical_or(self.ts >= self.max_path_length, dones)
+        if np.any(dones):
+            obs = self.env.reset(mask=dones)
+            self.ts[dones] = 0
+
+        if env_ids is not None:
+            obs, rewards, dones = np.asarray(obs)[env_ids], np.asarray(rewards)[env_ids], dones[env_ids]
+            env_infos = dict([(key, np.asarray(value)[env_ids]) for key, value in env_infos.items()])
+        return obs, rewards, dones, env_infos
+
+    def set_tasks(self, tasks):
+        """
+        Sets a list of tasks to each environment
+
+        Args:
+            tasks (list): list of the tasks for each meta task
+        """
+        self.env.set_tasks([tasks[task_id] for task_id in self.env_task_ids])
+
+    def reset(self):
+        """
+        Resets the environments
+
+        Returns:
+            (np.ndarray): the new initial observations of shape (meta_batch_size x envs_per_task, obs_dim)
+        """
+        self.ts[:] = 0
+        return self.env.reset()
+
+    @property
+    def num_envs(self):
+        """
+        Number of environments
+
+        Returns:
+            (int): number of environments
+        """
+        return len(self.ts)
+
+
 class MAMLParallelEnvExecutor(object):
     """
     Wraps multiple environments of the same kind and provides functionality to reset / step the environments
-    in a vectorized manner. Thereby the environments are distributed among meta_batch_size processes and
+    in a vectorized manner. Thereby the environments are distributed among n_workers processes and
     executed in parallel.
 
+    The meta_batch_size x envs_per_task envs are split into n_workers contiguous slices. Env i belongs to task
+    i // envs_per_task, so a worker may hold the envs of several tasks (n_workers < meta_batch_size) or a fraction of
+    the envs of one task (n_workers > meta_batch_size). By default, there is one worker per task.
+
+    If shared_memory is set, observations, actions, rewards and dones are exchanged through preallocated
+    shared memory buffers (one slot per env) instead of being pickled through pipes, and the workers are
+    signalled through events. The pipes are then only used for env_infos (if an env returns a non-empty
+    info dict) and for the tasks sent by set_tasks.
+
+    If n_env_groups > 1, the envs of each task are split evenly into n_env_groups groups that are held by disjoint
+    sets of workers. The env slots are then ordered group-major (group -> task -> env), i.e. each group occupies a
+    contiguous range of slots and the task of every slot is given by env_task_ids. The groups can be stepped
+    independently with step_async / step_wait, so that the actions of one group can be computed while the other
+    groups are simulated.
+
+    Alternatively the workers can hold a numpy copy of the policies (see set_worker_policy) and sample complete
+    rollouts of their envs (see rollout). The parameters of the policies are then only sent when they change and
+    only the finished paths are sent back.
+
     Args:
         env (maml_zoo.envs.base.MetaEnv): meta environment object
         meta_batch_size (int): number of meta tasks
         envs_per_task (int): number of environments per meta task
         max_path_length (int): maximum length of sampled environment paths - if the max_path_length is reached,
                              the respective environment is reset
+        n_workers (int or None): number of worker processes - defaults to meta_batch_size
+        shared_memory (bool): whether to exchange the step data through shared memory buffers
+        n_env_groups (int): number of env groups that can be stepped independently
     """
 
-    def __init__(self, env, meta_batch_size, envs_per_task, max_path_length):
+    def __init__(self, env, meta_batch_size, envs_per_task, max_path_length, n_workers=None, shared_memory=False,
+                 n_env_groups=1):
+        assert envs_per_task % n_env_groups == 0, 'envs_per_task must be divisible by n_env_groups'
         self.n_envs = meta_batch_size * envs_per_task
         self.meta_batch_size = meta_batch_size
         self.envs_per_task = envs_per_task
-        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(meta_batch_size)])
-        seeds = np.random.choice(range(10**6), size=meta_batch_size, replace=False)
-
-        self.ps = [
-            Process(target=worker, args=(work_remote, remote, pickle.dumps(env), envs_per_task, max_path_length, seed))
-            for (work_remote, remote, seed) in zip(self.work_remotes, self.remotes, seeds)]  # Why pass work remotes?
+        self.n_workers = min(meta_batch_size if n_workers is None else n_workers, self.n_envs)
+        self.shared_memory = shared_memory
+        self.n_env_groups = n_env_groups
+        assert self.n_workers >= n_env_groups, 'every env group needs at least one worker'
+
+        # group -> task -> env -> worker mapping
+        group_size = self.n_envs // n_env_groups
+        self.env_task_ids = np.tile(np.repeat(np.arange(meta_batch_size), envs_per_task // n_env_groups), n_env_groups)
+        self.group_slices = [(group * group_size, (group + 1) * group_size) for group in range(n_env_groups)]
+        self.group_workers = [list(worker_ids) for worker_ids in np.array_split(np.arange(self.n_workers), n_env_groups)]
+        self.env_slices = [(env_ids[0], env_ids[-1] + 1)
+                           for (start, end), worker_ids in zip(self.group_slices, self.group_workers)
+                           for env_ids in np.array_split(np.arange(start, end), len(worker_ids))]
+        self._all_workers = list(range(self.n_workers))
+        self._env_worker_ids = np.concatenate([np.full(end - start, worker_idx)
+                                               for worker_idx, (start, end) in enumerate(self.env_slices)])
+
+        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(self.n_workers)])
+        seeds = np.random.choice(range(10**6), size=self.n_workers, replace=False)
+
+        if self.shared_memory:
+            self._buffers = SharedStepBuffers(env, self.n_envs, self.n_workers)
+            self._start_events = [Event() for _ in range(self.n_workers)]
+            self._done_events = [Event() for _ in range(self.n_workers)]
+            self.ps = [
+                Process(target=shared_memory_worker,
+                        args=(work_remote, remote, pickle.dumps(env), max_path_length, seed, self._buffers,
+                              worker_idx, env_slice, start_event, done_event))
+                for (work_remote, remote, seed, worker_idx, env_slice, start_event, done_event)
+                in zip(self.work_remotes, self.remotes, seeds, itertools.count(), self.env_slices,
+                       self._start_events, self._done_events)]
+        else:
+            self.ps = [
+                Process(target=worker, args=(work_remote, remote, pickle.dumps(env), end - start, max_path_length, seed))
+                for (work_remote, remote, seed, (start, end)) in zip(self.work_remotes, self.remotes, seeds,
+                                                                     self.env_slices)]  # Why pass work remotes?
 
         for p in self.ps:
             p.daemon = True  # if the main process crashes, we should not cause things to hang
@@ -116,33 +272,163 @@ class MAMLParallelEnvExecutor(object):
         for remote in self.work_remotes:
             remote.close()
 
-    def step(self, actions):
+    def step(self, actions, env_ids=None):
         """
         Executes actions on each env
 
         Args:
-            actions (list): lists of actions, of length meta_batch_size x envs_per_task
+            actions (list): lists of actions, of length meta_batch_size x envs_per_task (or len(env_ids))
+            env_ids (np.ndarray or None): ascending indices of the envs to step - the other envs are left idle and
+                                          workers that hold no env to step are not woken up. Defaults to all envs
 
         Returns
             (tuple): a length 4 tuple of lists, containing obs (np.array), rewards (float), dones (bool), env_infos (dict)
                       each list is of length meta_batch_size x envs_per_task (assumes that every task has same number of envs)
+                      (or len(env_ids))
         """
+        if env_ids is not None:
+            return self._step_envs(actions, np.asarray(env_ids))
         assert len(actions) == self.num_envs
+        self._send_actions(actions, self._all_workers)
+        return self._receive_results(self._all_workers)
+
+    def _step_envs(self, actions, env_ids):
+        """
+        Steps only the given envs - every worker steps its envs among them
+        """
+        assert len(actions) == len(env_ids)
+        worker_ids = np.unique(self._env_worker_ids[env_ids])
+
+        if self.shared_memory:
+            buffers = self._buffers
+            buffers.active[:] = False
+            buffers.active[env_ids] = True
+            buffers.actions[env_ids] = np.reshape(actions, (len(env_ids), buffers.action_dim))
+            self._start_workers(CMD_STEP, worker_ids)
+            self._wait_workers(worker_ids)
+
+            env_infos = []
+            for worker_idx in worker_ids:
+                if buffers.has_infos[worker_idx]:
+                    env_infos.extend(self.remotes[worker_idx].recv())
+                else:
+                    start, end = self.env_slices[worker_idx]
+                    env_infos.extend([dict() for _ in range(np.sum(buffers.active[start:end]))])
+            return (buffers.obs[env_ids], buffers.rewards[env_ids], buffers.dones[env_ids], env_infos)
+
+        for worker_idx in worker_ids:
+            start, end = self.env_slices[worker_idx]
+            worker_env_idx = np.flatnonzero((env_ids >= start) & (env_ids < end))
+            self.remotes[worker_idx].send(('step_envs', (env_ids[worker_env_idx] - start,
+                                                         [actions[i] for i in worker_env_idx])))
+        results = [self.remotes[worker_idx].recv() for worker_idx in worker_ids]
+        obs, rewards, dones, env_infos = map(lambda x: sum(x, []), zip(*results))
+        return obs, rewards, dones, env_infos
 
-        # split list of actions in list of list of actions per meta tasks
-        chunks = lambda l, n: [l[x: x + n] for x in range(0, len(l), n)]
-        actions_per_meta_task = chunks(actions, self.envs_per_task)
+    def step_async(self, actions, group):
+        """
+        Sends the actions of an env group to its workers without waiting for the results
+
+        Args:
+            actions (list): lists of actions for the envs of the group, of length meta_batch_size x
+                            (envs_per_task / n_env_groups)
+            group (int): index of the env group
+        """
+        start, end = self.group_slices[group]
+        assert len(actions) == end - start
+        self._send_actions(actions, self.group_workers[group])
+
+    def step_wait(self, group):
+        """
+        Blocks until the workers of an env group have executed the actions sent by step_async
 
-        # step remote environments
-        for remote, action_list in zip(self.remotes, actions_per_meta_task):
-            remote.send(('step', action_list))
+        Args:
+            group (int): index of the env group
 
-        results = [remote.recv() for remote in self.remotes]
+        Returns
+            (tuple): a length 4 tuple of lists, containing obs (np.array), rewards (float), dones (bool), env_infos (dict)
+                      for the envs of the group
+        """
+        return self._receive_results(self.group_workers[group])
+
+    def _send_actions(self, actions, worker_ids):
+        """
+        Sends the actions to the workers - the workers must hold a contiguous range of env slots
+        """
+        offset, end = self.env_slices[worker_ids[0]][0], self.env_slices[worker_ids[-1]][1]
+
+        if self.shared_memory:
+            buffers = self._buffers
+            buffers.actions[offset:end] = np.reshape(actions, (end - offset, buffers.action_dim))
+            buffers.active[offset:end] = True
+            self._start_workers(CMD_STEP, worker_ids)
+            return
+
+        # step remote environments with the actions of the envs they hold
+        for worker_idx in worker_ids:
+            start, end = self.env_slices[worker_idx]
+            self.remotes[worker_idx].send(('step', actions[start - offset:end - offset]))
+
+    def _receive_results(self, worker_ids):
+        """
+        Collects the step results of the workers
+        """
+        if self.shared_memory:
+            return self._receive_shared_memory_results(worker_ids)
+
+        results = [self.remotes[worker_idx].recv() for worker_idx in worker_ids]
 
         obs, rewards, dones, env_infos = map(lambda x: sum(x, []), zip(*results))
 
         return obs, rewards, dones, env_infos
 
+    def _receive_shared_memory_results(self, worker_ids):
+        buffers = self._buffers
+        self._wait_workers(worker_ids)
+
+        env_infos = []
+        for worker_idx in worker_ids:
+            start, end = self.env_slices[worker_idx]
+            if buffers.has_infos[worker_idx]:
+                env_infos.extend(self.remotes[worker_idx].recv())
+            else:
+                env_infos.extend([dict() for _ in range(end - start)])
+
+        # the buffers are overwritten by the next step -> hand out copies
+        start, end = self.env_slices[worker_ids[0]][0], self.env_slices[worker_ids[-1]][1]
+        return (np.copy(buffers.obs[start:end]), np.copy(buffers.rewards[start:end]),
+                np.copy(buffers.dones[start:end]), env_infos)
+
+    def _signal_workers(self, cmd):
+        """
+        Sets the command for every worker, wakes them up and blocks until all of them are done
+        """
+        self._start_workers(cmd, self._all_workers)
+        self._wait_workers(self._all_workers)
+
+    def _start_workers(self, cmd, worker_ids):
+        """
+        Sets the command for the given workers and wakes them up
+        """
+        self._buffers.cmds[worker_ids] = cmd
+        for worker_idx in worker_ids:
+            # setting the event blocks until all processes waiting on it woke up -> never set it for a dead worker
+            self._check_worker_alive(worker_idx)
+            self._start_events[worker_idx].set()
+
+    def _wait_workers(self, worker_ids):
+        """
+        Blocks until the given workers are done - raises if a worker died instead of waiting forever
+        """
+        for worker_idx in worker_ids:
+            while not self._done_events[worker_idx].wait(WORKER_POLL_INTERVAL):
+                self._check_worker_alive(worker_idx)
+            self._done_events[worker_idx].clear()
+
+    def _check_worker_alive(self, worker_idx):
+        if not self.ps[worker_idx].is_alive():
+            raise RuntimeError('sampler worker %d died with exit code %s' % (worker_idx, self.ps[worker_idx].exitcode))
+
     def reset(self):
         """
         Resets the environments of each worker
@@ -150,19 +436,95 @@ class MAMLParallelEnvExecutor(object):
         Returns:
             (list): list of (np.ndarray) with the new initial observations.
         """
+        if self.shared_memory:
+            self._signal_workers(CMD_RESET)
+            return np.copy(self._buffers.obs)
+
         for remote in self.remotes:
             remote.send(('reset', None))
         return sum([remote.recv() for remote in self.remotes], [])
 
+    def set_worker_policy(self, policy):
+        """
+        Sends a numpy copy of the policy to each worker
+
+        Args:
+            policy (maml_zoo.policies.worker_gaussian_mlp_policy.WorkerGaussianMLPPolicy): picklable policy
+        """
+        self._send_worker_commands(CMD_SET_POLICY, 'set_policy', [('policy', policy)] * self.n_workers)
+
+    def set_worker_params(self, task_params, pre_update):
+        """
+        Sends the parameters of the policies of the tasks of its envs to each worker
+
+        Args:
+            task_params (OrderedDict): param values of the task policies stacked along a leading task dimension -
+                                       a single policy shared by all tasks if pre_update
+            pre_update (bool): whether the params are the ones of the pre-update policy
+        """
+        worker_data = []
+        for start, end in self.env_slices:
+            if pre_update:
+                worker_task_ids, env_task_ids = np.zeros(1, dtype=int), np.zeros(end - start, dtype=int)
+            else:
+                worker_task_ids, env_task_ids = np.unique(self.env_task_ids[start:end], return_inverse=True)
+            worker_params = OrderedDict([(key, value[worker_task_ids]) for key, value in task_params.items()])
+            worker_data.append(('params', (worker_params, env_task_ids, pre_update)))
+        self._send_worker_commands(CMD_SET_POLICY, 'set_policy', worker_data)
+
+    def rollout(self, n_samples_per_env, dtype=None):
+        """
+        Resets the envs and lets every worker sample complete paths of its envs with its copy of the policy, until
+        the paths of the worker hold n_samples_per_env samples per env
+
+        Args:
+            n_samples_per_env (float): number of samples per env
+            dtype (np.dtype or None): dtype of the sampled data (see RolloutBuffer)
+
+        Returns:
+            (list): list of (env index, path dict) of the finished paths
+        """
+        worker_paths = self._send_worker_commands(CMD_ROLLOUT, 'rollout',
+                                                  [(n_samples_per_env * (end - start), dtype)
+                                                   for start, end in self.env_slices])
+        return [(start + env_idx, path) for (start, _), paths in zip(self.env_slices, worker_paths)
+                for env_idx, path in paths]
+
+    def _send_worker_commands(self, cmd, pipe_cmd, worker_data):
+        """
+        Sends a command with its data to every worker through the pipes and collects the replies of the workers
+        """
+        if self.shared_memory:
+            for remote, data in zip(self.remotes, worker_data):
+                remote.send(data)
+            self._start_workers(cmd, self._all_workers)
+            replies = [remote.recv() for remote in self.remotes]
+            self._wait_workers(self._all_workers)
+            return replies
+
+        for remote, data in zip(self.remotes, worker_data):
+            remote.send((pipe_cmd, data))
+        return [remote.recv() for remote in self.remotes]
+
     def set_tasks(self, tasks=None):
         """
-        Sets a list of tasks to each worker
+        Sets a list of tasks to each worker. Each worker receives the tasks of the envs it holds.
 
         Args:
-            tasks (list): list of the tasks for each worker
+            tasks (list): list of the tasks for each meta task
         """
-        for remote, task in zip(self.remotes, tasks):
-            remote.send(('set_task', task))
+        assert len(tasks) == self.meta_batch_size
+        tasks_per_worker = [[tasks[task_id] for task_id in self.env_task_ids[start:end]]
+                            for start, end in self.env_slices]
+
+        if self.shared_memory:
+            for remote, worker_tasks in zip(self.remotes, tasks_per_worker):
+                remote.send(worker_tasks)
+            self._signal_workers(CMD_SET_TASK)
+            return
+
+        for remote, worker_tasks in zip(self.remotes, tasks_per_worker):
+            remote.send(('set_task', worker_tasks))
         for remote in self.remotes:
             remote.recv()
 
@@ -177,6 +539,50 @@ class MAMLParallelEnvExecutor(object):
         return self.n_envs
 
 
+class SharedStepBuffers(object):
+    """
+    Preallocated shared memory buffers holding the step data of all envs (one slot per env). The buffers are
+    allocated before the workers are forked and can be passed to the worker processes as arguments.
+
+    Args:
+        env (maml_zoo.envs.base.MetaEnv): meta environment object - used to infer the observation / action dims
+        n_envs (int): total number of environments
+        n_workers (int): number of worker processes
+    """
+
+    def __init__(self, env, n_envs, n_workers):
+        self.n_envs = n_envs
+        self.obs_dim = int(np.prod(env.observation_space.shape))
+        self.action_dim = int(np.prod(env.action_space.shape))
+
+        self._raw_obs = RawArray(ctypes.c_double, n_envs * self.obs_dim)
+        self._raw_actions = RawArray(ctypes.c_double, n_envs * self.action_dim)
+        self._raw_rewards = RawArray(ctypes.c_double, n_envs)
+        self._raw_dones = RawArray(ctypes.c_bool, n_envs)
+        self._raw_active = RawArray(ctypes.c_bool, n_envs)
+        self._raw_has_infos = RawArray(ctypes.c_bool, n_workers)
+        self._raw_cmds = RawArray(ctypes.c_int, n_workers)
+        self._wrap_buffers()
+
+    def _wrap_buffers(self):
+        self.obs = np.frombuffer(self._raw_obs, dtype=np.float64).reshape(self.n_envs, self.obs_dim)
+        self.actions = np.frombuffer(self._raw_actions, dtype=np.float64).reshape(self.n_envs, self.action_dim)
+        self.rewards = np.frombuffer(self._raw_rewards, dtype=np.float64)
+        self.dones = np.frombuffer(self._raw_dones, dtype=np.bool_)
+        self.active = np.frombuffer(self._raw_active, dtype=np.bool_)  # envs stepped by CMD_STEP
+        self.has_infos = np.frombuffer(self._raw_has_infos, dtype=np.bool_)
+        self.cmds = np.frombuffer(self._raw_cmds, dtype=np.intc)
+
+    def __getstate__(self):
+        # numpy views on the raw arrays can't be pickled -> only ship the raw arrays and re-wrap them
+        return dict((key, value) for key, value in self.__dict__.items()
+                    if key.startswith('_raw') or key in ('n_envs', 'obs_dim', 'action_dim'))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._wrap_buffers()
+
+
 def worker(remote, parent_remote, env_pickle, n_envs, max_path_length, seed):
     """
     Instantiation of a parallel worker for collecting samples. It loops continually checking the task that the remote
@@ -196,20 +602,22 @@ def worker(remote, parent_remote, env_pickle, n_envs, max_path_length, seed):
     np.random.seed(seed)
 
     ts = np.zeros(n_envs, dtype='int')
+    policy = None
 
     while True:
         # receive command and data from the remote
         cmd, data = remote.recv()
 
-        # do a step in each of the environment of the worker
-        if cmd == 'step':
-            all_results = [env.step(a) for (a, env) in zip(data, envs)]
+        # do a step in each of the environment of the worker (or in the envs given by step_envs)
+        if cmd == 'step' or cmd == 'step_envs':
+            env_ids, actions = (range(n_envs), data) if cmd == 'step' else data
+            all_results = [envs[i].step(a) for (i, a) in zip(env_ids, actions)]
             obs, rewards, dones, infos = map(list, zip(*all_results))
-            ts += 1
-            for i in range(n_envs):
-                if dones[i] or (ts[i] >= max_path_length):
-                    dones[i] = True
-                    obs[i] = envs[i].reset()
+            for j, i in enumerate(env_ids):
+                ts[i] += 1
+                if dones[j] or (ts[i] >= max_path_length):
+                    dones[j] = True
+                    obs[j] = envs[i].reset()
                     ts[i] = 0
             remote.send((obs, rewards, dones, infos))
 
@@ -219,12 +627,21 @@ def worker(remote, parent_remote, env_pickle, n_envs, max_path_length, seed):
             ts[:] = 0
             remote.send(obs)
 
-        # set the specified task for each of the environments of the worker
+        # set the specified task for each of the environments of the worker (one task per env)
         elif cmd == 'set_task':
-            for env in envs:
-                env.set_task(data)
+            for env, task in zip(envs, data):
+                env.set_task(task)
             remote.send(None)
 
+        # set the numpy copy of the policy or its params
+        elif cmd == 'set_policy':
+            policy = set_worker_policy(policy, data)
+            remote.send(None)
+
+        # sample complete paths of the environments of the worker with the policy
+        elif cmd == 'rollout':
+            remote.send(worker_rollout(envs, ts, policy, max_path_length, *data))
+
         # close the remote and stop the worker
         elif cmd == 'close':
             remote.close()
@@ -232,3 +649,161 @@ def worker(remote, parent_remote, env_pickle, n_envs, max_path_length, seed):
 
         else:
             raise NotImplementedError
+
+
+def shared_memory_worker(remote, parent_remote, env_pickle, max_path_length, seed, buffers, worker_idx, env_slice,
+                         start_event, done_event):
+    """
+    Instantiation of a parallel worker that exchanges the step data through shared memory buffers. It waits for the
+    start event, executes the command the main process has written into its command slot and signals the done
+    event when finished.
+
+    Args:
+        remote (multiprocessing.Connection):
+        parent_remote (multiprocessing.Connection):
+        env_pickle (pkl): pickled environment
+        max_path_length (int): maximum path length of the task
+        seed (int): random seed for the worker
+        buffers (SharedStepBuffers): shared memory buffers of all envs
+        worker_idx (int): index of the worker
+        env_slice (tuple): (start, end) indices of the env slots owned by the worker
+        start_event (multiprocessing.Event): set by the main process once a command is ready
+        done_event (multiprocessing.Event): set by the worker once the command is executed
+    """
+    parent_remote.close()
+
+    start, end = env_slice
+    n_envs = end - start
+    obs, actions = buffers.obs[start:end], buffers.actions[start:end]
+    rewards, dones, active = buffers.rewards[start:end], buffers.dones[start:end], buffers.active[start:end]
+
+    envs = [pickle.loads(env_pickle) for _ in range(n_envs)]
+    np.random.seed(seed)
+
+    ts = np.zeros(n_envs, dtype='int')
+    policy = None
+
+    while True:
+        start_event.wait()
+        start_event.clear()
+        cmd = buffers.cmds[worker_idx]
+
+        # do a step in each active environment of the worker and write the results into the shared buffers
+        if cmd == CMD_STEP:
+            infos = []
+            for i in np.flatnonzero(active):
+                env = envs[i]
+                next_obs, reward, done, info = env.step(actions[i])
+                rewards[i] = np.asarray(reward).item()
+                ts[i] += 1
+                if done or (ts[i] >= max_path_length):
+                    done = True
+                    next_obs = env.reset()
+                    ts[i] = 0
+                obs[i] = next_obs
+                dones[i] = done
+                infos.append(info)
+
+            # env_infos can't be written into fixed size buffers -> only send them if there are any. Large infos
+            # don't fit into the pipe buffer and block the send until the main process receives them, which it only
+            # does once the step is done -> signal done before sending
+            buffers.has_infos[worker_idx] = any(infos)
+            done_event.set()
+            if buffers.has_infos[worker_idx]:
+                remote.send(infos)
+            continue
+
+        # reset all the environments of the worker
+        elif cmd == CMD_RESET:
+            for i, env in enumerate(envs):
+                obs[i] = env.reset()
+            ts[:] = 0
+
+        # set the tasks sent through the pipe for each of the environments of the worker (one task per env)
+        elif cmd == CMD_SET_TASK:
+            tasks = remote.recv()
+            for env, task in zip(envs, tasks):
+                env.set_task(task)
+
+        # set the numpy copy of the policy or its params sent through the pipe
+        elif cmd == CMD_SET_POLICY:
+            policy = set_worker_policy(policy, remote.recv())
+            remote.send(None)
+
+        # sample complete paths of the environments of the worker with the policy and send them through the pipe
+        elif cmd == CMD_ROLLOUT:
+            remote.send(worker_rollout(envs, ts, policy, max_path_length, *remote.recv()))
+
+        # close the remote and stop the worker
+        elif cmd == CMD_CLOSE:
+            remote.close()
+            done_event.set()
+            break
+
+        else:
+            raise NotImplementedError
+
+        done_event.set()
+
+
+def set_worker_policy(policy, data):
+    """
+    Args:
+        policy (WorkerGaussianMLPPolicy or None): current policy of the worker
+        data (tuple): either ('policy', policy) or ('params', (task params, env task ids, pre_update))
+
+    Returns:
+        (WorkerGaussianMLPPolicy): the policy of the worker
+    """
+    kind, value = data
+    if kind == 'policy':
+        return value
+    assert policy is not None, 'the policy of the worker has not been set'
+    policy.set_params(*value)
+    return policy
+
+
+def worker_rollout(envs, ts, policy, max_path_length, n_samples, dtype):
+    """
+    Resets the envs of a worker and samples complete paths with the numpy policy of the worker until the finished
+    paths hold n_samples samples
+
+    Args:
+        envs (list): environments of the worker
+        ts (np.ndarray): time steps of the environments - updated in place
+        policy (WorkerGaussianMLPPolicy): numpy policy of the worker
+        max_path_length (int): maximum path length of the task
+        n_samples (float): number of samples to collect
+        dtype (np.dtype or None): dtype of the sampled data (see RolloutBuffer)
+
+    Returns:
+        (list): list of (env index, path dict) of the finished paths
+    """
+    assert policy is not None, 'the policy of the worker has not been set'
+    rollout_buffer = RolloutBuffer(len(envs), max_path_length, dtype=dtype)
+    obs = np.asarray([env.reset() for env in envs], dtype=dtype)
+    ts[:] = 0
+    paths, samples = [], 0
+
+    while samples < n_samples:
+        actions, agent_infos = policy.get_actions(obs)
+        next_obs, rewards, dones, env_infos = map(list, zip(*[env.step(a) for (a, env) in zip(actions, envs)]))
+        ts += 1
+        dones = np.logical_or(dones, ts >= max_path_length)
+        rollout_buffer.add(observations=obs,
+                           actions=actions,
+                           rewards=rewards,
+                           dones=dones,
+                           env_infos=stack_info_dicts(env_infos),
+                           agent_infos=agent_infos,
+                           )
+
+        for i in np.flatnonzero(dones):
+            path = rollout_buffer.pop_path(i)
+            paths.append((i, path))
+            samples += len(path["rewards"])
+            next_obs[i] = envs[i].reset()
+            ts[i] = 0
+        obs = np.asarray(next_obs, dtype=dtype)
+
+    return paths
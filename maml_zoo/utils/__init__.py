@@ -1,2 +1,3 @@
 from maml_zoo.utils.serializable import Serializable
-from maml_zoo.utils.utils import *
\ No newline at end of file
+from maml_zoo.utils.utils import *
+from maml_zoo.utils.param_layout import ParamLayout
@@ -0,0 +1,120 @@
+import tensorflow as tf
+import numpy as np
+from collections import OrderedDict
+
+
+class ParamLayout(object):
+    """
+    Layout of a set of parameters in one contiguous flat float32 vector. The parameters are laid out in the order of
+    the given dict, each one as a flattened block.
+
+    The values of all parameters are fetched and assigned with a single op, and flat buffers are split into named
+    views of the parameters without copying. A leading batch dimension (e.g. tasks or line search candidates) is
+    supported by all conversions, so that the parameters of several policies are held in one (n, size) buffer.
+
+    Args:
+        params (OrderedDict) : dict of the tf.Variables laid out
+    """
+    def __init__(self, params):
+        self.params = params
+        self.keys = list(params.keys())
+        self.shapes = [tuple(param.shape.as_list()) for param in params.values()]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.offsets = np.cumsum([0] + self.sizes)
+        self.size = int(self.offsets[-1])
+
+        self._flat_var = None
+        self._assign_ph = None
+        self._assign_op = None
+
+    """ --- numpy buffers --- """
+
+    def flatten(self, params_vals):
+        """
+        Args:
+            params_vals (dict) : parameter values, optionally with a common leading batch dimension
+
+        Returns:
+            (ndarray) : flat float32 buffer - shape: batch_shape + (size,)
+        """
+        first_shape = np.shape(params_vals[self.keys[0]])
+        batch_shape = first_shape[:len(first_shape) - len(self.shapes[0])]
+        return np.concatenate([np.reshape(np.asarray(params_vals[key], dtype=np.float32), batch_shape + (-1,))
+                               for key in self.keys], axis=-1)
+
+    def unflatten(self, flat_params):
+        """
+        Args:
+            flat_params (ndarray) : flat buffer - shape: batch_shape + (size,)
+
+        Returns:
+            (OrderedDict) : views of the parameters in the buffer - shape: batch_shape + param shape
+        """
+        batch_shape = flat_params.shape[:-1]
+        return OrderedDict([(key, flat_params[..., start:end].reshape(batch_shape + shape))
+                            for key, shape, start, end in zip(self.keys, self.shapes, self.offsets[:-1],
+                                                              self.offsets[1:])])
+
+    @staticmethod
+    def replicate(flat_params, n):
+        """
+        Replicates a flat buffer n times along a new leading dimension, without copying
+
+        Returns:
+            (ndarray) : read-only buffer - shape: (n,) + flat_params.shape
+        """
+        return np.broadcast_to(flat_params, (n,) + flat_params.shape)
+
+    """ --- symbolic --- """
+
+    def flatten_sym(self, params_sym):
+        """
+        Args:
+            params_sym (dict or list) : symbolic parameters (in the order of the layout if given as a list) without
+                                        batch dimension
+
+        Returns:
+            (tf.Tensor) : flat vector - shape: (size,)
+        """
+        if isinstance(params_sym, dict):
+            params_sym = [params_sym[key] for key in self.keys]
+        return tf.concat([tf.reshape(param, [-1]) for param in params_sym], axis=0)
+
+    def unflatten_sym(self, flat_params_sym):
+        """
+        Args:
+            flat_params_sym (tf.Tensor) : flat vector(s) with a leading batch dimension - shape: (n, size)
+
+        Returns:
+            (OrderedDict) : symbolic parameters - shape: (n,) + param shape
+        """
+        return OrderedDict([(key, tf.reshape(flat_param, [-1] + list(shape)))
+                            for key, shape, flat_param in zip(self.keys, self.shapes,
+                                                              tf.split(flat_params_sym, self.sizes, axis=1))])
+
+    """ --- session --- """
+
+    def get_flat(self):
+        """
+        Returns:
+            (ndarray) : current values of all parameters in one flat buffer, fetched with a single op
+        """
+        if self._flat_var is None:
+            self._build_ops()
+        return tf.compat.v1.get_default_session().run(self._flat_var)
+
+    def set_flat(self, flat_params):
+        """
+        Assigns all parameters from one flat buffer with a single op
+        """
+        if self._assign_op is None:
+            self._build_ops()
+        tf.compat.v1.get_default_session().run(self._assign_op, feed_dict={self._assign_ph: flat_params})
+
+    def _build_ops(self):
+        params = list(self.params.values())
+        self._flat_var = self.flatten_sym(params)
+        self._assign_ph = tf.compat.v1.placeholder(dtype=tf.float32, shape=[self.size])
+        self._assign_op = tf.group(*[tf.compat.v1.assign(param, tf.reshape(flat_param, shape))
+                                     for param, shape, flat_param in zip(params, self.shapes,
+                                                                         tf.split(self._assign_ph, self.sizes))])
@@ -81,6 +81,55 @@ def discount_cumsum(x, discount):
     return scipy.signal.lfilter([1], [1, float(-discount)], x[::-1], axis=0)[::-1]
 
 
+def padding_index(lengths):
+    """
+    Args:
+        lengths (np.ndarray) : lengths of the paths
+
+    Returns:
+        (tuple) : path index and time step of each sample of the concatenated paths - shape: (sum(lengths),)
+    """
+    path_idx = np.repeat(np.arange(len(lengths)), lengths)
+    time_idx = np.arange(np.sum(lengths)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return path_idx, time_idx
+
+
+def discount_cumsum_padded(x, discount):
+    """
+    discount_cumsum of zero-padded paths along their time axis. The padding follows the end of each path, so that it
+    does not leak into the values of the path.
+
+    Args:
+        x (np.ndarray) : zero-padded paths - shape: (num_paths, max_path_length)
+        discount (float) : discount factor
+
+    Returns:
+        (np.ndarray) : discounted cumulative sums - shape: (num_paths, max_path_length)
+    """
+    return scipy.signal.lfilter([1], [1, float(-discount)], x[:, ::-1], axis=1)[:, ::-1]
+
+
+def gae_padded(rewards, baselines, mask, discount, gae_lambda):
+    """
+    Generalized Advantage Estimation (see Schulman et al. 2015 - https://arxiv.org/abs/1506.02438) for zero-padded
+    paths, treating the baseline after the end of each path as zero
+
+    Args:
+        rewards (np.ndarray) : rewards of the paths - shape: (num_paths, max_path_length)
+        baselines (np.ndarray) : baselines of the paths - shape: (num_paths, max_path_length)
+        mask (np.ndarray) : mask of the valid time steps - shape: (num_paths, max_path_length)
+        discount (float) : reward discount factor
+        gae_lambda (float) : Generalized Advantage Estimation lambda
+
+    Returns:
+        (np.ndarray) : advantages, zero on the padding - shape: (num_paths, max_path_length)
+    """
+    baselines = baselines * mask
+    next_baselines = np.concatenate([baselines[:, 1:], np.zeros((len(baselines), 1))], axis=1)
+    deltas = (rewards + discount * next_baselines - baselines) * mask
+    return discount_cumsum_padded(deltas, discount * gae_lambda)
+
+
 def explained_variance_1d(ypred, y):
     """
     Args:
@@ -121,6 +170,19 @@ def concat_tensor_dict_list(tensor_dict_list):
     return ret
 
 
+def index_tensor_dict(tensor_dict, idx):
+    """
+    Args:
+        tensor_dict (dict) : (nested) dict of tensors with a common first dimension
+        idx (np.ndarray) : indices along the first dimension
+
+    Returns:
+        (dict) : dict of the indexed tensors
+    """
+    return dict([(key, index_tensor_dict(value, idx)) if isinstance(value, dict) else (key, value[idx])
+                 for key, value in tensor_dict.items()])
+
+
 def _stack_tensor_dict_list(tensor_dict_list):
     """
     Args:
@@ -166,6 +228,25 @@ def stack_tensor_dict_list(tensor_dict_list, max_path=None):
     return ret
 
 
+def pad_and_stack(arrays, length=None):
+    """
+    Stacks arrays whose first dimensions differ along a new leading dimension, zero-padding them to the same length
+
+    Args:
+        arrays (list) : list of numpy arrays of shape (n_i, ...)
+        length (int or None) : length to pad to - the largest n_i if None
+
+    Returns:
+        (ndarray) : stacked array of shape (len(arrays), length, ...)
+    """
+    lengths = [array.shape[0] for array in arrays]
+    length = max(lengths) if length is None else length
+    padded = np.zeros((len(arrays), length) + arrays[0].shape[1:], dtype=np.float32)
+    for i, array in enumerate(arrays):
+        padded[i, :lengths[i]] = array
+    return padded
+
+
 def create_feed_dict(placeholder_dict, value_dict):
     """
     matches the placeholders with their values given a placeholder and value_dict.
@@ -181,7 +262,26 @@ def create_feed_dict(placeholder_dict, value_dict):
     assert set(placeholder_dict.keys()) <= set(value_dict.keys()), \
         "value dict must provide the necessary data to serve all placeholders in placeholder_dict"
     # match the placeholders with their values
-    return dict([(placeholder_dict[key], value_dict[key]) for key in placeholder_dict.keys()])
+    return dict([(placeholder_dict[key], as_placeholder_dtype(placeholder_dict[key], value_dict[key]))
+                 for key in placeholder_dict.keys()])
+
+
+def as_placeholder_dtype(placeholder, value):
+    """
+    Converts a numpy array to the dtype of the placeholder it is fed to, so that the conversion happens once instead
+    of in every session.run the feed dict is used in. Arrays that already have the dtype of the placeholder (e.g.
+    float32 samples data) are returned as they are.
+
+    Args:
+        placeholder (tf.Tensor) : placeholder the value is fed to
+        value : value to be fed
+
+    Returns: the value in the dtype of the placeholder
+
+    """
+    if isinstance(value, np.ndarray) and value.dtype != placeholder.dtype.as_numpy_dtype:
+        return value.astype(placeholder.dtype.as_numpy_dtype)
+    return value
 
 def set_seed(seed):
     """
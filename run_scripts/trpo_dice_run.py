@@ -35,6 +35,7 @@ def main(config):
         meta_batch_size=config['meta_batch_size'],
         max_path_length=config['max_path_length'],
         parallel=config['parallel'],
+        padded_output=config.get('padded_output', False),
     )
 
     sample_processor = DiceMAMLSampleProcessor(
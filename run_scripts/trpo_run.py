@@ -1,4 +1,4 @@
-from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline
+from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline, AccumulatingLinearFeatureBaseline
 from maml_zoo.envs.point_envs.point_env_2d import MetaPointEnv
 from maml_zoo.envs.mujoco_envs.half_cheetah_rand_direc import HalfCheetahRandDirecEnv
 from maml_zoo.envs.normalized_env import normalize
@@ -17,7 +17,10 @@ maml_zoo_path = '/'.join(os.path.realpath(os.path.dirname(__file__)).split('/')[
 
 
 def main(config):
-    baseline = LinearFeatureBaseline()
+    if config.get('accumulating_baseline', False):
+        baseline = AccumulatingLinearFeatureBaseline()
+    else:
+        baseline = LinearFeatureBaseline()
     env = normalize(HalfCheetahRandDirecEnv())
 
     policy = MetaGaussianMLPPolicy(
@@ -26,6 +29,7 @@ def main(config):
             action_dim=np.prod(env.action_space.shape),
             meta_batch_size=config['meta_batch_size'],
             hidden_sizes=config['hidden_sizes'],
+            batched_task_graph=config.get('vectorized_tasks', False),
         )
 
     sampler = MAMLSampler(
@@ -35,6 +39,10 @@ def main(config):
         meta_batch_size=config['meta_batch_size'],
         max_path_length=config['max_path_length'],
         parallel=config['parallel'],
+        dtype=config.get('sample_dtype', None),
+        exact_task_budget=config.get('exact_task_budget', False),
+        truncate_paths=config.get('truncate_paths', False),
+        worker_policies=config.get('worker_policies', False),
     )
 
     sample_processor = MAMLSampleProcessor(
@@ -43,6 +51,9 @@ def main(config):
         gae_lambda=config['gae_lambda'],
         normalize_adv=config['normalize_adv'],
         positive_adv=config['positive_adv'],
+        batched_task_baselines=config.get('batched_task_baselines', False),
+        vectorized_advantages=config.get('vectorized_advantages', False),
+        dtype=config.get('sample_dtype', None),
     )
 
     algo = TRPOMAML(
@@ -51,7 +62,13 @@ def main(config):
         inner_type=config['inner_type'],
         meta_batch_size=config['meta_batch_size'],
         num_inner_grad_steps=config['num_inner_grad_steps'],
-        inner_lr=config['inner_lr']
+        inner_lr=config['inner_lr'],
+        symbolic_hvp=config.get('symbolic_hvp', False),
+        in_graph_cg=config.get('in_graph_cg', False),
+        vectorized_tasks=config.get('vectorized_tasks', False),
+        batched_line_search=config.get('batched_line_search', False),
+        line_search_batch_size=config.get('line_search_batch_size', None),
+        subsample_factor=config.get('subsample_factor', 1.),
     )
 
     trainer = Trainer(
@@ -62,6 +79,8 @@ def main(config):
         sample_processor=sample_processor,
         n_itr=config['n_itr'],
         num_inner_grad_steps=config['num_inner_grad_steps'],  # This is repeated in MAMLPPO, it's confusing
+        stream_sample_processing=config.get('stream_sample_processing', False),
+        n_processing_threads=config.get('n_processing_threads', None),
     )
     trainer.train()
 
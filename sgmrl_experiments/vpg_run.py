@@ -9,8 +9,8 @@ import pathmagic
 
 with pathmagic.context():
     from maml_zoo.utils.utils import set_seed
-    from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline
-    from maml_zoo.envs.point_envs.point_env_2d_v2 import MetaPointEnv
+    from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline, AccumulatingLinearFeatureBaseline
+    from maml_zoo.envs.point_envs.point_env_2d_v2 import MetaPointEnv, BatchMetaPointEnv
     from maml_zoo.envs.mujoco_envs.half_cheetah_rand_direc import HalfCheetahRandDirecEnv
     from maml_zoo.envs.mujoco_envs.ant_rand_direc import AntRandDirecEnv
     from maml_zoo.envs.mujoco_envs.ant_rand_direc_2d import AntRandDirec2DEnv
@@ -28,6 +28,7 @@ MAML_ZOO_PATH = '/'.join(os.path.realpath(os.path.dirname(__file__)).split('/')[
 ENV_DICT = {'point': MetaPointEnv,
             'cheetah_dir': HalfCheetahRandDirecEnv,
             }
+BATCH_ENV_DICT = {'point': BatchMetaPointEnv}  # envs that can be stepped as one batch in the main process
 
 parser = ArgumentParser()
 parser.add_argument('--algo', choices=['sgmrl', 'maml'], default='sgmrl')
@@ -46,8 +47,14 @@ def main(config):
     for gpu_id in range(len(physical_devices)):
         tf.config.experimental.set_memory_growth(physical_devices[gpu_id], True)
 
-    baseline = LinearFeatureBaseline()
-    env = normalize(ENV_DICT[config['env']]())
+    if config.get('accumulating_baseline', False):
+        baseline = AccumulatingLinearFeatureBaseline()
+    else:
+        baseline = LinearFeatureBaseline()
+    if config.get('batch_env', False):
+        env = normalize(BATCH_ENV_DICT[config['env']]())
+    else:
+        env = normalize(ENV_DICT[config['env']]())
 
     policy = MetaGaussianMLPPolicy(
         name="meta-policy",
@@ -55,6 +62,10 @@ def main(config):
         action_dim=np.prod(env.action_space.shape),
         meta_batch_size=config['meta_batch_size'],
         hidden_sizes=config['hidden_sizes'],
+        columnar_agent_infos=config.get('columnar_agent_infos', False),
+        numpy_inference=config.get('numpy_inference', False),
+        resident_task_params=config.get('resident_task_params', False),
+        batched_task_graph=config.get('batched_task_graph', config.get('vectorized_tasks', False)),
     )
 
     sampler = MAMLSampler(
@@ -64,6 +75,13 @@ def main(config):
         meta_batch_size=config['meta_batch_size'],
         max_path_length=config['max_path_length'],
         parallel=config['parallel'],
+        n_workers=config.get('n_workers', None),
+        shared_memory=config.get('shared_memory', False),
+        pipelined=config.get('pipelined', False),
+        dtype=config.get('sample_dtype', None),
+        exact_task_budget=config.get('exact_task_budget', False),
+        truncate_paths=config.get('truncate_paths', False),
+        worker_policies=config.get('worker_policies', False),
     )
 
     sample_processor = MAMLSampleProcessor(
@@ -72,6 +90,9 @@ def main(config):
         gae_lambda=config['gae_lambda'],
         normalize_adv=config['normalize_adv'],
         positive_adv=config['positive_adv'],
+        batched_task_baselines=config.get('batched_task_baselines', False),
+        vectorized_advantages=config.get('vectorized_advantages', False),
+        dtype=config.get('sample_dtype', None),
     )
 
     Algo = VPGSGMRL if args.algo == 'sgmrl' else VPGMAML
@@ -81,7 +102,11 @@ def main(config):
         meta_batch_size=config['meta_batch_size'],
         num_inner_grad_steps=config['num_inner_grad_steps'],
         inner_lr=config['inner_lr'],
-        learning_rate=config['learning_rate']
+        learning_rate=config['learning_rate'],
+        vectorized_tasks=config.get('vectorized_tasks', False),
+        stage_inputs=config.get('stage_inputs', False),
+        loss_after_every=config.get('loss_after_every', 1),
+        num_task_chunks=config.get('num_task_chunks', 1),
     )
 
     trainer = Trainer(
@@ -91,7 +116,10 @@ def main(config):
         sampler=sampler,
         sample_processor=sample_processor,
         n_itr=config['n_itr'],
-        num_inner_grad_steps=config['num_inner_grad_steps'])
+        num_inner_grad_steps=config['num_inner_grad_steps'],
+        stream_sample_processing=config.get('stream_sample_processing', False),
+        n_processing_threads=config.get('n_processing_threads', None),
+    )
 
     tester = Tester(
         algo=algo,
@@ -3,7 +3,8 @@ import numpy as np
 import pickle
 from maml_zoo.utils import utils
 from maml_zoo.policies.base import Policy
-from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline, LinearTimeBaseline
+from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline, LinearTimeBaseline, \
+    AccumulatingLinearFeatureBaseline
 from maml_zoo.samplers.maml_sampler import MAMLSampler
 from gym import Env
 
@@ -149,5 +150,72 @@ class TestLinearFeatureBaseline(unittest.TestCase):
                 fit_error_post += sum([np.square(pred - actual) for pred, actual in zip(fit_pred, path['discounted_rewards'])])
             self.assertEqual(fit_error_pre, fit_error_post)
 
+class TestAccumulatingLinearFeatureBaseline(unittest.TestCase):
+    def setUp(self):
+        path_lengths = [50, 100, 30, 100, 75]
+        self.paths = [{'observations': np.random.normal(size=(path_length, 3)),
+                       'returns': np.random.normal(size=(path_length,))} for path_length in path_lengths]
+
+    def testMatchesLinearFeatureBaseline(self):
+        linear, accumulating = LinearFeatureBaseline(), AccumulatingLinearFeatureBaseline()
+        linear.fit(self.paths)
+        accumulating.fit(self.paths)
+        self.assertTrue(np.allclose(linear.get_param_values(), accumulating.get_param_values(), rtol=1e-4,
+                                    atol=1e-6))
+        for path in self.paths:
+            self.assertTrue(np.allclose(linear.predict(path), accumulating.predict(path), rtol=1e-4, atol=1e-6))
+
+    def testStreamingPaths(self):
+        accumulating, streaming = AccumulatingLinearFeatureBaseline(), AccumulatingLinearFeatureBaseline()
+        accumulating.fit(self.paths)
+        for path in self.paths[:3]:
+            streaming.add_path(path)
+        streaming.fit(self.paths)  # the paths added before must not be counted twice
+        self.assertTrue(np.allclose(accumulating.get_param_values(), streaming.get_param_values()))
+
+        # the statistics are reset after each fit
+        streaming.fit(self.paths[:2])
+        accumulating.fit(self.paths[:2])
+        self.assertTrue(np.allclose(accumulating.get_param_values(), streaming.get_param_values()))
+
+    def testPathsAddedToOtherBaseline(self):
+        # paths added to the statistics of one baseline must still be added by another one
+        accumulating, other = AccumulatingLinearFeatureBaseline(), AccumulatingLinearFeatureBaseline()
+        for path in self.paths:
+            other.add_path(path)
+        accumulating.fit(self.paths)
+        other.fit(self.paths)
+        self.assertTrue(np.allclose(accumulating.get_param_values(), other.get_param_values()))
+
+        linear = LinearFeatureBaseline()
+        linear.fit(self.paths)
+        self.assertTrue(np.allclose(linear.get_param_values(), accumulating.get_param_values(), rtol=1e-4,
+                                    atol=1e-6))
+
+    def testSingularFeatures(self):
+        # constant observations make the normal equations singular, so that the undamped Cholesky solve fails
+        paths = [{'observations': np.ones((20, 2)), 'returns': np.random.normal(size=(20,))} for _ in range(3)]
+        baseline = AccumulatingLinearFeatureBaseline(reg_coeff=0.)
+        baseline.fit(paths)
+        self.assertTrue(np.all(np.isfinite(baseline.get_param_values())))
+
+class TestTaskBatchedBaseline(unittest.TestCase):
+    def testMatchesPerTaskFit(self):
+        paths_meta_batch = [[{'observations': np.random.normal(size=(path_length, 3)),
+                              'returns': np.random.normal(size=(path_length,))} for path_length in path_lengths]
+                            for path_lengths in [[50, 100], [30, 100, 75], [20]]]
+        for baseline_cls in [LinearFeatureBaseline, LinearTimeBaseline]:
+            baseline = baseline_cls()
+            all_task_baselines = baseline.fit_tasks(paths_meta_batch)
+            self.assertEqual(len(all_task_baselines), len(paths_meta_batch))
+            for paths, task_baselines, predicted_task_baselines in zip(paths_meta_batch, all_task_baselines,
+                                                                         baseline.predict_tasks(paths_meta_batch)):
+                task_baseline = baseline_cls()
+                task_baseline.fit(paths)
+                for path, path_baselines, predicted_path_baselines in zip(paths, task_baselines,
+                                                                          predicted_task_baselines):
+                    self.assertTrue(np.allclose(task_baseline.predict(path), path_baselines, rtol=1e-4, atol=1e-5))
+                    self.assertTrue(np.allclose(path_baselines, predicted_path_baselines))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+from maml_zoo.envs.point_envs import point_env_2d, point_env_2d_v2, point_env_2d_corner, point_env_2d_momentum, \
+    point_env_2d_walls
+from maml_zoo.policies.base import Policy
+from maml_zoo.samplers import MAMLSampler
+
+
+class ClipPolicy(Policy):
+    def get_actions(self, observations):
+        return [np.clip(- 0.3 * obs[:, :2] + 0.05, -0.2, 0.2) for obs in observations], None
+
+
+class TestBatchPointEnvs(unittest.TestCase):
+    def setUp(self):
+        self.n_envs = 6
+        self.env_pairs = [(point_env_2d.MetaPointEnv, point_env_2d.BatchMetaPointEnv, {}),
+                          (point_env_2d_v2.MetaPointEnv, point_env_2d_v2.BatchMetaPointEnv, {})]
+        for reward_type in ['dense', 'dense_squared', 'sparse']:
+            self.env_pairs.extend([
+                (point_env_2d_corner.MetaPointEnvCorner, point_env_2d_corner.BatchMetaPointEnvCorner,
+                 dict(reward_type=reward_type)),
+                (point_env_2d_momentum.MetaPointEnvMomentum, point_env_2d_momentum.BatchMetaPointEnvMomentum,
+                 dict(reward_type=reward_type)),
+                (point_env_2d_walls.MetaPointEnvWalls, point_env_2d_walls.BatchMetaPointEnvWalls,
+                 dict(reward_type=reward_type)),
+            ])
+
+    def testMatchesSingleEnvs(self):
+        for env_cls, batch_env_cls, kwargs in self.env_pairs:
+            np.random.seed(0)
+            tasks = env_cls(**kwargs).sample_tasks(self.n_envs)
+            actions = np.random.uniform(-0.3, 0.3, size=(30, self.n_envs, 2))
+
+            envs = [env_cls(**kwargs) for _ in range(self.n_envs)]
+            np.random.seed(1)
+            for env, task in zip(envs, tasks):
+                env.set_task(task)
+            obs = np.array([env.reset() for env in envs])
+            results = [[env.step(action) for env, action in zip(envs, step_actions)] for step_actions in actions]
+            next_obs = np.array([[result[0] for result in step_results] for step_results in results])
+            rewards = np.array([[result[1] or 0. for result in step_results] for step_results in results])
+
+            batch_env = batch_env_cls(num_envs=self.n_envs, **kwargs)
+            np.random.seed(1)
+            batch_env.set_tasks(tasks)
+            for i in range(self.n_envs):  # reset the slots one by one to draw the random numbers in the same order
+                batch_obs = batch_env.reset(mask=np.arange(self.n_envs) == i)
+            batch_results = [batch_env.step(step_actions) for step_actions in actions]
+
+            self.assertTrue(np.allclose(obs, batch_obs))
+            self.assertTrue(np.allclose(next_obs, [result[0] for result in batch_results]))
+            self.assertTrue(np.allclose(rewards, [result[1] for result in batch_results]))
+
+    def testMaskedReset(self):
+        batch_env = point_env_2d_corner.BatchMetaPointEnvCorner(num_envs=4)
+        batch_env.set_tasks(batch_env.sample_tasks(4))
+        obs = batch_env.reset()
+        obs, _, _, _ = batch_env.step(np.ones((4, 2)))
+        mask = np.array([True, False, True, False])
+        reset_obs = batch_env.reset(mask=mask)
+        self.assertTrue(np.all(np.abs(reset_obs[mask]) <= 0.2))
+        self.assertTrue(np.allclose(reset_obs[~mask], obs[~mask]))
+
+    def testBatchSampler(self):
+        meta_batch_size, batch_size, path_length = 3, 4, 7
+        policy = ClipPolicy(obs_dim=2, action_dim=2)
+        all_paths = []
+        for env in [point_env_2d_corner.MetaPointEnvCorner(reward_type='dense'),
+                    point_env_2d_corner.BatchMetaPointEnvCorner(reward_type='dense')]:
+            np.random.seed(3)
+            sampler = MAMLSampler(env, policy, batch_size, meta_batch_size, path_length, envs_per_task=2)
+            sampler.update_tasks()
+            all_paths.append(sampler.obtain_samples())
+
+        for task1, task2 in zip(all_paths[0].values(), all_paths[1].values()):
+            self.assertEqual(len(task1), batch_size)
+            self.assertEqual(len(task2), batch_size)
+            for path1, path2 in zip(task1, task2):
+                self.assertEqual(len(path2['rewards']), path_length)
+                self.assertTrue(np.allclose(path1['observations'], path2['observations']))
+                self.assertTrue(np.allclose(path1['rewards'], path2['rewards']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+from maml_zoo import utils
+from maml_zoo.policies.meta_gaussian_mlp_policy import MetaGaussianMLPPolicy
+from maml_zoo.meta_algos.vpg_maml import VPGMAML
+from maml_zoo.meta_algos.vpg_sgmrl import VPGSGMRL
+from maml_zoo.meta_algos.trpo_maml import TRPOMAML
+from maml_zoo.meta_algos.ppo_maml import PPOMAML
+from maml_zoo.optimizers.input_binding import subsample_samples_data
+from maml_zoo.optimizers.conjugate_gradient_optimizer import FiniteDifferenceHvp, conjugate_gradients
+
+
+def random_samples(meta_batch_size, obs_dim, action_dim, n_samples):
+    return [dict(observations=np.random.normal(size=(n, obs_dim)),
+                 actions=np.random.normal(scale=0.5, size=(n, action_dim)),
+                 advantages=np.random.normal(size=(n,)),
+                 adj_avg_rewards=np.random.normal(size=(n,)),
+                 agent_infos=dict(mean=np.random.normal(scale=0.1, size=(n, action_dim)),
+                                  log_std=np.zeros((n, action_dim))))
+            for n in n_samples[:meta_batch_size]]
+
+
+class TestVectorizedTasks(unittest.TestCase):
+
+    def setUp(self):
+        self.meta_batch_size, self.obs_dim, self.action_dim = 3, 4, 2
+        self.num_inner_grad_steps = 2
+        self.all_samples_data = [random_samples(self.meta_batch_size, self.obs_dim, self.action_dim, [8, 11, 5])
+                                 for _ in range(self.num_inner_grad_steps + 1)]
+
+    def _run_algo(self, algo_cls, algo_kwargs, vectorized_tasks, param_vals):
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            policy = MetaGaussianMLPPolicy(meta_batch_size=self.meta_batch_size, obs_dim=self.obs_dim,
+                                           action_dim=self.action_dim, name='vectorized_policy', hidden_sizes=(16,),
+                                           batched_task_graph=vectorized_tasks)
+            algo = algo_cls(policy=policy, meta_batch_size=self.meta_batch_size, inner_lr=0.1,
+                            num_inner_grad_steps=self.num_inner_grad_steps, vectorized_tasks=vectorized_tasks,
+                            **algo_kwargs)
+            sess.run(tf.compat.v1.global_variables_initializer())
+            if param_vals is not None:
+                policy.set_params(param_vals)
+            param_vals = policy.get_param_values()
+
+            policy.switch_to_pre_update()
+            algo._adapt(self.all_samples_data[0])
+            adapted_params = policy.policies_params_vals
+
+            input_dict = algo._extract_input_dict_meta_op(self.all_samples_data, algo._optimization_keys)
+            if algo_cls is PPOMAML:
+                input_dict.update(inner_kl_coeff=algo.inner_kl_coeff, clip_eps=algo.clip_eps)
+            feed_dict = algo.optimizer.create_feed_dict(input_dict)
+            grads_sym = tf.gradients(ys=algo.optimizer._loss, xs=list(policy.get_params().values()))
+            loss, grads = sess.run([algo.optimizer._loss, grads_sym], feed_dict=feed_dict)
+            algo.optimize_policy(self.all_samples_data, log=False)
+            return param_vals, adapted_params, loss, grads, policy.get_param_values()
+
+    def testMatchesPerTaskGraph(self):
+        for algo_cls, algo_kwargs in [(VPGMAML, dict(exploration=True)),
+                                      (VPGSGMRL, dict()),
+                                      (TRPOMAML, dict(exploration=True)),
+                                      (PPOMAML, dict())]:
+            param_vals, adapted_params, loss, grads, new_params = self._run_algo(algo_cls, algo_kwargs, False, None)
+            _, vec_adapted_params, vec_loss, vec_grads, vec_new_params = self._run_algo(algo_cls, algo_kwargs, True,
+                                                                                      param_vals)
+
+            self.assertAlmostEqual(loss, vec_loss, places=4)
+            for grad, vec_grad in zip(grads, vec_grads):
+                self.assertTrue(np.allclose(grad, vec_grad, rtol=1e-3, atol=1e-5))
+            for params, vec_params in zip(adapted_params, vec_adapted_params):
+                for key in params.keys():
+                    self.assertTrue(np.allclose(params[key], vec_params[key], rtol=1e-4, atol=1e-5))
+            for key in new_params.keys():
+                self.assertTrue(np.allclose(new_params[key], vec_new_params[key], rtol=1e-3, atol=1e-5))
+
+
+class TestInputBinding(unittest.TestCase):
+
+    def testMatchesInputDict(self):
+        meta_batch_size, obs_dim, action_dim, num_inner_grad_steps = 3, 4, 2, 1
+        all_samples_data = [random_samples(meta_batch_size, obs_dim, action_dim, [8, 11, 5])
+                            for _ in range(num_inner_grad_steps + 1)]
+
+        for vectorized_tasks, stage_inputs in [(False, False), (False, True), (True, False), (True, True)]:
+            with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+                policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=obs_dim,
+                                               action_dim=action_dim, name='binding_policy', hidden_sizes=(16,),
+                                               batched_task_graph=vectorized_tasks)
+                algo = VPGMAML(policy=policy, meta_batch_size=meta_batch_size, exploration=True,
+                               num_inner_grad_steps=num_inner_grad_steps, vectorized_tasks=vectorized_tasks,
+                               stage_inputs=stage_inputs)
+                sess.run(tf.compat.v1.global_variables_initializer())
+
+                input_dict = algo._extract_input_dict_meta_op(all_samples_data, algo._optimization_keys)
+                loss = algo.optimizer.loss(input_dict)
+
+                bound_inputs = algo.meta_op_input_plan.bind(all_samples_data)
+                if stage_inputs:
+                    # only the adj_avg_rewards placeholders aren't staged
+                    self.assertEqual(len(bound_inputs.feed_dict), 1 if vectorized_tasks else meta_batch_size)
+                else:
+                    self.assertEqual(len(bound_inputs.feed_dict), len(algo.meta_op_phs_dict))
+                self.assertAlmostEqual(loss, algo.optimizer.loss(bound_inputs), places=5)
+
+                policy.switch_to_pre_update()
+                algo._adapt(all_samples_data[0])
+                adapted_params = policy.policies_params_vals
+                policy.switch_to_pre_update()
+                feed_dict = utils.create_feed_dict(algo.adapt_input_ph_dict, algo._extract_input_dict(
+                    all_samples_data[0], algo._optimization_keys, prefix='adapt'))
+                feed_dict.update(policy.policies_params_feed_dict)
+                for params, expected_params in zip(adapted_params, sess.run(algo.adapted_policies_params,
+                                                                            feed_dict=feed_dict)):
+                    for key in params.keys():
+                        self.assertTrue(np.allclose(params[key], expected_params[key]))
+
+    def testSubsample(self):
+        meta_batch_size, obs_dim, action_dim = 3, 4, 2
+        all_samples_data = [random_samples(meta_batch_size, obs_dim, action_dim, [8, 11, 5]) for _ in range(2)]
+
+        subsampled_data = subsample_samples_data(all_samples_data, 0.5)
+        for samples_data_meta_batch, subsampled_meta_batch in zip(all_samples_data, subsampled_data):
+            for samples_data, subsampled in zip(samples_data_meta_batch, subsampled_meta_batch):
+                n_samples = len(samples_data['observations'])
+                self.assertEqual(len(subsampled['observations']), int(round(n_samples * 0.5)))
+                # the rows of all the data are drawn with the same indices
+                idx = [np.nonzero(np.all(samples_data['observations'] == obs, axis=1))[0][0]
+                       for obs in subsampled['observations']]
+                self.assertTrue(np.allclose(samples_data['actions'][idx], subsampled['actions']))
+                self.assertTrue(np.allclose(samples_data['agent_infos']['mean'][idx],
+                                            subsampled['agent_infos']['mean']))
+
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=obs_dim, action_dim=action_dim,
+                                           name='subsample_policy', hidden_sizes=(16,), batched_task_graph=True)
+            algo = VPGMAML(policy=policy, meta_batch_size=meta_batch_size, exploration=True, num_inner_grad_steps=1,
+                           vectorized_tasks=True, stage_inputs=True)
+            sess.run(tf.compat.v1.global_variables_initializer())
+
+            bound_inputs = algo.meta_op_input_plan.bind(all_samples_data)
+            loss = algo.optimizer.loss(bound_inputs)
+            subsampled_inputs = bound_inputs.subsample(0.5)
+            mask = subsampled_inputs.feed_dict[algo.meta_op_phs_dict['step1_mask']]
+            self.assertTrue(np.allclose(mask.sum(axis=1), [4, 6, 2]))
+            self.assertEqual(len(subsampled_inputs.feed_dict), len(algo.meta_op_phs_dict))
+            # the staged inputs still hold the full batch
+            self.assertAlmostEqual(loss, algo.optimizer.loss(bound_inputs), places=5)
+
+
+class TestOptimizeWithStats(unittest.TestCase):
+
+    def testMatchesSeparateLossRuns(self):
+        meta_batch_size, obs_dim, action_dim, num_inner_grad_steps = 2, 4, 2, 1
+        all_samples_data = [random_samples(meta_batch_size, obs_dim, action_dim, [8, 11])
+                            for _ in range(num_inner_grad_steps + 1)]
+
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=obs_dim, action_dim=action_dim,
+                                           name='stats_policy', hidden_sizes=(16,))
+            algo = VPGSGMRL(policy=policy, meta_batch_size=meta_batch_size, num_inner_grad_steps=num_inner_grad_steps,
+                            loss_after_every=2)
+            sess.run(tf.compat.v1.global_variables_initializer())
+
+            bound_inputs = algo.meta_op_input_plan.bind(all_samples_data)
+            for i in range(4):
+                expected_loss_before = algo.optimizer.loss(bound_inputs)
+                loss_before, loss_after = algo.optimizer.optimize_with_stats(bound_inputs, compute_stats=i != 2)
+                self.assertAlmostEqual(loss_before, expected_loss_before, places=5)
+                if i == 0:
+                    self.assertAlmostEqual(loss_after, algo.optimizer.loss(bound_inputs), places=5)
+                    self.assertNotAlmostEqual(loss_before, loss_after, places=5)
+                else:
+                    # odd calls are off the cadence and the third call doesn't ask for stats
+                    self.assertIsNone(loss_after)
+
+
+class TestTaskChunks(unittest.TestCase):
+
+    def _optimize(self, algo_cls, algo_kwargs, vectorized_tasks, num_task_chunks, all_samples_data, param_vals):
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            policy = MetaGaussianMLPPolicy(meta_batch_size=3, obs_dim=4, action_dim=2, name='chunks_policy',
+                                           hidden_sizes=(16,), batched_task_graph=vectorized_tasks)
+            algo = algo_cls(policy=policy, meta_batch_size=3, num_inner_grad_steps=1,
+                            vectorized_tasks=vectorized_tasks, num_task_chunks=num_task_chunks, **algo_kwargs)
+            sess.run(tf.compat.v1.global_variables_initializer())
+            if param_vals is not None:
+                policy.set_params(param_vals)
+            param_vals = policy.get_param_values()
+
+            bound_inputs = algo.meta_op_input_plan.bind(all_samples_data)
+            loss = algo.optimizer.loss(bound_inputs)
+            for _ in range(2):
+                loss_before = algo.optimizer.optimize(bound_inputs)
+            return param_vals, loss, loss_before, policy.get_param_values()
+
+    def testMatchesSingleChunk(self):
+        all_samples_data = [random_samples(3, 4, 2, [8, 11, 5]) for _ in range(2)]
+        for algo_cls, algo_kwargs in [(VPGMAML, dict(exploration=True)), (VPGSGMRL, dict())]:
+            for vectorized_tasks in [False, True]:
+                param_vals, loss, loss_before, new_params = self._optimize(algo_cls, algo_kwargs, vectorized_tasks, 1,
+                                                                           all_samples_data, None)
+                _, chunked_loss, chunked_loss_before, chunked_new_params = self._optimize(
+                    algo_cls, algo_kwargs, vectorized_tasks, 2, all_samples_data, param_vals)
+
+                self.assertAlmostEqual(loss, chunked_loss, places=4)
+                self.assertAlmostEqual(loss_before, chunked_loss_before, places=4)
+                for key in new_params.keys():
+                    self.assertTrue(np.allclose(new_params[key], chunked_new_params[key], rtol=1e-3, atol=1e-5))
+
+
+class TestSymbolicHvp(unittest.TestCase):
+
+    def testMatchesFiniteDifferences(self):
+        all_samples_data = [random_samples(2, 4, 2, [8, 11]) for _ in range(2)]
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            policy = MetaGaussianMLPPolicy(meta_batch_size=2, obs_dim=4, action_dim=2, name='hvp_policy',
+                                           hidden_sizes=(16,))
+            algo = TRPOMAML(policy=policy, meta_batch_size=2, num_inner_grad_steps=1, symbolic_hvp=True,
+                            in_graph_cg=True)
+            optimizer = algo.optimizer
+            finite_difference_hvp = FiniteDifferenceHvp(base_eps=1e-3)
+            finite_difference_hvp.build_graph(optimizer._constraint_objective, policy, optimizer._input_ph_dict, 0.)
+            sess.run(tf.compat.v1.global_variables_initializer())
+
+            # the kl constraint has zero curvature at the current policy, so move away from it first
+            policy.set_params(dict([(key, value + np.random.normal(scale=0.1, size=value.shape))
+                                    for key, value in policy.get_param_values().items()]))
+            bound_inputs = algo.meta_op_input_plan.bind(all_samples_data)
+            x = np.random.normal(size=optimizer.gradient(bound_inputs).shape).astype(np.float32)
+            hx = optimizer._hvp_approach.Hx(bound_inputs, x)
+            self.assertTrue(np.allclose(hx, finite_difference_hvp.Hx(bound_inputs, x), rtol=0.05,
+                                        atol=0.05 * np.abs(hx).max()))
+
+            Hx = optimizer._hvp_approach.build_eval(bound_inputs)
+            descent_direction = conjugate_gradients(Hx, optimizer.gradient(bound_inputs), cg_iters=10)
+            in_graph_descent_direction = sess.run(optimizer._descent_direction,
+                                                  feed_dict=optimizer.create_feed_dict(bound_inputs))
+            self.assertLess(np.linalg.norm(descent_direction - in_graph_descent_direction),
+                            1e-2 * np.linalg.norm(descent_direction))
+
+
+class TestBatchedLineSearch(unittest.TestCase):
+
+    def testMatchesSequentialLineSearch(self):
+        all_samples_data = [random_samples(3, 4, 2, [8, 11, 5]) for _ in range(2)]
+        param_vals, new_params = None, []
+        for batched_line_search in [False, True]:
+            with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+                policy = MetaGaussianMLPPolicy(meta_batch_size=3, obs_dim=4, action_dim=2, name='line_search_policy',
+                                               hidden_sizes=(16,), batched_task_graph=True)
+                algo = TRPOMAML(policy=policy, meta_batch_size=3, num_inner_grad_steps=1, exploration=True,
+                                step_size=0.3, vectorized_tasks=True, symbolic_hvp=True,
+                                batched_line_search=batched_line_search, line_search_batch_size=4)
+                sess.run(tf.compat.v1.global_variables_initializer())
+                if param_vals is not None:
+                    policy.set_params(param_vals)
+                param_vals = policy.get_param_values()
+
+                if batched_line_search:
+                    optimizer = algo.optimizer
+                    bound_inputs = algo.meta_op_input_plan.bind(all_samples_data)
+                    flat_param_vals = policy.param_layout.flatten(param_vals)
+                    candidates = flat_param_vals[None, :] + np.random.normal(scale=0.05, size=(3, len(flat_param_vals)))
+                    feed_dict = dict(optimizer.create_feed_dict(bound_inputs))
+                    feed_dict[optimizer._candidate_params_ph] = candidates
+                    losses, constraint_vals = sess.run([optimizer._candidate_losses,
+                                                        optimizer._candidate_constraint_vals], feed_dict=feed_dict)
+                    for candidate, loss, constraint_val in zip(candidates, losses, constraint_vals):
+                        policy.set_flat_params(candidate)
+                        self.assertAlmostEqual(loss, optimizer.loss(bound_inputs), places=5)
+                        self.assertAlmostEqual(constraint_val, optimizer.constraint_val(bound_inputs), places=5)
+                    policy.set_params(param_vals)
+
+                algo.optimize_policy(all_samples_data, log=False)
+                new_params.append(policy.get_param_values())
+
+        for key in param_vals.keys():
+            self.assertTrue(np.allclose(new_params[0][key], new_params[1][key], rtol=1e-4, atol=1e-6))
+
+
+class TestSubsampledHvp(unittest.TestCase):
+
+    def testOptimize(self):
+        all_samples_data = [random_samples(2, 4, 2, [8, 11]) for _ in range(2)]
+        for in_graph_cg in [False, True]:
+            with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+                policy = MetaGaussianMLPPolicy(meta_batch_size=2, obs_dim=4, action_dim=2, name='subsample_policy',
+                                               hidden_sizes=(16,))
+                algo = TRPOMAML(policy=policy, meta_batch_size=2, num_inner_grad_steps=1, step_size=0.3,
+                                symbolic_hvp=True, in_graph_cg=in_graph_cg, subsample_factor=0.5)
+                sess.run(tf.compat.v1.global_variables_initializer())
+                param_vals = policy.get_param_values()
+                bound_inputs = algo.meta_op_input_plan.bind(all_samples_data)
+                loss_before = algo.optimizer.loss(bound_inputs)
+
+                algo.optimizer.optimize(bound_inputs)
+                new_params = policy.get_param_values()
+                self.assertTrue(all([np.all(np.isfinite(value)) for value in new_params.values()]))
+                if any([not np.allclose(param_vals[key], new_params[key]) for key in param_vals.keys()]):
+                    # an accepted step improves the loss on the full batch
+                    self.assertLess(algo.optimizer.loss(bound_inputs), loss_before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,11 @@
 import unittest
 from maml_zoo.policies.gaussian_mlp_policy import GaussianMLPPolicy
+from maml_zoo.policies.meta_gaussian_mlp_policy import MetaGaussianMLPPolicy
+from maml_zoo.meta_algos.vpg_maml import VPGMAML
+from maml_zoo.samplers import MAMLSampler
+from maml_zoo.samplers import MAMLSampleProcessor
+from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline
+from maml_zoo.envs.point_envs.point_env_2d_v2 import MetaPointEnv
 import numpy as np
 import tensorflow as tf
 import pickle
@@ -120,5 +126,198 @@ class TestPolicy(unittest.TestCase):
                 self.assertTrue(np.allclose(pre_agent_infos[key], post_agent_infos[key]))
 
 
+class TestMetaPolicy(unittest.TestCase):
+
+    def testNumpyInference(self):
+        meta_batch_size, batch_size, obs_dim, action_dim = 3, 5, 4, 2
+        obs = [np.random.uniform(-1, 1, size=(batch_size, obs_dim)) for _ in range(meta_batch_size)]
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=obs_dim, action_dim=action_dim,
+                                           name='numpy_inference_policy', hidden_sizes=(16, 16),
+                                           columnar_agent_infos=True)
+            sess.run(tf.compat.v1.global_variables_initializer())
+            policy.switch_to_pre_update()
+
+            for post_update in [False, True]:
+                if post_update:
+                    params = policy.get_param_values()
+                    policy.update_task_parameters([dict((key, value + 0.1 * idx) for key, value in params.items())
+                                                   for idx in range(meta_batch_size)])
+
+                policy.numpy_inference = False
+                _, tf_agent_infos = policy.get_actions(obs)
+                policy.numpy_inference = True
+                if not post_update:
+                    policy.switch_to_pre_update()
+                actions, np_agent_infos = policy.get_actions(obs)
+
+                self.assertEqual(np.shape(actions), (meta_batch_size, batch_size, action_dim))
+                for key in ['mean', 'log_std']:
+                    self.assertTrue(np.allclose(tf_agent_infos[key], np_agent_infos[key], rtol=1e-4, atol=1e-5))
+
+    def testResidentTaskParams(self):
+        meta_batch_size, batch_size, obs_dim, action_dim = 3, 10, 4, 2
+        samples = [[dict(observations=np.random.normal(size=(batch_size, obs_dim)),
+                         actions=np.random.normal(scale=0.5, size=(batch_size, action_dim)),
+                         advantages=np.random.normal(size=(batch_size,)),
+                         agent_infos=dict(mean=np.random.normal(scale=0.1, size=(batch_size, action_dim)),
+                                          log_std=np.zeros((batch_size, action_dim))))
+                    for _ in range(meta_batch_size)] for _ in range(2)]
+        obs = [np.random.uniform(-1, 1, size=(5, obs_dim)) for _ in range(meta_batch_size)]
+
+        param_vals, all_means = None, []
+        for resident_task_params in [False, True]:
+            with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+                policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=obs_dim,
+                                               action_dim=action_dim, name='resident_policy', hidden_sizes=(16,),
+                                               columnar_agent_infos=True, resident_task_params=resident_task_params)
+                algo = VPGMAML(policy=policy, meta_batch_size=meta_batch_size, num_inner_grad_steps=2, inner_lr=0.5)
+                sess.run(tf.compat.v1.global_variables_initializer())
+                if param_vals is None:
+                    param_vals = policy.get_param_values()
+                policy.set_params(param_vals)
+
+                means = []
+                policy.switch_to_pre_update()
+                for step_samples in samples:  # two inner steps
+                    algo._adapt(step_samples)
+                    means.append(policy.get_actions(obs)[1]['mean'])
+                policy.update_task_parameters([param_vals] * meta_batch_size)
+                means.append(policy.get_actions(obs)[1]['mean'])
+                all_means.append(means)
+
+        for means, resident_means in zip(*all_means):
+            self.assertTrue(np.allclose(means, resident_means, rtol=1e-4, atol=1e-4))
+
+    def testBatchedTaskGraph(self):
+        meta_batch_size, batch_size, obs_dim, action_dim = 3, 10, 4, 2
+        samples = [dict(observations=np.random.normal(size=(batch_size, obs_dim)),
+                        actions=np.random.normal(scale=0.5, size=(batch_size, action_dim)),
+                        advantages=np.random.normal(size=(batch_size,)),
+                        agent_infos=dict(mean=np.random.normal(scale=0.1, size=(batch_size, action_dim)),
+                                         log_std=np.zeros((batch_size, action_dim))))
+                   for _ in range(meta_batch_size)]
+        obs = [np.random.uniform(-1, 1, size=(5, obs_dim)) for _ in range(meta_batch_size)]
+
+        param_vals, all_agent_infos = None, []
+        for batched_task_graph, resident_task_params in [(False, False), (True, False), (True, True)]:
+            with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+                policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=obs_dim,
+                                               action_dim=action_dim, name='batched_policy', hidden_sizes=(16, 16),
+                                               columnar_agent_infos=True, batched_task_graph=batched_task_graph,
+                                               resident_task_params=resident_task_params)
+                algo = VPGMAML(policy=policy, meta_batch_size=meta_batch_size, num_inner_grad_steps=1, inner_lr=0.5)
+                sess.run(tf.compat.v1.global_variables_initializer())
+                if param_vals is None:
+                    param_vals = policy.get_param_values()
+                policy.set_params(param_vals)
+
+                policy.switch_to_pre_update()
+                algo._adapt(samples)
+                actions, agent_infos = policy.get_actions(obs)
+                all_agent_infos.append(agent_infos)
+                self.assertEqual(np.shape(actions), (meta_batch_size, 5, action_dim))
+
+        for agent_infos in all_agent_infos[1:]:
+            for key in ['mean', 'log_std']:
+                self.assertTrue(np.allclose(all_agent_infos[0][key], agent_infos[key], rtol=1e-4, atol=1e-4))
+
+    def testFlatParamLayout(self):
+        meta_batch_size, obs_dim, action_dim = 3, 4, 2
+        with tf.Graph().as_default(), tf.compat.v1.Session() as sess:
+            policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=obs_dim, action_dim=action_dim,
+                                           name='flat_layout_policy', hidden_sizes=(16, 16), batched_task_graph=True)
+            sess.run(tf.compat.v1.global_variables_initializer())
+            layout = policy.param_layout
+            param_vals = policy.get_param_values()
+            flat_param_vals = policy.get_flat_param_values()
+            self.assertEqual(flat_param_vals.shape, (layout.size,))
+            self.assertTrue(np.allclose(layout.flatten(param_vals), flat_param_vals))
+            for key, value in layout.unflatten(flat_param_vals).items():
+                self.assertTrue(np.allclose(value, param_vals[key]))
+
+            new_flat_param_vals = flat_param_vals + 0.1
+            policy.set_flat_params(new_flat_param_vals)
+            for key, value in policy.get_param_values().items():
+                self.assertTrue(np.allclose(value, param_vals[key] + 0.1))
+
+            policy.switch_to_pre_update()
+            feed_dict = policy.policies_params_feed_dict
+            for (key, ph), value in zip(policy.policies_params_stacked_phs.items(), param_vals.values()):
+                self.assertEqual(np.shape(feed_dict[ph]), (meta_batch_size,) + value.shape)
+                self.assertTrue(np.allclose(feed_dict[ph], value[None] + 0.1))
+
+    def testWorkerPolicies(self):
+        meta_batch_size, rollouts_per_meta_task, max_path_length = 3, 4, 10
+        env = MetaPointEnv()
+        for kwargs in [dict(), dict(n_workers=2, shared_memory=True)]:
+            with tf.Graph().as_default():
+                policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=2, action_dim=2,
+                                               name='worker_policy', hidden_sizes=(16, 16))
+                sampler = MAMLSampler(env, policy, rollouts_per_meta_task, meta_batch_size, max_path_length,
+                                      parallel=True, worker_policies=True, **kwargs)
+                with tf.compat.v1.Session() as sess:
+                    sess.run(tf.compat.v1.global_variables_initializer())
+                    sampler.update_tasks()
+                    policy.switch_to_pre_update()
+
+                    for post_update in [False, True]:
+                        if post_update:
+                            params = policy.get_param_values()
+                            policy.update_task_parameters([dict((key, value + 0.1 * idx) for key, value in params.items())
+                                                           for idx in range(meta_batch_size)])
+                        paths_meta_batch = sampler.obtain_samples()
+                        self.assertEqual(sampler._worker_params_version, policy.params_version)
+                        # paths that reach the goal end early -> the workers may overshoot their number of samples
+                        self.assertGreaterEqual(sum([len(path['rewards']) for paths in paths_meta_batch.values()
+                                                     for path in paths]), sampler.total_samples)
+
+                        for task, paths in paths_meta_batch.items():
+                            self.assertTrue(all([0 < len(path['rewards']) <= max_path_length for path in paths]))
+                            obs = np.concatenate([path['observations'] for path in paths])
+                            _, agent_infos = policy.get_actions([obs] * meta_batch_size)
+                            means = np.stack([agent_info['mean'] for agent_info in agent_infos[task]])
+                            log_stds = np.stack([agent_info['log_std'] for agent_info in agent_infos[task]])
+                            worker_means = np.concatenate([path['agent_infos']['mean'] for path in paths])
+                            worker_log_stds = np.concatenate([path['agent_infos']['log_std'] for path in paths])
+                            self.assertTrue(np.allclose(means, worker_means, rtol=1e-4, atol=1e-5))
+                            self.assertTrue(np.allclose(log_stds, worker_log_stds, rtol=1e-4, atol=1e-5))
+
+    def testWorkerPoliciesAdapt(self):
+        meta_batch_size, rollouts_per_meta_task, max_path_length = 2, 2, 10
+        env = MetaPointEnv()
+        with tf.Graph().as_default():
+            policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=2, action_dim=2,
+                                           name='adapt_worker_policy', hidden_sizes=(16,))
+            algo = VPGMAML(policy=policy, meta_batch_size=meta_batch_size, num_inner_grad_steps=1, inner_lr=0.5)
+            sampler = MAMLSampler(env, policy, rollouts_per_meta_task, meta_batch_size, max_path_length,
+                                  parallel=True, n_workers=2, worker_policies=True)
+            sample_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline())
+            with tf.compat.v1.Session() as sess:
+                sess.run(tf.compat.v1.global_variables_initializer())
+                sampler.update_tasks()
+                policy.switch_to_pre_update()
+                samples_data = sample_processor.process_samples(sampler.obtain_samples())
+                pre_update_version = policy.params_version
+                algo._adapt(samples_data)
+                self.assertNotEqual(policy.params_version, pre_update_version)
+
+                # the post-update paths must be sampled with the adapted params
+                for task, paths in sampler.obtain_samples().items():
+                    obs = np.concatenate([path['observations'] for path in paths])
+                    _, agent_infos = policy.get_actions([obs] * meta_batch_size)
+                    means = np.stack([agent_info['mean'] for agent_info in agent_infos[task]])
+                    worker_means = np.concatenate([path['agent_infos']['mean'] for path in paths])
+                    self.assertTrue(np.allclose(means, worker_means, rtol=1e-4, atol=1e-5))
+
+        with tf.Graph().as_default():
+            policy = MetaGaussianMLPPolicy(meta_batch_size=meta_batch_size, obs_dim=2, action_dim=2,
+                                           name='resident_worker_policy', hidden_sizes=(16,),
+                                           resident_task_params=True)
+            with self.assertRaises(AssertionError):
+                MAMLSampler(env, policy, rollouts_per_meta_task, meta_batch_size, max_path_length, parallel=True,
+                            worker_policies=True)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,6 @@
+import copy
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from maml_zoo.policies.base import Policy
 from maml_zoo.samplers import MAMLSampler
@@ -6,11 +8,17 @@ from maml_zoo.samplers import MAMLSampleProcessor
 from maml_zoo.samplers import SampleProcessor
 from maml_zoo.samplers import DiceSampleProcessor
 from maml_zoo.samplers import DiceMAMLSampleProcessor
+from maml_zoo.samplers.rollout_buffer import RolloutBuffer
+from maml_zoo.utils import utils
 from maml_zoo.baselines.linear_baseline import LinearFeatureBaseline, LinearTimeBaseline
 from maml_zoo.baselines.zero_baseline import ZeroBaseline
+from gym.spaces import Box
 
 
 class TestEnv():
+    observation_space = Box(low=-np.inf, high=np.inf, shape=(1,))
+    action_space = Box(low=-np.inf, high=np.inf, shape=(1,))
+
     def __init__(self):
         self.state = np.zeros(1)
         self.goal = 0
@@ -54,6 +62,25 @@ class RandomEnv(TestEnv):
         self.state += (self.goal - action) * np.random.random()
         return self.state * 100 + self.goal, (self.goal - action)[0], 0, {'e':self.state}
 
+class EarlyDoneEnv(TestEnv):
+    def step(self, action):
+        obs, reward, _, env_info = super(EarlyDoneEnv, self).step(action)
+        return obs, reward, np.random.random() < 0.3, env_info
+
+class LargeInfoEnv(TestEnv):
+    def step(self, action):
+        obs, reward, done, _ = super(LargeInfoEnv, self).step(action)
+        return obs, reward, done, {'e': np.zeros(200000)}
+
+class VaryingInfoEnv(TestEnv):
+    def step(self, action):
+        obs, reward, done, _ = super(VaryingInfoEnv, self).step(action)
+        self.t = getattr(self, 't', 0) + 1
+        env_info = {'t': self.t, 'name': 'step'}
+        if self.t % 2 == 0:
+            env_info['even'] = np.ones(2)
+        return obs, reward, done, env_info
+
 class TestPolicy(Policy):
     def get_actions(self, observations):
         return [[np.ones(1) for batch in task] for task in observations], None
@@ -66,6 +93,17 @@ class RandomPolicy(Policy):
     def get_actions(self, observations):
         return [[np.random.random() * batch for batch in task] for task in observations], [[{'a':1, 'b':2} for batch in task] for task in observations]
 
+class ColumnarInfoPolicy(Policy):
+    columnar_agent_infos = True
+
+    def get_actions(self, observations):
+        means = np.stack([task / 100 for task in observations], axis=0)
+        log_stds = np.arange(len(observations) * self.action_dim).reshape(len(observations), self.action_dim)
+        if self.columnar_agent_infos:
+            return means, dict(mean=means, log_std=log_stds)
+        agent_infos = [[dict(mean=mean, log_std=log_stds[idx]) for mean in means[idx]] for idx in range(len(means))]
+        return means, agent_infos
+
 class TestSampler(unittest.TestCase):
     def setUp(self):
         self.test_env = TestEnv()
@@ -78,6 +116,17 @@ class TestSampler(unittest.TestCase):
         self.path_length = 5
         self.it_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size, self.path_length, parallel=False)
         self.par_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size, self.path_length, parallel=True)
+        self.shm_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size,
+                                       self.path_length, parallel=True, shared_memory=True)
+        self.few_workers_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size,
+                                               self.path_length, parallel=True, n_workers=2)
+        self.many_workers_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size,
+                                                self.path_length, parallel=True, n_workers=5, shared_memory=True)
+        self.pipe_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size,
+                                        self.path_length, parallel=True, pipelined=True)
+        self.shm_pipe_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size,
+                                            self.path_length, parallel=True, n_workers=4, shared_memory=True,
+                                            pipelined=True)
         self.sample_processor = SampleProcessor(baseline=LinearFeatureBaseline())
         self.maml_sample_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline())
 
@@ -97,7 +146,8 @@ class TestSampler(unittest.TestCase):
                         path_state += -100
 
     def testGoalSet(self):
-        for sampler in [self.it_sampler, self.par_sampler]:
+        for sampler in [self.it_sampler, self.par_sampler, self.shm_sampler, self.few_workers_sampler,
+                        self.many_workers_sampler, self.pipe_sampler, self.shm_pipe_sampler]:
             sampler.update_tasks()
             paths = sampler.obtain_samples()
             self.assertEqual(len(paths), self.meta_batch_size)
@@ -155,7 +205,13 @@ class TestSampler(unittest.TestCase):
         par_sampler = MAMLSampler(self.random_env, self.random_policy, self.batch_size, self.meta_batch_size,
                                        self.path_length, parallel=True)
 
-        for sampler in [it_sampler, par_sampler]:
+        shm_sampler = MAMLSampler(self.random_env, self.random_policy, self.batch_size, self.meta_batch_size,
+                                  self.path_length, parallel=True, shared_memory=True)
+
+        pipe_sampler = MAMLSampler(self.random_env, self.random_policy, self.batch_size, self.meta_batch_size,
+                                   self.path_length, parallel=True, pipelined=True)
+
+        for sampler in [it_sampler, par_sampler, shm_sampler, pipe_sampler]:
             sampler.update_tasks()
             paths = sampler.obtain_samples()
             self.assertEqual(len(paths), self.meta_batch_size)
@@ -169,6 +225,92 @@ class TestSampler(unittest.TestCase):
                     self.assertEqual(len(curr_agent_infos.keys()), 2)
                     self.assertEqual(len(curr_env_infos.keys()), 1)
 
+    def testSharedMemoryLargeInfos(self):
+        # the infos don't fit into the pipe buffer of the workers
+        for kwargs in [dict(), dict(exact_task_budget=True)]:
+            sampler = MAMLSampler(LargeInfoEnv(), self.test_policy, 2, 2, 3, parallel=True, n_workers=2,
+                                  shared_memory=True, **kwargs)
+            sampler.update_tasks()
+            paths = sampler.obtain_samples()
+            for task in paths.values():
+                for path in task:
+                    self.assertEqual(path['env_infos']['e'].shape, (3, 200000))
+
+    def testSharedMemoryDeadWorker(self):
+        vec_env = self.shm_sampler.vec_env
+        vec_env.ps[0].terminate()
+        vec_env.ps[0].join()
+        with self.assertRaises(RuntimeError):
+            vec_env.reset()
+
+    def testVaryingInfos(self):
+        for parallel in [False, True]:
+            sampler = MAMLSampler(VaryingInfoEnv(), self.test_policy, 2, 2, 3, parallel=parallel)
+            sampler.update_tasks()
+            for task in sampler.obtain_samples().values():
+                for path in task:
+                    env_infos = path['env_infos']
+                    self.assertTrue(np.issubdtype(env_infos['t'].dtype, np.integer))
+                    self.assertEqual(list(env_infos['name']), ['step'] * 3)
+                    for t, even in zip(env_infos['t'], env_infos['even']):
+                        if t % 2 == 0:
+                            self.assertTrue(np.allclose(even, 1))
+                        else:
+                            self.assertIsNone(even)
+
+    def testPipelinedSampling(self):
+        for shared_memory in [False, True]:
+            policy = ColumnarInfoPolicy(obs_dim=1, action_dim=1)
+            sampler = MAMLSampler(self.test_env, policy, 2 * self.batch_size, self.meta_batch_size,
+                                  self.path_length, envs_per_task=self.batch_size, parallel=True,
+                                  shared_memory=shared_memory, pipelined=True)
+            tasks = [10, 20, 30]
+            sampler.set_tasks(tasks)
+            for _ in range(2):
+                paths = sampler.obtain_samples()
+                for task, task_paths in zip(tasks, paths.values()):
+                    self.assertEqual(len(task_paths), 2 * self.batch_size)
+                    for path in task_paths:
+                        self.assertEqual(len(path['rewards']), self.path_length)
+                        self.assertTrue(np.allclose(path['rewards'], task_paths[0]['rewards']))
+                        self.assertTrue(np.allclose(path['agent_infos']['mean'], path['observations'] / 100))
+                        self.assertTrue(np.allclose(path['observations'][1], 100 * task + task))
+
+    def testColumnarAgentInfos(self):
+        all_paths = []
+        for columnar_agent_infos in [False, True]:
+            policy = ColumnarInfoPolicy(obs_dim=1, action_dim=1)
+            policy.columnar_agent_infos = columnar_agent_infos
+            np.random.seed(22)
+            sampler = MAMLSampler(self.test_env, policy, self.batch_size, self.meta_batch_size,
+                                  self.path_length, envs_per_task=2, parallel=False)
+            sampler.update_tasks()
+            all_paths.append(sampler.obtain_samples())
+
+        for idx, (task1, task2) in enumerate(zip(all_paths[0].values(), all_paths[1].values())):
+            self.assertEqual(len(task1), len(task2))
+            for path1, path2 in zip(task1, task2):
+                self.assertEqual(path2['agent_infos']['mean'].shape, (self.path_length, 1))
+                self.assertEqual(path2['agent_infos']['log_std'].shape, (self.path_length, 1))
+                self.assertTrue(np.allclose(path2['agent_infos']['log_std'], idx))
+                for key in ['mean', 'log_std']:
+                    self.assertTrue(np.allclose(path1['agent_infos'][key], path2['agent_infos'][key]))
+
+    def testSharedMemoryMatchesPipes(self):
+        all_paths = []
+        for shared_memory in [False, True]:
+            np.random.seed(22)
+            sampler = MAMLSampler(self.random_env, self.random_policy, self.batch_size, self.meta_batch_size,
+                                  self.path_length, parallel=True, shared_memory=shared_memory)
+            sampler.update_tasks()
+            all_paths.append(sampler.obtain_samples())
+
+        for task1, task2 in zip(all_paths[0].values(), all_paths[1].values()):
+            for path1, path2 in zip(task1, task2):
+                self.assertTrue(np.allclose(path1['observations'], path2['observations']))
+                self.assertTrue(np.allclose(path1['rewards'], path2['rewards']))
+                self.assertTrue(np.allclose(path1['env_infos']['e'], path2['env_infos']['e']))
+
     def testMAMLSampleProcessor(self):
         for sampler in [self.it_sampler, self.par_sampler]:
             sampler.update_tasks()
@@ -188,6 +330,176 @@ class TestSampler(unittest.TestCase):
                 self.assertEqual(len(samples_data.keys()), 7)
                 self.assertEqual(samples_data['advantages'].size, self.path_length*self.batch_size)
 
+    def testMetaBatchAdvantages(self):
+        random_sampler = MAMLSampler(self.random_env, self.random_policy, self.batch_size, self.meta_batch_size,
+                                     self.path_length, parallel=False)
+        random_sampler.update_tasks()
+        paths_meta_batch = random_sampler.obtain_samples()
+        for batched_task_baselines, vectorized_advantages in [(True, False), (False, True), (True, True)]:
+            sample_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline(), gae_lambda=0.95,
+                                                   batched_task_baselines=batched_task_baselines,
+                                                   vectorized_advantages=vectorized_advantages)
+            reference_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline(), gae_lambda=0.95)
+            samples_data_meta_batch = reference_processor.process_samples(copy.deepcopy(paths_meta_batch))
+            other_samples_data_meta_batch = sample_processor.process_samples(copy.deepcopy(paths_meta_batch))
+            for samples_data, other_samples_data in zip(samples_data_meta_batch, other_samples_data_meta_batch):
+                for key in ['returns', 'advantages', 'adj_avg_rewards']:
+                    self.assertTrue(np.allclose(samples_data[key], other_samples_data[key], rtol=1e-4, atol=1e-4))
+
+    def testFloat32Samples(self):
+        float32_sampler = MAMLSampler(self.random_env, self.random_policy, self.batch_size, self.meta_batch_size,
+                                      self.path_length, parallel=False, dtype=np.float32)
+        float32_sampler.update_tasks()
+        paths_meta_batch = float32_sampler.obtain_samples()
+        samples_data_meta_batch = self.maml_sample_processor.process_samples(copy.deepcopy(paths_meta_batch))
+        for vectorized_advantages in [False, True]:
+            sample_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline(), dtype=np.float32,
+                                                   vectorized_advantages=vectorized_advantages)
+            float32_samples_data_meta_batch = sample_processor.process_samples(copy.deepcopy(paths_meta_batch))
+            for samples_data, float32_samples_data in zip(samples_data_meta_batch, float32_samples_data_meta_batch):
+                for key in ['observations', 'actions', 'rewards', 'returns', 'advantages', 'adj_avg_rewards']:
+                    self.assertEqual(float32_samples_data[key].dtype, np.float32)
+                    self.assertTrue(np.allclose(samples_data[key], float32_samples_data[key], rtol=1e-3, atol=1e-3))
+
+    def testExactTaskBudget(self):
+        quota = self.batch_size * self.path_length
+        for kwargs in [dict(parallel=False), dict(parallel=True), dict(parallel=True, shared_memory=True)]:
+            for truncate_paths in [False, True]:
+                sampler = MAMLSampler(EarlyDoneEnv(), self.random_policy, self.batch_size, self.meta_batch_size,
+                                      self.path_length, exact_task_budget=True, truncate_paths=truncate_paths,
+                                      **kwargs)
+                sampler.update_tasks()
+                paths_meta_batch = sampler.obtain_samples()
+                for paths in paths_meta_batch.values():
+                    task_samples = sum([len(path['rewards']) for path in paths])
+                    if truncate_paths:
+                        self.assertEqual(task_samples, quota)
+                    else:
+                        self.assertGreaterEqual(task_samples, quota)
+                        self.assertLess(task_samples, quota + self.batch_size * self.path_length)
+                    for path in paths:
+                        self.assertEqual(len(path['agent_infos']['a']), len(path['rewards']))
+                        # the observations are state * 100 + goal -> the steps of the path belong to one env
+                        goals = path['observations'][1:] - path['env_infos']['e'][:-1] * 100
+                        self.assertTrue(np.allclose(goals, goals[:1]))
+
+    def testStreamedTaskProcessing(self):
+        random_sampler = MAMLSampler(self.random_env, self.random_policy, self.batch_size, self.meta_batch_size,
+                                     self.path_length, parallel=False)
+        random_sampler.update_tasks()
+        streamed_paths, task_futures = dict(), dict()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            def task_callback(task, paths):
+                streamed_paths[task] = copy.deepcopy(paths)
+                task_futures[task] = pool.submit(self.maml_sample_processor.process_task_samples, paths)
+            paths_meta_batch = random_sampler.obtain_samples(task_callback=task_callback)
+            tasks_samples_data = [task_futures[task].result() for task in sorted(task_futures)]
+        self.assertEqual(sorted(streamed_paths.keys()), list(range(self.meta_batch_size)))
+
+        for task, paths in paths_meta_batch.items():
+            self.assertEqual(len(paths), len(streamed_paths[task]))
+            for path, streamed_path in zip(paths, streamed_paths[task]):
+                self.assertTrue(np.array_equal(path['rewards'], streamed_path['rewards']))
+
+        samples_data_meta_batch = self.maml_sample_processor.merge_task_samples(tasks_samples_data)
+        reference_processor = MAMLSampleProcessor(baseline=LinearFeatureBaseline())
+        reference_samples_data_meta_batch = reference_processor.process_samples(copy.deepcopy(paths_meta_batch))
+        for samples_data, reference_samples_data in zip(samples_data_meta_batch, reference_samples_data_meta_batch):
+            for key in ['observations', 'returns', 'advantages', 'adj_avg_rewards']:
+                self.assertTrue(np.allclose(samples_data[key], reference_samples_data[key]))
+
+    def testPaddedAdvantages(self):
+        path_lengths = [5, 3, 1, 4]
+        rewards = [np.random.normal(size=(path_length,)) for path_length in path_lengths]
+        baselines = [np.random.normal(size=(path_length,)) for path_length in path_lengths]
+        padded_rewards, padded_baselines = utils.pad_and_stack(rewards), utils.pad_and_stack(baselines)
+        mask = utils.pad_and_stack([np.ones(path_length) for path_length in path_lengths])
+        padded_returns = utils.discount_cumsum_padded(padded_rewards, 0.9)
+        padded_advantages = utils.gae_padded(padded_rewards, padded_baselines, mask, 0.9, 0.8)
+        for i, path_length in enumerate(path_lengths):
+            path_baselines = np.append(baselines[i], 0)
+            deltas = rewards[i] + 0.9 * path_baselines[1:] - path_baselines[:-1]
+            self.assertTrue(np.allclose(padded_returns[i, :path_length], utils.discount_cumsum(rewards[i], 0.9),
+                                        atol=1e-5))
+            self.assertTrue(np.allclose(padded_advantages[i, :path_length], utils.discount_cumsum(deltas, 0.72),
+                                        atol=1e-5))
+            self.assertTrue(np.all(padded_advantages[i, path_length:] == 0))
+
+class TestRolloutBuffer(unittest.TestCase):
+
+    def testPopPath(self):
+        num_envs, max_path_length = 3, 4
+        buffer = RolloutBuffer(num_envs, max_path_length)
+        for t in range(3):
+            buffer.add(observations=np.ones((num_envs, 2)) * t,
+                       actions=np.ones((num_envs, 1)) * -t,
+                       rewards=np.arange(num_envs) + t,
+                       dones=np.array([False, t == 1, False]),
+                       env_infos={'e': np.ones(num_envs) * t},
+                       agent_infos={},
+                       )
+            if t == 1:
+                path = buffer.pop_path(1)
+                self.assertEqual(path['observations'].shape, (2, 2))
+                self.assertTrue(np.allclose(path['rewards'], [1, 2]))
+                self.assertTrue(np.allclose(path['env_infos']['e'], [0, 1]))
+                self.assertEqual(path['agent_infos'], {})
+
+        path = buffer.pop_path(1)
+        self.assertEqual(len(path['rewards']), 1)
+        self.assertTrue(np.allclose(path['observations'], 2))
+
+        path = buffer.pop_path(0)
+        self.assertEqual(len(path['rewards']), 3)
+        self.assertTrue(np.allclose(path['actions'][:, 0], [0, -1, -2]))
+        self.assertEqual(path['dones'].dtype, np.bool_)
+
+    def testVaryingInfos(self):
+        num_envs, max_path_length = 2, 4
+        buffer = RolloutBuffer(num_envs, max_path_length)
+        env_infos = [{'e': np.ones(num_envs), 'n': np.arange(num_envs)},
+                     {'n': np.arange(num_envs), 's': np.array(['a', 'b'])},
+                     {'e': np.ones(num_envs), 'n': np.ones(num_envs) / 2, 's': np.array(['c', 'd'])}]
+        for t, step_infos in enumerate(env_infos):
+            buffer.add(observations=np.ones((num_envs, 2)),
+                       actions=np.ones((num_envs, 1)),
+                       rewards=np.zeros(num_envs),
+                       dones=np.zeros(num_envs, dtype=bool),
+                       env_infos=step_infos,
+                       agent_infos={},
+                       )
+            if t == 0:
+                self.assertTrue(np.issubdtype(buffer._data['env_infos']['n'].dtype, np.integer))
+
+        path = buffer.pop_path(1)['env_infos']
+        self.assertEqual(list(path['e']), [1, None, 1])
+        self.assertTrue(np.allclose(path['n'], [1, 1, 0.5]))
+        self.assertEqual(list(path['s']), [None, 'b', 'd'])
+
+    def testPopPaddedPaths(self):
+        num_envs, max_path_length = 3, 4
+        buffer = RolloutBuffer(num_envs, max_path_length)
+        for t in range(3):
+            buffer.add(observations=np.ones((num_envs, 2)) * (t + 1),
+                       actions=np.ones((num_envs, 1)),
+                       rewards=np.arange(num_envs) + t,
+                       dones=np.array([False, t == 1, False]),
+                       env_infos={'e': np.ones(num_envs)},
+                       agent_infos={},
+                       )
+            if t == 1:
+                padded_paths = buffer.pop_padded_paths(np.array([1]))
+                self.assertEqual(padded_paths['observations'].shape, (1, max_path_length, 2))
+                self.assertTrue(np.allclose(padded_paths['mask'], [[1, 1, 0, 0]]))
+
+        # the steps of the popped path must not leak into the padding of the next path of its slot
+        padded_paths = buffer.pop_padded_paths(np.array([0, 1]))
+        self.assertTrue(np.allclose(padded_paths['mask'], [[1, 1, 1, 0], [1, 0, 0, 0]]))
+        self.assertTrue(np.allclose(padded_paths['observations'][1, :, 0], [3, 0, 0, 0]))
+        self.assertTrue(np.allclose(padded_paths['rewards'], [[0, 1, 2, 0], [3, 0, 0, 0]]))
+        self.assertTrue(np.allclose(padded_paths['env_infos']['e'], padded_paths['mask']))
+
+
 class TestDiceSampleProcessor(unittest.TestCase):
 
     def setUp(self):
@@ -235,7 +547,42 @@ class TestDiceSampleProcessor(unittest.TestCase):
         self.assertAlmostEqual(samples_data['mask'][2][5], 0)
         self.assertAlmostEqual(samples_data['mask'][2][2], 1)
         self.assertAlmostEqual(samples_data['env_infos']['e'][0][5], 0)
-        self.assertAlmostEqual(samples_data['env_infos']['e'][2][0], -5)
+        self.assertAlmostEqual(samples_data['env_infos']['e'][2][0], -1)
+
+    def test_padded_sampler_output(self):
+        padded_sampler = MAMLSampler(self.test_env, self.test_policy, self.batch_size, self.meta_batch_size,
+                                     self.path_length, parallel=False, padded_output=True)
+        padded_paths_meta_batch = padded_sampler.obtain_samples()
+        self.assertEqual(len(padded_paths_meta_batch), self.meta_batch_size)
+        for task, padded_paths in padded_paths_meta_batch.items():
+            paths = self.paths[task]
+            self.assertEqual(padded_paths['mask'].shape, (len(paths), self.path_length))
+            for i, path in enumerate(paths):
+                path_length = len(path['rewards'])
+                self.assertTrue(np.all(padded_paths['mask'][i, :path_length] == 1))
+                self.assertTrue(np.allclose(padded_paths['observations'][i, :path_length], path['observations']))
+                self.assertTrue(np.allclose(padded_paths['rewards'][i, :path_length], path['rewards']))
+                self.assertTrue(np.allclose(padded_paths['env_infos']['e'][i, :path_length], path['env_infos']['e']))
+
+    def test_padded_paths(self):
+        padded_paths_meta_batch = dict()
+        for task, paths in self.paths_rand.items():
+            padded_paths_meta_batch[task] = dict(
+                mask=utils.pad_and_stack([np.ones(len(path['rewards'])) for path in paths], self.path_length),
+                env_infos=dict(),
+                agent_infos=dict(),
+                **dict([(key, utils.pad_and_stack([path[key] for path in paths], self.path_length))
+                        for key in ['observations', 'actions', 'rewards']]))
+
+        all_samples_data = []
+        for paths_meta_batch in [self.paths_rand, padded_paths_meta_batch]:
+            sample_processor = DiceMAMLSampleProcessor(LinearTimeBaseline(), max_path_length=self.path_length,
+                                                       gae_lambda=0.9, return_baseline=LinearFeatureBaseline())
+            all_samples_data.append(sample_processor.process_samples(paths_meta_batch))
+
+        for samples_data, padded_samples_data in zip(*all_samples_data):
+            for key in ['mask', 'observations', 'rewards', 'adjusted_rewards', 'advantages', 'adj_avg_rewards']:
+                self.assertTrue(np.allclose(samples_data[key], padded_samples_data[key], rtol=1e-4, atol=1e-4))
 
     def test_dice_maml_processor(self):
         maml_sample_processor = DiceMAMLSampleProcessor(self.baseline, max_path_length=6)
@@ -248,7 +595,7 @@ class TestDiceSampleProcessor(unittest.TestCase):
             self.assertAlmostEqual(samples_data['mask'][2][5], 0)
             self.assertAlmostEqual(samples_data['mask'][2][2], 1)
             self.assertAlmostEqual(samples_data['env_infos']['e'][0][5], 0)
-            self.assertAlmostEqual(samples_data['env_infos']['e'][2][0], -5)
+            self.assertAlmostEqual(samples_data['env_infos']['e'][2][0], -1)
 
     def test_process_samples_advantages1(self):
         return_baseline = LinearFeatureBaseline()